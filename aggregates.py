@@ -0,0 +1,236 @@
+import re
+import weakref
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from preprocessor import media_mask
+from rollup import build_rollup
+from telemetry import instrument
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # ✅ Without pyarrow, messages are scanned as joined Python string batches
+    pa = None
+
+# ✅ Single-pass aggregate engine.
+# compute_aggregates tokenizes every message exactly once and fills all the
+# counters the analytics page needs; helper.py and emoji_analysis.py read from
+# the result instead of walking the message column again.
+STOP_WORDS_FILE = "stop_words.txt"
+BATCH_SIZE = 10_000  # messages joined per tokenization batch (Python fallback)
+ARROW_BATCH = 200_000  # messages per Arrow kernel call; bounds the lower-cased and split copies
+AGGREGATES_VERSION = 2  # bump when ChatAggregates gains/changes fields (invalidates stored incremental states)
+MAX_USER_WORDS = 8  # per-user word counters remembered per chat (word cloud user filter)
+
+_LINK = re.compile(r"http\S+")
+_ASCII_RUN = re.compile(r"[\x00-\x7f]+")
+_emoji_pattern = None
+_stop_words = None
+_cache = {}
+_user_words = {}
+
+
+def load_stop_words(path=STOP_WORDS_FILE):
+    """Loads stop words once per process (empty if the file is missing)."""
+    global _stop_words
+    if _stop_words is None:
+        try:
+            with open(path, encoding="utf-8") as file:
+                _stop_words = frozenset(file.read().split())
+        except FileNotFoundError:
+            _stop_words = frozenset()
+    return _stop_words
+
+
+def emoji_pattern():
+    """Compiles one character class of every single-codepoint emoji, matching `char in emoji.EMOJI_DATA`."""
+    global _emoji_pattern
+    if _emoji_pattern is None:
+        import emoji
+
+        # Collapse consecutive code points into ranges; sre scans long literal sets linearly
+        points = sorted(ord(e) for e in emoji.EMOJI_DATA if len(e) == 1)
+        ranges = []
+        for point in points:
+            if ranges and point == ranges[-1][1] + 1:
+                ranges[-1][1] = point
+            else:
+                ranges.append([point, point])
+        charset = "".join(
+            re.escape(chr(low)) if low == high else f"{re.escape(chr(low))}-{re.escape(chr(high))}"
+            for low, high in ranges
+        )
+        _emoji_pattern = re.compile(f"[{charset}]")
+    return _emoji_pattern
+
+
+class ChatAggregates:
+    """Counters for one chat, filled by a single scan over its messages."""
+
+    def __init__(self):
+        self.num_messages = 0
+        self.num_words = 0
+        self.num_media = 0
+        self.num_links = 0
+        self.word_freq = Counter()      # lower-cased, stop-word filtered, len > 2
+        self.emoji_freq = Counter()
+        self.hour_counts = np.zeros(24, dtype=np.int64)
+        self.month_counts = np.zeros(12, dtype=np.int64)  # index 0 = January
+        self.user_counts = pd.Series(dtype="int64", name="count")
+        self.rollup = None              # rollup.ChatRollup: user x year-month x weekday x hour counters
+
+    def merge(self, other):
+        """Adds the counts of `other` (e.g. the aggregates of newly appended messages) into these."""
+        self.num_messages += other.num_messages
+        self.num_words += other.num_words
+        self.num_media += other.num_media
+        self.num_links += other.num_links
+        self.word_freq.update(other.word_freq)
+        self.emoji_freq.update(other.emoji_freq)
+        self.hour_counts = self.hour_counts + other.hour_counts
+        self.month_counts = self.month_counts + other.month_counts
+        self.user_counts = (
+            self.user_counts.add(other.user_counts, fill_value=0).astype("int64").sort_values(ascending=False)
+        )
+        self.user_counts.index.name = "user"
+        if self.rollup is not None and other.rollup is not None:
+            self.rollup = self.rollup.merge(other.rollup)
+        return self
+
+
+def _scan_arrow(messages):
+    """_scan_messages over the column's Arrow buffers: lower-casing, splitting and counting run as
+    Arrow kernels, and only the distinct words of each batch become Python strings."""
+    column = pa.array(messages, from_pandas=True)  # zero-copy for pandas' Arrow-backed strings
+    if isinstance(column, pa.Array):
+        column = pa.chunked_array([column])
+    raw_word_freq = Counter()
+    word_counts = np.zeros(len(column), dtype=np.int64)
+    num_links = 0
+    for start in range(0, len(column), ARROW_BATCH):
+        batch = column.slice(start, ARROW_BATCH)  # missing messages stay null and count as empty
+        words = pc.utf8_split_whitespace(pc.utf8_lower(batch))
+        word_counts[start:start + len(batch)] = pc.list_value_length(words).fill_null(0).to_numpy()
+        counts = pc.value_counts(pc.list_flatten(words))
+        raw_word_freq.update(dict(zip(counts.field("values").to_pylist(), counts.field("counts").to_pylist())))
+        num_links += pc.sum(pc.count_substring_regex(batch, _LINK.pattern)).as_py() or 0
+    return word_counts, raw_word_freq, num_links
+
+
+def _scan_messages(messages, emoji_freq=None):
+    """One pass over a Series of messages; returns (words per row, raw lower-cased word Counter, links).
+
+    With pyarrow the column is read in place (_scan_arrow). Otherwise, and when
+    emojis must be counted into `emoji_freq` too, messages are processed in
+    batches joined by newlines (parsed messages never contain one), so
+    splitting, counting and regex scans run in C over a whole batch at once.
+    """
+    if pa is not None and emoji_freq is None:
+        return _scan_arrow(messages)
+
+    raw_word_freq = Counter()
+    messages = messages.fillna("").astype(str)  # missing messages count as empty, keeping rows aligned
+    word_counts = np.zeros(len(messages), dtype=np.int64)
+    num_links = 0
+    for start in range(0, len(messages), BATCH_SIZE):
+        batch = messages.iloc[start:start + BATCH_SIZE].tolist()  # iterating the Arrow column itself is slow
+        text = "\n".join(batch)
+        raw_word_freq.update(text.lower().split())
+        word_counts[start:start + len(batch)] = np.fromiter(map(len, map(str.split, batch)), np.int64, len(batch))
+        if "http" in text:
+            num_links += len(_LINK.findall(text))
+        if emoji_freq is not None and not text.isascii():
+            # Drop ASCII runs first so the emoji class only scans the few non-ASCII characters
+            emoji_freq.update(emoji_pattern().findall(_ASCII_RUN.sub("", text)))
+    return word_counts, raw_word_freq, num_links
+
+
+def _filter_words(raw_word_freq):
+    """Word filtering is applied to the distinct words: stop words and words of 1-2 characters are dropped."""
+    stop_words = load_stop_words()
+    return Counter({word: count for word, count in raw_word_freq.items() if len(word) > 2 and word not in stop_words})
+
+
+@instrument("compute_aggregates")
+def compute_aggregates(df):
+    """Fills a ChatAggregates from a parsed chat in one pass over the message column."""
+    agg = ChatAggregates()
+    if df.empty or "message" not in df.columns:
+        return agg
+
+    has_emoji_flags = "emoji_count" in df.columns
+    word_counts, raw_word_freq, agg.num_links = _scan_messages(
+        df["message"], emoji_freq=None if has_emoji_flags else agg.emoji_freq)  # word_counts: per row, for the rollup
+    agg.num_words = int(word_counts.sum())
+    agg.num_media = int(media_mask(df).sum())
+    if has_emoji_flags:
+        # The parser's emoji_count flag says which rows have any; only those become Python strings
+        with_emoji = df["message"][df["emoji_count"].to_numpy() > 0].dropna()
+        agg.emoji_freq.update(emoji_pattern().findall(_ASCII_RUN.sub("", "\n".join(with_emoji.tolist()))))
+    agg.word_freq = _filter_words(raw_word_freq)
+
+    agg.num_messages = df.shape[0]
+
+    # ✅ Hour and month histograms are marginals of the rollup cube (month = calendar month, all years)
+    agg.rollup = build_rollup(df, word_counts)
+    if "date" in df.columns:
+        agg.hour_counts = agg.rollup.hourly().astype(np.int64)
+        agg.month_counts = agg.rollup.month_of_year()
+    if "user" in df.columns:
+        counts = df["user"].value_counts()
+        if isinstance(counts.index, pd.CategoricalIndex):
+            counts = counts[counts > 0]  # categorical users count every category, even absent ones
+            counts.index = pd.Index(counts.index.astype(str), name="user")
+        agg.user_counts = counts
+
+    return agg
+
+
+def remember(df, agg):
+    """Registers already known aggregates of `df` (e.g. merged incrementally) so get_aggregates reuses them."""
+    key = id(df)
+    _cache[key] = (weakref.ref(df, lambda _, key=key: _cache.pop(key, None)), len(df), agg)
+
+
+def get_aggregates(df):
+    """Returns the aggregates of `df`, computing them at most once per frame.
+
+    Results are remembered per frame object (and dropped when it is garbage
+    collected); a change in row count is treated as a different chat.
+    """
+    key = id(df)
+    entry = _cache.get(key)
+    if entry is not None:
+        ref, rows, agg = entry
+        if ref() is df and rows == len(df):
+            return agg
+
+    agg = compute_aggregates(df)
+    remember(df, agg)
+    return agg
+
+
+def user_word_freq(df, user):
+    """Word frequencies of one user's messages, counted at most once per (frame, user).
+
+    Only the words of that user's rows are counted (no rollup or other
+    counters); the last MAX_USER_WORDS users asked for are remembered per frame.
+    """
+    key = id(df)
+    entry = _user_words.get(key)
+    if entry is None or entry[0]() is not df or entry[1] != len(df):
+        entry = (weakref.ref(df, lambda _, key=key: _user_words.pop(key, None)), len(df), OrderedDict())
+        _user_words[key] = entry
+    counters = entry[2]
+    if user in counters:
+        counters.move_to_end(user)
+        return counters[user]
+
+    _, raw_word_freq, _ = _scan_messages(df.loc[(df["user"] == user).to_numpy(), "message"])
+    counters[user] = _filter_words(raw_word_freq)
+    while len(counters) > MAX_USER_WORDS:
+        counters.popitem(last=False)
+    return counters[user]
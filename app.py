@@ -1,13 +1,20 @@
 import streamlit as st
-import pandas as pd
-import preprocessor
-import helper
-import sentiment_analysis
-import emoji_analysis
-import summarizer
-import hate_speech  # Import Hate Speech Detection
-import fake_message_detector  # Import Fake Message Detection
-import chatbot  # Import Chatbot for Q&A
+import telemetry
+from lazy_import import lazy_module
+from scheduler import AnalysisScheduler, Stage, StageSkipped
+
+# ✅ Heavy analysis modules load on first use, so the page is interactive before anything is uploaded
+pd = lazy_module("pandas")
+incremental = lazy_module("incremental")
+result_cache = lazy_module("result_cache")
+helper = lazy_module("helper")
+sentiment_analysis = lazy_module("sentiment_analysis")
+emoji_analysis = lazy_module("emoji_analysis")
+summarizer = lazy_module("summarizer")
+chatbot = lazy_module("chatbot")  # Import Chatbot for Q&A
+aggregates = lazy_module("aggregates")
+near_duplicates = lazy_module("near_duplicates")
+chat_viewer = lazy_module("chat_viewer")
 
 # Streamlit Page Config - MUST BE FIRST
 st.set_page_config(page_title="WhatsApp Chat Analyzer", layout="wide")
@@ -30,124 +37,385 @@ st.markdown(
 )
 st.markdown("<h3 style='text-align: center;'>📊 Unlock insights from your chats!</h3>", unsafe_allow_html=True)
 
+# Sections are computed lazily: only the selected one runs on a rerun
+SECTIONS = [
+    "📊 Overview",
+    "☁️ Words & Topics",
+    "⏰ Activity",
+    "😊 Sentiment & Emoji",
+    "📝 Summary",
+    "🚨 Moderation",
+    "🤖 Chatbot",
+    "📋 Full Report",
+]
+TELEMETRY_COLUMNS = ["calls", "wall_seconds", "cpu_seconds", "max_wall_seconds", "rows", "peak_rss_delta_mb",
+                     "llm_requests", "llm_retries", "llm_reasks", "llm_prompt_tokens", "llm_output_tokens", "llm_cache_hits", "errors"]
+MAX_FLAGS_SHOWN = 50  # the local moderation engine can flag many messages on large chats
+MAX_FORWARDS_SHOWN = 20
+LLM_TIMEOUT = 600     # seconds; summary and moderation may chunk a large chat into many requests
+
+
+def cached(analysis, compute, **params):
+    """Runs an analysis through the session result cache and shows whether it was a hit."""
+    result, hit = result_cache.get_or_compute(st.session_state, upload_hash, analysis, compute, **params)
+    st.caption("⚡ Cached result" if hit else "🔄 Freshly computed")
+
+    # ✅ Don't keep failed LLM calls around, so the next rerun retries them
+    status = result[0] if isinstance(result, tuple) else result
+    if isinstance(status, str) and status.startswith("❌"):
+        result_cache.discard(st.session_state, upload_hash, analysis, **params)
+    return result
+
+
+# ✅ Renderers shared by the single sections and the full report
+def render_chat_viewer(df):
+    """Pages through the parsed chat: only the visible rows are sent to the browser."""
+    view = chat_viewer.get_view(df)
+    col1, col2, col3, col4 = st.columns([2, 2, 3, 1])
+    with col1:
+        viewer_user = st.selectbox("👤 From", ["Everyone"] + view.users, key="viewer_user")
+    with col2:
+        date_range = st.date_input("📅 Between", value=(df["date"].min().date(), df["date"].max().date()), key="viewer_dates")
+    with col3:
+        query = st.text_input("🔎 Search messages", key="viewer_query")
+    with col4:
+        use_regex = st.checkbox("Regex", key="viewer_regex")
+
+    start, end = (date_range[0], date_range[-1]) if date_range else (None, None)
+    try:
+        rows = view.filter(
+            user=None if viewer_user == "Everyone" else viewer_user,
+            start=start and pd.Timestamp(start), end=end and pd.Timestamp(end) + pd.Timedelta(days=1),
+            query=query, regex=use_regex,
+        )
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        page_size = st.selectbox("Rows per page", chat_viewer.PAGE_SIZES, key="viewer_page_size")
+    pages = chat_viewer.page_count(rows, page_size)
+    if st.session_state.get("viewer_page", 1) > pages:
+        st.session_state["viewer_page"] = pages  # a narrower filter or bigger pages left fewer pages
+    with col2:
+        page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, key="viewer_page")
+    first = (page - 1) * page_size
+    st.caption(f"Messages {min(first + 1, len(rows)):,}–{min(first + page_size, len(rows)):,} of {len(rows):,}")
+    st.dataframe(view.page(rows, page - 1, page_size))
+
+
+def render_stats(stats):
+    st.header("📊 Chat Statistics")
+    num_messages, num_words, num_media, num_links = stats
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("📝 Total Messages", num_messages)
+    col2.metric("🔤 Total Words", num_words)
+    col3.metric("📷 Media Shared", num_media)
+    col4.metric("🔗 Links Shared", num_links)
+
+
+def render_active_users(result):
+    st.header("🏆 Most Active Users")
+    user_stats, user_percentages = result
+    if not user_stats.empty:
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            st.bar_chart(user_stats)
+        with col2:
+            st.dataframe(user_percentages)
+
+
+def render_wordcloud(wc):
+    st.header("☁️ Word Cloud")
+    if wc is not None:
+        st.image(wc, caption="Most Used Words", use_container_width=True, width=400)
+
+
+def render_common_words(common_words_df):
+    st.header("📝 Common Topics")
+    st.table(common_words_df)
+
+
+def render_chart(image):
+    # Charts arrive as PNG bytes rendered (and cached) by charts.py
+    if image:
+        st.image(image, use_container_width=True)
+
+
+def render_summary(summary):
+    st.header("📝 Chat Summary")
+    if "❌ Error" in summary:
+        st.error(summary)
+    else:
+        st.write(f"✍️ **Summary:** {summary}")
+
+
+def render_hate_speech(result):
+    st.header("🚨 Hate Speech Detection")
+    hate_speech_result, hate_messages = result
+    if hate_messages:
+        st.error(f"⚠️ Hate Speech Found in {len(hate_messages)} Messages:")
+        for user, msg in hate_messages[:MAX_FLAGS_SHOWN]:
+            st.write(f"❌ **{user}:** {msg}")
+    else:
+        st.success(hate_speech_result)
+
+
+def render_fake_messages(result):
+    st.header("🔍 Fake Message Detection")
+    fake_result, fake_messages, fake_percentage = result
+    if fake_messages:
+        st.error(f"⚠️ Fake Messages Found ({fake_percentage:.2f}% of messages are fake)")
+        for entry in fake_messages[:MAX_FLAGS_SHOWN]:
+            if ":" in entry:
+                sender, message = entry.split(":", 1)
+                st.write(f"❌ **{sender.strip()}:** {message.strip()}")
+            else:
+                st.write(f"❌ {entry}")
+    else:
+        st.success(fake_result)
+
+
+def render_forwards(forwards):
+    st.header("🔁 Forwarded Messages")
+    if forwards.empty:
+        st.info("No message was sent more than once.")
+        return
+    st.write(f"{len(forwards)} messages (or lightly edited copies) were sent more than once. "
+             "First sender and date are the earliest seen across uploads.")
+    st.dataframe(forwards.head(MAX_FORWARDS_SHOWN))
+
+
+def report_stages(chat_state):
+    """The full report as scheduler stages; (stage, renderer, cache params) per analysis.
+
+    Chart rendering shares one lock: matplotlib is not thread-safe. Sentiment
+    and moderation go through `incremental`, so a re-exported chat only has
+    its new messages analysed.
+    """
+    return [
+        (Stage("aggregates", aggregates.get_aggregates), None, {}),
+        (Stage("stats", lambda df, _: helper.fetch_stats(df), ("df", "aggregates")), render_stats, {}),
+        (Stage("active_users", lambda df, _: helper.active_users(df), ("df", "aggregates")), render_active_users, {}),
+        (Stage("wordcloud", lambda df, _: helper.create_wordcloud(df), ("df", "aggregates")), render_wordcloud,
+         {"user": None, "max_words": helper.WORDCLOUD_MAX_WORDS}),
+        (Stage("common_words", lambda df, _: helper.most_common_words(df, num_words=15), ("df", "aggregates")),
+         render_common_words, {"num_words": 15}),
+        (Stage("peak_hours", lambda df, _: helper.peak_chat_hours(df), ("df", "aggregates"), lock="matplotlib"),
+         render_chart, {"user": None, "year": None}),
+        (Stage("peak_month", lambda df, _: helper.peak_chat_month(df), ("df", "aggregates"), lock="matplotlib"),
+         render_chart, {"user": None, "year": None}),
+        (Stage("timeline", lambda df, _: helper.monthly_timeline(df), ("df", "aggregates"), lock="matplotlib"),
+         render_chart, {"user": None}),
+        (Stage("activity_heatmap", lambda df, _: helper.activity_heatmap(df), ("df", "aggregates"), lock="matplotlib"),
+         render_chart, {"user": None, "year": None}),
+        (Stage("sentiment_counts", lambda df: incremental.sentiment_counts(chat_state, df)), None, {}),
+        (Stage("sentiment_plot", sentiment_analysis.plot_sentiment_counts, ("sentiment_counts",), lock="matplotlib"),
+         render_chart, {}),
+        (Stage("emoji_pie", lambda df, _: helper.emoji_pie_chart(df), ("df", "aggregates"), lock="matplotlib"),
+         render_chart, {}),
+        (Stage("summary", summarizer.summarize_chat, timeout=LLM_TIMEOUT), render_summary, {}),
+        (Stage("hate_speech", lambda df: incremental.detect_hate_speech(chat_state, df), timeout=LLM_TIMEOUT),
+         render_hate_speech, {}),
+        (Stage("fake_messages", lambda df: incremental.detect_fake_messages(chat_state, df), timeout=LLM_TIMEOUT),
+         render_fake_messages, {}),
+        (Stage("forwards", near_duplicates.forward_stats), render_forwards, {}),
+    ]
+
+
+def render_full_report(df, chat_state):
+    """Runs every analysis at once and renders each section as soon as it is ready.
+
+    Cached results are shown immediately; only the missing ones are scheduled.
+    Widgets are written from this (the script) thread, in completion order.
+    """
+    st.header("📋 Full Report")
+    stages, slots, inputs = [], {}, {"df": df}
+    for stage, render, params in report_stages(chat_state):
+        if render is not None:
+            slots[stage.name] = st.container()
+        value = result_cache.get(st.session_state, upload_hash, stage.name, **params)
+        if value is not None:
+            inputs[stage.name] = value
+            if render is not None:
+                with slots[stage.name]:
+                    render(value)
+                    st.caption("⚡ Cached result")
+        else:
+            stages.append((stage, render, params))
+
+    if not stages:
+        return
+    progress = st.progress(0.0, text="Running analyses...")
+    scheduler = AnalysisScheduler([stage for stage, _, _ in stages])
+    st.session_state["report_scheduler"] = scheduler
+    renderers = {stage.name: (render, params) for stage, render, params in stages}
+    for done, result in enumerate(scheduler.run(inputs), start=1):
+        render, params = renderers[result.name]
+        progress.progress(done / len(stages), text=f"Finished {result.name} ({done}/{len(stages)})")
+        if result.ok:
+            status = result.value[0] if isinstance(result.value, tuple) else result.value
+            if not (isinstance(status, str) and status.startswith("❌")):
+                result_cache.put(st.session_state, upload_hash, result.name, result.value, **params)
+        if render is None:
+            continue
+        with slots[result.name]:
+            if result.ok:
+                render(result.value)
+                st.caption(f"🔄 Computed in {result.elapsed:.1f}s")
+            elif isinstance(result.error, StageSkipped):
+                st.info(f"⏭️ {result.error}")
+            else:
+                st.error(f"❌ {result.name} failed: {result.error}")
+    progress.empty()
+
+
+def render_telemetry(panel):
+    """Fills the sidebar telemetry panel with per-stage totals, exports and captured profiles."""
+    totals = telemetry.summary()
+    with panel:
+        if not totals:
+            st.caption("No stages recorded yet.")
+            return
+        table = pd.DataFrame(totals).T.sort_values("wall_seconds", ascending=False)
+        st.dataframe(table[[c for c in TELEMETRY_COLUMNS if c in table.columns]])
+        st.download_button("⬇️ JSON lines", telemetry.to_jsonl(), "telemetry.jsonl", "application/json")
+        st.download_button("⬇️ Prometheus", telemetry.to_prometheus(), "telemetry.prom", "text/plain")
+        for record in [r for r in telemetry.get_records() if r.get("profile")][-3:]:
+            with st.expander(f"🧪 {record['stage']} ({record['wall_seconds']:.2f}s)"):
+                st.code(record["profile"])
+
+
+# Telemetry panel: options are read before the analyses run, the numbers are filled in after them
+show_telemetry = st.sidebar.checkbox("📈 Show telemetry")
+# ✅ Profiling is a per-session choice: it only applies to the stages of this script run
+telemetry.set_profiling(show_telemetry and st.sidebar.checkbox("🧪 Profile stages (cProfile)", value=telemetry.PROFILE))
+telemetry_panel = st.sidebar.container()
+
+# ✅ Any rerun (another section, a new upload, a widget change) stops the previous full-report run
+previous_report = st.session_state.pop("report_scheduler", None)
+if previous_report is not None:
+    previous_report.cancel()
+
 # File Upload Section
 uploaded_file = st.file_uploader("📁 Upload a WhatsApp chat file (.txt)", type="txt")
 
 if uploaded_file is not None:
     try:
-        # Read and Preprocess Data
-        data = uploaded_file.getvalue().decode("utf-8")
-        df = preprocessor.preprocess(data)
+        upload_hash = result_cache.upload_key(st.session_state, uploaded_file)
+        result_cache.forget_other_uploads(st.session_state, upload_hash)
+
+        # Read and Preprocess Data (streamed in chunks, reused from the on-disk cache when seen before;
+        # a re-export of a chat analysed earlier only has its new messages parsed)
+        (df, chat_state, parse_mode), _ = result_cache.get_or_compute(
+            st.session_state, upload_hash, "parse",
+            lambda: incremental.load_or_parse(uploaded_file, key=upload_hash)
+        )
 
         if df.empty:
             st.warning("⚠️ No valid messages found! Check your file format and try again.")
         else:
             st.success("✅ Chat file successfully processed!")
+            if parse_mode == "extended":
+                st.info(f"♻️ Continues a chat analysed before: only the {chat_state.new_rows:,} new messages were parsed and analysed.")
+
+            stats = result_cache.cache_stats(st.session_state)
+            st.sidebar.metric("⚡ Cache hits", stats["hits"], delta=f"{stats['misses']} computed", delta_color="off")
+
+            section = st.radio("Section", SECTIONS, horizontal=True, label_visibility="collapsed")
+
+            if section == "📊 Overview":
+                render_stats(cached("stats", lambda: helper.fetch_stats(df)))
 
-            # Chat Statistics
-            st.header("📊 Chat Statistics")
-            col1, col2, col3, col4 = st.columns(4)
-            num_messages, num_words, num_media, num_links = helper.fetch_stats(df)
-            col1.metric("📝 Total Messages", num_messages)
-            col2.metric("🔤 Total Words", num_words)
-            col3.metric("📷 Media Shared", num_media)
-            col4.metric("🔗 Links Shared", num_links)
-
-            # Show Processed Chat Data
-            if st.checkbox("🔍 Show Processed Chat Data"):
-                st.dataframe(df)
-
-            # Most Active Users
-            st.header("🏆 Most Active Users")
-            user_stats, user_percentages = helper.active_users(df)
-            if not user_stats.empty:
-                col1, col2 = st.columns([2, 1])
+                # Show Processed Chat Data
+                if st.checkbox("🔍 Show Processed Chat Data"):
+                    render_chat_viewer(df)
+
+                render_active_users(cached("active_users", lambda: helper.active_users(df)))
+
+            elif section == "☁️ Words & Topics":
+                col1, col2 = st.columns(2)
                 with col1:
-                    st.bar_chart(user_stats)
+                    cloud_user = st.selectbox("👤 Words of", ["Everyone"] + sorted(df["user"].unique().tolist()))
                 with col2:
-                    st.dataframe(user_percentages)
-
-            # Word Cloud
-            st.header("☁️ Word Cloud")
-            wc = helper.create_wordcloud(df)
-            st.image(wc, caption="Most Used Words", use_container_width=True, width=400)
-
-            # Common Topics
-            st.header("📝 Common Topics")
-            common_words_df = helper.most_common_words(df, num_words=15)
-            st.table(common_words_df)
-
-            # Peak Chat Hours & Peak Chat Month Analysis
-            st.header("⏰ Peak Chat Hours & 📅 Peak Chat Month Analysis")
-            col1, col2 = st.columns(2)
-            with col1:
-                peak_hours_fig = helper.peak_chat_hours(df)
-                if peak_hours_fig:
-                    st.pyplot(peak_hours_fig)
-            with col2:
-                peak_month_fig = helper.peak_chat_month(df)
-                if peak_month_fig:
-                    st.pyplot(peak_month_fig)
-
-            # Sentiment & Emoji Analysis
-            st.header("😊 Sentiment Analysis & 😃 Emoji Analysis (Pie Chart)")
-            col1, col2 = st.columns(2)
-            with col1:
-                sentiment_df = sentiment_analysis.analyze_sentiment(df)
-                sentiment_fig = sentiment_analysis.plot_sentiment_distribution(sentiment_df)
-                if sentiment_fig:
-                    fig_sentiment = sentiment_fig.get_figure()
-                    fig_sentiment.set_size_inches(5, 4)
-                    st.pyplot(fig_sentiment)
-            with col2:
-                emoji_pie_chart = helper.emoji_pie_chart(df)
-                if emoji_pie_chart:
-                    fig_emoji = emoji_pie_chart.get_figure()
-                    fig_emoji.set_size_inches(5, 2)
-                    st.pyplot(fig_emoji)
-
-            # Chat Summary
-            st.header("📝 Chat Summary")
-            summary = summarizer.summarize_chat(df)
-            if "❌ Error" in summary:
-                st.error(summary)
-            else:
-                st.write(f"✍️ **Summary:** {summary}")
-
-            # Hate Speech Detection
-            st.header("🚨 Hate Speech Detection")
-            hate_speech_result, hate_messages = hate_speech.detect_hate_speech(df)
-            if hate_messages:
-                st.error("⚠️ Hate Speech Found in Messages:")
-                for user, msg in hate_messages:
-                    st.write(f"❌ **{user}:** {msg}")
-            else:
-                st.success(hate_speech_result)
-
-            # Fake Message Detection
-            st.header("🔍 Fake Message Detection")
-            fake_result, fake_messages, fake_percentage = fake_message_detector.detect_fake_messages(df)
-            if fake_messages:
-                st.error(f"⚠️ Fake Messages Found ({fake_percentage:.2f}% of messages are fake)")
-                for entry in fake_messages:
-                    if ":" in entry:
-                        sender, message = entry.split(":", 1)
-                        st.write(f"❌ **{sender.strip()}:** {message.strip()}")
+                    max_words = st.slider("🔢 Words in the cloud", 25, 500, helper.WORDCLOUD_MAX_WORDS, step=25)
+                render_wordcloud(cached(
+                    "wordcloud",
+                    lambda user, max_words: helper.create_wordcloud(df, user=user, max_words=max_words),
+                    user=None if cloud_user == "Everyone" else cloud_user, max_words=max_words,
+                ))
+                render_common_words(cached("common_words", lambda num_words: helper.most_common_words(df, num_words=num_words), num_words=15))
+
+            elif section == "⏰ Activity":
+                # Peak Chat Hours & Peak Chat Month Analysis
+                st.header("⏰ Peak Chat Hours & 📅 Peak Chat Month Analysis")
+                cube = aggregates.get_aggregates(df).rollup  # every chart below is a slice of it
+                col1, col2 = st.columns(2)
+                with col1:
+                    activity_user = st.selectbox("👤 Activity of", ["Everyone"] + sorted(cube.users))
+                with col2:
+                    activity_year = st.selectbox("📅 Year", ["All years"] + cube.years)
+                params = {"user": None if activity_user == "Everyone" else activity_user,
+                          "year": None if activity_year == "All years" else activity_year}
+                col1, col2 = st.columns(2)
+                with col1:
+                    render_chart(cached("peak_hours", lambda user, year: helper.peak_chat_hours(df, user, year), **params))
+                with col2:
+                    render_chart(cached("peak_month", lambda user, year: helper.peak_chat_month(df, user, year), **params))
+                render_chart(cached("activity_heatmap", lambda user, year: helper.activity_heatmap(df, user, year), **params))
+                render_chart(cached("timeline", lambda user: helper.monthly_timeline(df, user), user=params["user"]))
+                if st.checkbox("📈 Show sentiment per month"):
+                    render_chart(cached("sentiment_timeline",
+                                        lambda user, year: helper.sentiment_timeline(df, user, year), **params))
+
+            elif section == "😊 Sentiment & Emoji":
+                # Sentiment & Emoji Analysis
+                st.header("😊 Sentiment Analysis & 😃 Emoji Analysis (Pie Chart)")
+                col1, col2 = st.columns(2)
+                with col1:
+                    counts = cached("sentiment_counts", lambda: incremental.sentiment_counts(chat_state, df))
+                    render_chart(cached("sentiment_plot", lambda: sentiment_analysis.plot_sentiment_counts(counts)))
+                with col2:
+                    render_chart(cached("emoji_pie", lambda: helper.emoji_pie_chart(df)))
+
+            elif section == "📝 Summary":
+                render_summary(cached("summary", lambda: summarizer.summarize_chat(df)))
+
+            elif section == "🚨 Moderation":
+                render_hate_speech(cached("hate_speech", lambda: incremental.detect_hate_speech(chat_state, df)))
+                render_fake_messages(cached("fake_messages", lambda: incremental.detect_fake_messages(chat_state, df)))
+                render_forwards(cached("forwards", lambda: near_duplicates.forward_stats(df)))
+
+            elif section == "📋 Full Report":
+                render_full_report(df, chat_state)
+
+            elif section == "🤖 Chatbot":
+                # Chatbot Q&A
+                st.header("🤖 Chatbot - Ask Questions on Your Chat Data")
+                user_query = st.text_input("💬 Ask a question about the chat:")
+                col1, col2 = st.columns(2)
+                with col1:
+                    chat_user = st.selectbox("👤 Only messages from", ["Everyone"] + sorted(df["user"].unique().tolist()))
+                with col2:
+                    date_range = st.date_input("📅 Between", value=(df["date"].min().date(), df["date"].max().date()))
+                if st.button("🔍 Get Answer"):
+                    if user_query:
+                        start, end = (date_range[0], date_range[-1]) if date_range else (None, None)
+                        response = cached(
+                            "chatbot",
+                            lambda query, user, start, end: chatbot.answer_query(
+                                df, query, user=user, start=start, end=end and pd.Timestamp(end) + pd.Timedelta(days=1),
+                                chat_key=chat_state.key, parent_key=chat_state.parent,
+                            ),
+                            query=user_query, user=None if chat_user == "Everyone" else chat_user, start=start, end=end,
+                        )
+                        st.write(f"🤖 **Chatbot:** {response}")
                     else:
-                        st.write(f"❌ {entry}")
-            else:
-                st.success(fake_result)
-
-            # Chatbot Q&A
-            
-            st.header("🤖 Chatbot - Ask Questions on Your Chat Data")
-            user_query = st.text_input("💬 Ask a question about the chat:")
-            if st.button("🔍 Get Answer"):
-                if user_query:
-                    response = chatbot.answer_query(df, user_query)
-                    st.write(f"🤖 **Chatbot:** {response}")
-                else:
-                    st.warning("⚠️ Please enter a question to proceed.")
+                        st.warning("⚠️ Please enter a question to proceed.")
 
     except Exception as e:
         st.error(f"❌ Error processing file: {e}")
+
+if show_telemetry:
+    render_telemetry(telemetry_panel)
@@ -0,0 +1,310 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+# ✅ Headless batch analysis of many exports (e.g. a nightly job).
+#   python batch.py exports/ -o results/ --workers 4
+#   python batch.py "exports/**/*.txt" -o results/ --moderation-engine local
+# Every chat gets its own folder with result.json (stats, top words, emoji
+# counts, sentiment distribution, moderation flags) and messages.parquet, and
+# results/summary.csv combines them. Finished files are recorded in
+# results/manifest.jsonl, so an interrupted run resumes where it stopped.
+RESULTS_VERSION = 2          # bump when result.json changes; older results are recomputed
+MANIFEST = "manifest.jsonl"
+SUMMARY = "summary"
+MAX_TASKS_PER_CHILD = 25     # workers are recycled so fragmentation/leaks don't accumulate
+TOP_WORDS = 50
+TOP_EMOJIS = 20
+MAX_FLAGS_SAVED = 1_000      # flagged messages kept per chat in result.json
+
+
+def find_exports(patterns):
+    """Expands directories (searched recursively for .txt files) and glob patterns into a sorted list of paths."""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.update(glob.glob(os.path.join(pattern, "**", "*.txt"), recursive=True))
+        else:
+            paths.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {"path": path, "size": stat.st_size, "mtime": stat.st_mtime_ns, "version": RESULTS_VERSION}
+
+
+def load_manifest(out_dir):
+    """Returns {path: manifest entry} of the files already processed successfully."""
+    done = {}
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:  # a line cut short by an interrupted run
+                continue
+            if entry.get("status") == "ok":
+                done[entry["path"]] = entry
+            else:
+                done.pop(entry["path"], None)
+    return done
+
+
+def _is_done(entry, path):
+    return entry is not None and all(entry.get(k) == v for k, v in _fingerprint(path).items())
+
+
+def _write_json(path, payload):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=1, default=str)
+    os.replace(tmp_path, path)
+
+
+def _init_worker(memory_limit_mb):
+    """Caps the address space of a worker and keeps sentiment scoring in-process."""
+    import sentiment_analysis
+
+    # The batch already runs one chat per process; don't nest another pool per chat
+    sentiment_analysis.PARALLEL_THRESHOLD = float("inf")
+    if memory_limit_mb:
+        try:
+            import resource
+        except ImportError:  # not available on Windows
+            return
+        limit = memory_limit_mb * 1024 ** 2
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def analyze_file(path, out_dir, moderation_engine=None, summarize=False):
+    """Analyzes one export and writes its result folder; returns a manifest entry."""
+    import chat_cache
+    import fake_message_detector
+    import hate_speech
+    import helper
+    import preprocessor
+    import sentiment_analysis
+    from aggregates import get_aggregates
+
+    entry = _fingerprint(path)
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as f:
+            upload_hash = chat_cache.hash_upload(f)
+            f.seek(0)
+            df = preprocessor.preprocess(f)
+
+        chat_dir = os.path.join(out_dir, f"{os.path.splitext(os.path.basename(path))[0]}-{upload_hash[:12]}")
+        os.makedirs(chat_dir, exist_ok=True)
+        result = {"path": path, "hash": upload_hash, "version": RESULTS_VERSION}
+
+        if df.empty:
+            result["stats"] = {"messages": 0, "words": 0, "media": 0, "links": 0}
+        else:
+            agg = get_aggregates(df)
+            result["stats"] = {
+                "messages": agg.num_messages, "words": agg.num_words, "media": agg.num_media, "links": agg.num_links,
+                "users": len(agg.user_counts), "first_message": df["date"].min(), "last_message": df["date"].max(),
+            }
+            result["active_users"] = {str(user): int(count) for user, count in agg.user_counts.head(TOP_WORDS).items()}
+            result["top_words"] = agg.word_freq.most_common(TOP_WORDS)
+            result["emojis"] = agg.emoji_freq.most_common(TOP_EMOJIS)
+            result["hour_counts"] = [int(count) for count in agg.hour_counts]
+            result["messages_per_month"] = dict(agg.rollup.timeline())
+
+            sentiment = sentiment_analysis.analyze_sentiment(df[["message"]].copy())
+            counts = sentiment["sentiment_category"].value_counts()
+            result["sentiment"] = {label: int(counts.get(label, 0)) for label in sentiment_analysis.SENTIMENT_LABELS}
+            result["mean_sentiment"] = float(sentiment["sentiment_score"].mean())
+
+            hate_status, hate_messages = hate_speech.detect_hate_speech(df, engine=moderation_engine)
+            fake_status, fake_messages, fake_percentage = fake_message_detector.detect_fake_messages(df, engine=moderation_engine)
+            result["hate_speech"] = {"status": hate_status, "count": len(hate_messages),
+                                     "messages": [f"{user}: {msg}" for user, msg in hate_messages[:MAX_FLAGS_SAVED]]}
+            result["fake_messages"] = {"status": fake_status, "count": len(fake_messages), "percentage": fake_percentage,
+                                       "messages": fake_messages[:MAX_FLAGS_SAVED]}
+            if summarize:
+                import summarizer
+                result["summary"] = summarizer.summarize_chat(df)
+
+            messages = df.assign(sentiment_score=sentiment["sentiment_score"],
+                                 sentiment_category=sentiment["sentiment_category"].astype(str))
+            try:
+                messages.to_parquet(os.path.join(chat_dir, "messages.parquet"), index=False)
+            except ImportError:  # ✅ Parquet output is optional (needs pyarrow)
+                pass
+            del df, sentiment, messages
+
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        _write_json(os.path.join(chat_dir, "result.json"), result)
+        entry.update(status="ok", result=os.path.relpath(os.path.join(chat_dir, "result.json"), out_dir))
+        # ✅ The analyses report their own failures (e.g. a Gemini outage) as "❌ ..." statuses;
+        # such a file is recorded as failed so the next run retries it
+        failed = [status for status in (result.get("hate_speech", {}).get("status"),
+                                        result.get("fake_messages", {}).get("status"), result.get("summary"))
+                  if isinstance(status, str) and status.startswith("❌")]
+        if failed:
+            entry.update(status="error", error="; ".join(failed))
+    except Exception as e:  # one bad export must not stop the batch
+        entry.update(status="error", error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc(limit=5))
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    return entry
+
+
+def summary_row(result):
+    """Flattens one result.json into a row of the combined summary table."""
+    stats = result.get("stats", {})
+    sentiment = result.get("sentiment", {})
+    total = sum(sentiment.values()) or 1
+    users = result.get("active_users", {})
+    return {
+        "file": result["path"],
+        "hash": result["hash"],
+        "messages": stats.get("messages", 0),
+        "words": stats.get("words", 0),
+        "media": stats.get("media", 0),
+        "links": stats.get("links", 0),
+        "users": stats.get("users", 0),
+        "top_user": next(iter(users), None),
+        "first_message": stats.get("first_message"),
+        "last_message": stats.get("last_message"),
+        "mean_sentiment": result.get("mean_sentiment"),
+        **{f"{label.lower().replace(' ', '_')}_pct": round(count / total * 100, 2) for label, count in sentiment.items()},
+        "hate_flags": result.get("hate_speech", {}).get("count", 0),
+        "fake_flags": result.get("fake_messages", {}).get("count", 0),
+        "fake_pct": result.get("fake_messages", {}).get("percentage", 0.0),
+        "seconds": result.get("seconds"),
+    }
+
+
+def write_summary(out_dir, paths=None):
+    """Combines the result.json of every finished file (or only `paths`) into summary.csv / .parquet."""
+    done = load_manifest(out_dir)
+    rows = []
+    for path, entry in sorted(done.items()):
+        if paths is not None and path not in paths:
+            continue
+        with open(os.path.join(out_dir, entry["result"]), encoding="utf-8") as f:
+            rows.append(summary_row(json.load(f)))
+    table = pd.DataFrame(rows)
+    table.to_csv(os.path.join(out_dir, f"{SUMMARY}.csv"), index=False)
+    try:
+        table.to_parquet(os.path.join(out_dir, f"{SUMMARY}.parquet"), index=False)
+    except ImportError:
+        pass
+    return table
+
+
+def run(paths, out_dir, workers=None, memory_limit_mb=None, moderation_engine=None, summarize=False, log=print):
+    """Analyzes `paths` on a process pool, skipping files finished by an earlier run.
+
+    At most 2 * workers files are in flight, so memory stays bounded by the
+    workers themselves rather than by the number of inputs. Returns the
+    summary table.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    out_dir = os.path.abspath(out_dir)
+    done = load_manifest(out_dir)
+    todo = [path for path in paths if not _is_done(done.get(path), path)]
+    log(f"{len(paths)} exports, {len(paths) - len(todo)} already done, {len(todo)} to analyze")
+
+    workers = workers or os.cpu_count() or 1
+    failures = finished = 0
+
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=MAX_TASKS_PER_CHILD,
+                                   initializer=_init_worker, initargs=(memory_limit_mb,))
+
+    def record(entry):
+        nonlocal failures, finished
+        # ✅ Appended and flushed per file: this is the resume point after an interruption
+        manifest.write(json.dumps({k: v for k, v in entry.items() if k != "traceback"}) + "\n")
+        manifest.flush()
+        finished += 1
+        if entry["status"] == "ok":
+            log(f"[{finished}/{len(todo)}] {entry['path']} ({entry['seconds']:.1f}s)")
+        else:
+            failures += 1
+            log(f"[{finished}/{len(todo)}] {entry['path']} FAILED: {entry['error']}")
+
+    with open(os.path.join(out_dir, MANIFEST), "a", encoding="utf-8") as manifest:
+        pool = new_pool()
+        queue = iter(todo)
+        running = {}   # future -> (path, submitted alone)
+        suspects = []  # files in flight when a worker died; each is retried alone to find the culprit
+        try:
+            while True:
+                if suspects:
+                    if not running:
+                        path = suspects.pop(0)
+                        running[pool.submit(analyze_file, path, out_dir, moderation_engine, summarize)] = (path, True)
+                else:
+                    for path in queue:
+                        running[pool.submit(analyze_file, path, out_dir, moderation_engine, summarize)] = (path, False)
+                        if len(running) >= 2 * workers:
+                            break
+                if not running:
+                    break
+                completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in completed:
+                    path, alone = running.pop(future)
+                    try:
+                        entry = future.result()
+                    except BrokenProcessPool as e:  # a worker died (e.g. killed at the memory limit)
+                        broken = True
+                        if not alone:
+                            suspects.append(path)
+                            continue
+                        entry = dict(_fingerprint(path), status="error", seconds=0.0,
+                                     error=f"worker process died: {e or type(e).__name__}")
+                    except Exception as e:  # e.g. a result that failed to unpickle
+                        entry = dict(_fingerprint(path), status="error", seconds=0.0, error=f"{type(e).__name__}: {e}")
+                    record(entry)
+                if broken:
+                    # The whole pool is unusable now: everything else in flight is retried on a fresh one
+                    suspects.extend(path for path, _ in running.values())
+                    running.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = new_pool()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    table = write_summary(out_dir, set(paths))
+    log(f"Done: {len(table)} chats in {os.path.join(out_dir, SUMMARY + '.csv')}, {failures} failed")
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze many WhatsApp exports without the Streamlit app.")
+    parser.add_argument("inputs", nargs="+", help="Directories (searched for .txt files) or glob patterns")
+    parser.add_argument("-o", "--output", default="batch_results", help="Output directory (default: batch_results)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--memory-limit-mb", type=int, default=None,
+                        help="Address-space cap per worker; a chat that exceeds it fails instead of swapping")
+    parser.add_argument("--moderation-engine", choices=["local", "llm", "hybrid"], default=None,
+                        help="Overrides CHAT_ANALYZER_MODERATION_ENGINE")
+    parser.add_argument("--summary", action="store_true", help="Also summarize every chat with Gemini")
+    args = parser.parse_args(argv)
+
+    paths = find_exports(args.inputs)
+    if not paths:
+        parser.error("no .txt exports found")
+    table = run(paths, args.output, args.workers, args.memory_limit_mb, args.moderation_engine, args.summary)
+    failed = len(paths) - len(table)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
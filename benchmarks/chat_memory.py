@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import preprocessor  # noqa: E402
+import synth_chat  # noqa: E402
+
+# ✅ Memory per message of the parsed chat table.
+#   python benchmarks/chat_memory.py --lines 1000000
+#   python benchmarks/chat_memory.py --file chat.txt
+# Parses a synthetic (or given) export and prints deep bytes per message, per
+# column, for the compact table next to the old layouts: the same rows with
+# user/month as plain strings (pandas' Arrow-backed `str`) and with every text
+# column as Python objects (pandas < 3).
+
+
+def legacy_layouts(df):
+    """The table as it was before dictionary encoding and flags, with Arrow strings and with Python objects."""
+    plain = df[["date", "user", "message", "month"]].astype({"user": "str", "month": "str"})
+    return {"strings": plain, "objects": plain.astype({"user": object, "message": object, "month": object})}
+
+
+def report(df):
+    layouts = {**legacy_layouts(df), "compact": df}
+    columns = list(df.columns)
+    print(f"{len(df):,} messages, bytes per message:")
+    print(f"{'column':<12}" + "".join(f"{name:>10}" for name in layouts))
+    per_column = {name: preprocessor.memory_per_message(frame)[1] for name, frame in layouts.items()}
+    for column in columns:
+        print(f"{column:<12}" + "".join(f"{per_column[name].get(column, 0):>10.1f}" for name in layouts))
+    print(f"{'total':<12}" + "".join(f"{preprocessor.memory_per_message(frame)[0]:>10.1f}" for frame in layouts.values()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report memory per message of the parsed chat table.")
+    parser.add_argument("--lines", type=int, default=300_000, help="Lines of the synthetic export")
+    parser.add_argument("--file", help="Parse this export instead of a synthetic one")
+    args = parser.parse_args(argv)
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            df = preprocessor.preprocess(f)
+    else:
+        df = preprocessor.preprocess(synth_chat.generate_text(args.lines))
+    report(df)
+
+
+if __name__ == "__main__":
+    main()
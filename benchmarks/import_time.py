@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# ✅ Cold-start budget check.
+#   python benchmarks/import_time.py
+# Imports every analysis module, and runs the Streamlit page once without an
+# upload, each in a fresh interpreter with outbound network connections
+# blocked. Prints the time of each import and fails (exit 1) when the page run
+# exceeds APP_BUDGET_SECONDS or anything tries to open a connection.
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_BUDGET_SECONDS = 1.0   # first script run of app.py, after streamlit itself is imported
+MODULES = ("preprocessor", "chat_cache", "result_cache", "aggregates", "charts", "helper", "emoji_analysis",
+           "sentiment_analysis", "summarizer", "hate_speech", "fake_message_detector", "chatbot", "telemetry")
+
+# Runs in the child interpreter: block the network, then time the statement.
+_CHILD = """
+import json, socket, sys, time
+def _blocked(*args, **kwargs):
+    raise OSError("network access during cold start")
+socket.socket.connect = _blocked
+socket.create_connection = _blocked
+{setup}
+start = time.perf_counter()
+{statement}
+print(json.dumps({{"seconds": time.perf_counter() - start}}))
+"""
+
+_APP_SETUP = "from streamlit.testing.v1 import AppTest"
+_APP_RUN = """
+app = AppTest.from_file("app.py", default_timeout=60).run()
+if app.exception:
+    raise SystemExit(f"app.py raised: {app.exception[0].value}")
+"""
+
+
+def time_child(statement, setup="", repeat=3):
+    """Best wall time of `statement` in fresh interpreters (cwd = repo root), in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        code = _CHILD.format(setup=setup, statement=statement)
+        done = subprocess.run([sys.executable, "-c", code], cwd=REPO, capture_output=True, text=True)
+        if done.returncode != 0:
+            raise RuntimeError(f"{statement.strip()!r} failed:\n{done.stderr[-2000:]}")
+        best = min(best, json.loads(done.stdout.strip().splitlines()[-1])["seconds"])
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import times and the app cold-start budget.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=APP_BUDGET_SECONDS, help="Seconds allowed for the page run")
+    args = parser.parse_args(argv)
+
+    for module in MODULES:
+        print(f"import {module:<24} {time_child(f'import {module}', repeat=args.repeat) * 1000:8.1f} ms")
+    app_seconds = time_child(_APP_RUN, setup=_APP_SETUP, repeat=args.repeat)
+    print(f"{'app.py first run (no upload)':<31} {app_seconds * 1000:8.1f} ms (budget {args.budget * 1000:.0f} ms)")
+    if app_seconds > args.budget:
+        print("OVER BUDGET")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
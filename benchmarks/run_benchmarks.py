@@ -0,0 +1,260 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synth_chat  # noqa: E402  (sibling module in benchmarks/)
+
+# ✅ Per-stage benchmark suite on synthetic exports.
+#   python benchmarks/run_benchmarks.py                      # compare with baselines.json
+#   python benchmarks/run_benchmarks.py --sizes 1000,100000 --stages parse,aggregates
+#   python benchmarks/run_benchmarks.py --save-baseline      # record new baselines
+# Each stage runs once untimed (imports, lazily built models and per-context
+# inputs are loaded there), is then timed (best of --repeat runs) and, in a
+# separate run under tracemalloc, its peak Python memory is measured. LLM
+# stages talk to the local Gemini stub (llm_stub.py) with the response cache
+# disabled. The exit code is 1 when a stage is slower or heavier than its
+# baseline by more than --tolerance.
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+TOLERANCE = 0.25        # allowed relative slowdown / memory growth before a stage counts as regressed
+STUB_LATENCY = 0.02     # seconds per stubbed LLM request
+MIN_SECONDS = 0.005     # timings below this are too noisy to compare
+FORWARD_RATE = 0.15     # share of forwarded messages in the chat of fake_messages_llm
+STUB_FLAG_WORDS = ("hate", "stupid", "forward")  # the stub flags moderation lines containing one of these
+
+
+def _parse(ctx):
+    import preprocessor
+    return preprocessor.preprocess(ctx["text"])
+
+
+def _aggregates(ctx):
+    # Stats, word frequencies, emoji counts and hour/month histograms come from this one pass
+    import aggregates
+    return aggregates.compute_aggregates(ctx["df"])
+
+
+def _wordcloud(ctx):
+    import charts
+    import helper
+    return charts.wordcloud_image(helper.word_frequencies(ctx["df"]), use_cache=False)
+
+
+def _sentiment(ctx):
+    import sentiment_analysis
+    return sentiment_analysis.analyze_sentiment(ctx["df"][["message"]].copy(), memo_path=None)
+
+
+def _plotting(ctx):
+    import charts
+    from aggregates import get_aggregates
+    agg = get_aggregates(ctx["df"])
+    return [
+        charts.chart_image("peak_hours", agg.hour_counts, use_cache=False),
+        charts.chart_image("peak_month", agg.month_counts, use_cache=False),
+        charts.chart_image("emoji_pie", agg.emoji_freq.most_common(10) or [("none", 1)], use_cache=False),
+        charts.chart_image("sentiment", [("Neutral", agg.num_messages)], use_cache=False),
+    ]
+
+
+def _retrieval(ctx):
+    import retrieval
+    return retrieval.ChatIndex().add(ctx["df"])
+
+
+def _moderation_local(ctx):
+    import fake_message_detector
+    import hate_speech
+    return hate_speech.detect_hate_speech(ctx["df"], engine="local"), \
+        fake_message_detector.detect_fake_messages(ctx["df"], engine="local", store_path=None)
+
+
+def _summary_llm(ctx):
+    import summarizer
+    return summarizer.summarize_chat(ctx["df"])
+
+
+def _hate_speech_llm(ctx):
+    import hate_speech
+    return hate_speech.detect_hate_speech(ctx["df"], engine="llm")
+
+
+def _forwards_df(ctx):
+    """The context's chat regenerated with FORWARD_RATE of its messages being (edited) forwards; built once."""
+    import preprocessor
+    if "forwards_df" not in ctx:
+        ctx["forwards_df"] = preprocessor.preprocess(synth_chat.generate_text(**ctx["synth"], forward_rate=FORWARD_RATE))
+    return ctx["forwards_df"]
+
+
+def _fake_messages_llm(ctx):
+    import fake_message_detector
+    return fake_message_detector.detect_fake_messages(_forwards_df(ctx), engine="llm", store_path=None)
+
+
+# name -> (function(ctx), needs the LLM stub)
+STAGES = {
+    "parse": (_parse, False),
+    "aggregates": (_aggregates, False),
+    "wordcloud": (_wordcloud, False),
+    "sentiment": (_sentiment, False),
+    "plotting": (_plotting, False),
+    "retrieval": (_retrieval, False),
+    "moderation_local": (_moderation_local, False),
+    "summary_llm": (_summary_llm, True),
+    "hate_speech_llm": (_hate_speech_llm, True),
+    "fake_messages_llm": (_fake_messages_llm, True),
+}
+
+
+def stub_reply(prompt, model):
+    """Stub answer to moderation prompts in either protocol, flagging lines with STUB_FLAG_WORDS."""
+    lines = [line for line in prompt.split("\n") if ": " in line and any(word in line.lower() for word in STUB_FLAG_WORDS)]
+    if '"flagged"' in prompt:  # structured: numbered lines in, ids out
+        ids = [line.split("\t", 1)[0] for line in lines if line.split("\t", 1)[0].isdigit()]
+        label = "hate" if "hate speech" in prompt else "fake"
+        return json.dumps({"flagged": [{"id": int(i), "label": label, "score": 0.9} for i in ids]})
+    if lines:  # free text: flagged lines are echoed back
+        return "\n".join(lines)
+    return "No Fake Messages Found" if "fake" in prompt else "No Hate Speech Found"
+
+
+def start_llm_stub(latency=STUB_LATENCY):
+    """Points llm_client at an in-process stub with no rate limit and no response cache."""
+    import llm_cache
+    import llm_client
+    import llm_stub
+
+    server, state, base_url = llm_stub.start(reply=stub_reply, latency=latency)
+    llm_client.API_BASE = base_url
+    llm_client.rate_limiter = llm_client.TokenBucket(1e9, 1e9)
+    llm_cache.ENABLED = False
+    return server, state
+
+
+def measure(func, ctx, repeat, memory=True):
+    """Returns (result, best wall seconds, peak traced MB or None), after one untimed warm-up call."""
+    func(ctx)  # so one-off costs (imports, model loading, derived inputs) aren't timed even when repeat is 1
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(ctx)
+        best = min(best, time.perf_counter() - start)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        func(ctx)
+        peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+    return result, best, peak
+
+
+def run(sizes, stages, fmt="android", repeat=3, memory=True, log=print):
+    """Runs the selected stages on synthetic chats of each size; returns {"stage@size": {...}}."""
+    stub = None
+    if any(STAGES[name][1] for name in stages):
+        import llm_client
+        stub = start_llm_stub()
+    results = {}
+    try:
+        for size in sizes:
+            synth = {"lines": size, "fmt": fmt, "users": max(5, min(size // 200, 500))}
+            ctx = {"text": synth_chat.generate_text(**synth), "synth": synth}
+            ctx["df"] = _parse(ctx)
+            for name in stages:
+                func, uses_llm = STAGES[name]
+                requests_before = len(stub[1].requests) if stub else 0
+                output_before = llm_client.stats["output_tokens"] if stub else 0
+                _, seconds, peak = measure(func, ctx, repeat if size <= 100_000 else 1, memory)
+                entry = {"seconds": round(seconds, 4), "peak_mb": None if peak is None else round(peak, 2),
+                         "messages": len(ctx["df"])}
+                if uses_llm:
+                    runs = 1 + (repeat if size <= 100_000 else 1) + (1 if memory else 0)  # warm-up included
+                    entry["llm_requests"] = (len(stub[1].requests) - requests_before) // runs
+                    entry["llm_output_tokens"] = (llm_client.stats["output_tokens"] - output_before) // runs
+                results[f"{name}@{size}"] = entry
+                peak_text = "" if peak is None else f", peak {peak:.1f} MB"
+                log(f"{name:>18} @ {size:>9,} lines: {seconds * 1000:9.1f} ms{peak_text}")
+    finally:
+        if stub:
+            stub[0].shutdown()
+    return results
+
+
+def compare(results, baselines, tolerance=TOLERANCE):
+    """Returns a list of human-readable regressions against the stored baselines."""
+    regressions = []
+    for key, entry in results.items():
+        base = baselines.get(key)
+        if not base:
+            continue
+        if max(entry["seconds"], base["seconds"]) >= MIN_SECONDS and entry["seconds"] > base["seconds"] * (1 + tolerance):
+            regressions.append(f"{key}: {entry['seconds'] * 1000:.1f} ms vs baseline {base['seconds'] * 1000:.1f} ms "
+                               f"({entry['seconds'] / base['seconds'] - 1:+.0%})")
+        if entry.get("peak_mb") and base.get("peak_mb") and entry["peak_mb"] > base["peak_mb"] * (1 + tolerance) + 1:
+            regressions.append(f"{key}: peak {entry['peak_mb']:.1f} MB vs baseline {base['peak_mb']:.1f} MB")
+    return regressions
+
+
+def machine():
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark each analysis stage on synthetic chats.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated line counts")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("--format", choices=synth_chat.FORMATS, default="android")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (best is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baselines")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--json", help="Also write the raw results to this file")
+    args = parser.parse_args(argv)
+
+    stages = [name for name in args.stages.split(",") if name]
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = run(sizes, stages, args.format, args.repeat, not args.no_memory)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"machine": machine(), "results": results}, f, indent=1)
+
+    stored = {"machine": None, "results": {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+
+    if args.save_baseline:
+        stored["machine"] = machine()
+        stored["results"].update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(stored, f, indent=1, sort_keys=True)
+        print(f"Saved {len(results)} baselines to {args.baseline}")
+        return
+
+    if stored.get("machine") and stored["machine"] != machine():
+        print(f"Note: baselines were recorded on {stored['machine']}, this is {machine()}")
+    regressions = compare(results, stored["results"], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print("No regressions against baselines" if stored["results"] else "No baselines stored yet (use --save-baseline)")
+
+
+if __name__ == "__main__":
+    main()
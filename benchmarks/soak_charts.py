@@ -0,0 +1,86 @@
+import argparse
+import gc
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import charts  # noqa: E402
+
+# ✅ Soak test for the chart pipeline: renders the chat charts N times, the
+# way Streamlit reruns the script, and prints resident memory along the way.
+#   python benchmarks/soak_charts.py                 # cached images (normal reruns)
+#   python benchmarks/soak_charts.py --no-cache      # redraw every time
+#   python benchmarks/soak_charts.py --legacy        # old pyplot path, for comparison
+SENTIMENT_LABELS = ["Very Negative", "Negative", "Neutral", "Positive", "Very Positive"]
+
+
+def rss_mb():
+    """Current resident set size in MB (Linux), falling back to the peak RSS elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def sample_aggregates(seed):
+    rng = np.random.default_rng(seed)
+    return {
+        "peak_hours": rng.integers(0, 5_000, 24),
+        "peak_month": rng.integers(0, 20_000, 12),
+        "sentiment": [(label, int(count)) for label, count in zip(SENTIMENT_LABELS, rng.integers(0, 9_000, 5))],
+        "emoji_pie": [(emoji, int(count)) for emoji, count in zip("😂❤👍🙏🔥😭😊🎉😍🤣", rng.integers(1, 500, 10))],
+    }
+
+
+def legacy_rerun(data):
+    """What the helpers did before: draw on pyplot's global state and never close the figure."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(6, 4))
+    plt.bar(range(24), data["peak_hours"])
+    plt.gcf().canvas.draw()
+    fig, ax = plt.subplots(figsize=(3, 3))
+    ax.pie([count for _, count in data["emoji_pie"]])
+    fig.canvas.draw()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the charts repeatedly and watch resident memory.")
+    parser.add_argument("--reruns", type=int, default=1_000)
+    parser.add_argument("--chats", type=int, default=3, help="Distinct chats cycled through (distinct aggregates)")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the image cache and redraw every chart")
+    parser.add_argument("--legacy", action="store_true", help="Use the old pyplot drawing without closing figures")
+    args = parser.parse_args(argv)
+
+    chats = [sample_aggregates(seed) for seed in range(args.chats)]
+    checkpoints = {0, args.reruns // 10, args.reruns // 2, args.reruns - 1}
+    start_rss = None
+    start = time.perf_counter()
+    for rerun in range(args.reruns):
+        data = chats[rerun % len(chats)]
+        if args.legacy:
+            legacy_rerun(data)
+        else:
+            for name, values in data.items():
+                charts.chart_image(name, values, use_cache=not args.no_cache)
+        if rerun in checkpoints:
+            gc.collect()
+            rss = rss_mb()
+            start_rss = start_rss or rss
+            print(f"rerun {rerun + 1:>6}: RSS {rss:7.1f} MB ({rss - start_rss:+.1f} MB)")
+
+    elapsed = time.perf_counter() - start
+    print(f"{args.reruns} reruns in {elapsed:.1f}s ({elapsed / args.reruns * 1000:.2f} ms per rerun), "
+          f"{charts.stats['renders']} renders, {charts.stats['hits']} cache hits")
+
+
+if __name__ == "__main__":
+    main()
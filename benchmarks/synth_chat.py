@@ -0,0 +1,167 @@
+import argparse
+import random
+from datetime import datetime, timedelta
+
+# ✅ Seeded generator of synthetic WhatsApp exports for tests and benchmarks.
+#   python benchmarks/synth_chat.py chat.txt --lines 1000000 --format ios --users 200
+# Output is written line by line, so 10M-line files don't need 10M lines of
+# memory. The same seed always produces the same file.
+FORMATS = ("android", "ios")
+
+WORDS = (
+    "the a to and i you it is that of in for on me we my so just not this with be are was have "
+    "ok okay yes no lol haha hmm yeah sure thanks please sorry good morning night today tomorrow "
+    "meeting call later home work office lunch dinner coffee pizza movie game match weekend trip "
+    "photo video link plan party birthday family friends group bus train traffic rain weather "
+    "awesome great nice love happy amazing beautiful perfect fun excited cool "
+    "bad sad angry terrible awful worst boring tired annoying hate stupid ugly"
+).split()
+TOPIC_WORDS = ("project", "deadline", "exam", "football", "cricket", "election", "recipe", "vacation", "budget", "doctor")
+EMOJIS = (
+    "😂", "❤️", "👍", "🙏", "🔥", "😭", "😊", "🎉", "😍", "🤣", "😅", "💯",
+    "👍🏽", "👋🏻", "🙌🏾",                      # skin-tone modifiers
+    "👨‍👩‍👧‍👦", "🏳️‍🌈", "🧑‍💻", "❤️‍🔥",  # ZWJ sequences
+    "🇮🇳", "🇺🇸",                                # flags (regional indicator pairs)
+)
+LINKS = ("https://example.com/article/{n}", "https://youtu.be/{n}", "http://news.example.org/{n}?ref=wa")
+MEDIA = {"android": ("<Media omitted>",), "ios": ("‎image omitted", "‎video omitted", "‎sticker omitted")}
+FORWARDS = (
+    "Forwarded as received: the government is giving free laptops to all students, register at the link before Friday",
+    "URGENT!! WhatsApp will start charging for messages from next month unless you forward this to 10 contacts",
+    "Doctors confirm that drinking warm lemon water every morning cures viral fever in three days, please share",
+    "Bank accounts will be frozen tomorrow if KYC is not updated today, send your details to the number below",
+    "Tomorrow is the last day to claim the free recharge of 500 rupees offered by the telecom minister, hurry up",
+)
+FIRST_NAMES = ("Aryan", "Priya", "Rahul", "Ananya", "José", "Zoë", "Mohammed", "Chen", "Olga", "Søren", "Aiko", "Emeka")
+
+
+def make_users(count, rng):
+    """Mix of saved contact names (some non-ASCII) and bare phone numbers."""
+    users = []
+    for i in range(count):
+        if i % 7 == 6:
+            users.append(f"+91 9{rng.randrange(10 ** 8, 10 ** 9)}")
+        else:
+            users.append(f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {i // len(FIRST_NAMES) or ''}".strip())
+    return users
+
+
+def _forward(rng):
+    """One of the circulating forwards, sometimes lightly edited the way re-forwards are."""
+    text = rng.choice(FORWARDS)
+    edit = rng.random()
+    if edit < 0.2:
+        text = text.upper()
+    elif edit < 0.4:
+        text += " " + rng.choice(("🙏", "pls share", "!!!", "forward to all groups"))
+    elif edit < 0.5:
+        words = text.split()
+        del words[rng.randrange(len(words))]
+        text = " ".join(words)
+    return text
+
+
+def _message(rng, fmt, n, forward_rate=0.0):
+    if forward_rate and rng.random() < forward_rate:
+        return _forward(rng)
+    roll = rng.random()
+    if roll < 0.05:
+        return rng.choice(MEDIA[fmt])
+    words = rng.choices(WORDS, k=rng.randint(1, 18))
+    if rng.random() < 0.2:
+        words.append(rng.choice(TOPIC_WORDS))
+    if rng.random() < 0.25:
+        words.insert(rng.randrange(len(words) + 1), "".join(rng.choices(EMOJIS, k=rng.randint(1, 3))))
+    if roll > 0.96:
+        words.append(rng.choice(LINKS).format(n=n))
+    return " ".join(words)
+
+
+def _header(fmt, when, sep, clock24):
+    if fmt == "ios":
+        return f"[{when:%d}{sep}{when:%m}{sep}{when:%y}, {when:%H:%M:%S}] "
+    if clock24:
+        return f"{when.month}{sep}{when.day}{sep}{when:%y}, {when:%H:%M} - "
+    hour = when.hour % 12 or 12
+    return f"{when.month}{sep}{when.day}{sep}{when:%y}, {hour}:{when:%M} {when:%p} - "
+
+
+def generate(out, lines, fmt="android", users=50, seed=0, start=datetime(2020, 1, 1), multiline_rate=0.08,
+             system_rate=0.002, sep="/", clock24=False, forward_rate=0.0):
+    """Writes about `lines` lines of a synthetic export to the text file object `out`; returns the message count.
+
+    Covers multi-line messages, media placeholders, links, emoji (skin tones,
+    ZWJ sequences, flags), system lines and many users. Timestamps increase
+    monotonically from `start`. With `forward_rate`, that share of messages
+    are copies of a few circulating forwards, some lightly edited.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt!r}, expected one of {FORMATS}")
+    rng = random.Random(seed)
+    names = make_users(users, rng)
+    weights = [1 / (rank + 1) for rank in range(users)]  # a few people do most of the talking
+    when = start
+    written = messages = 0
+    buffer = []
+
+    header = _header(fmt, when, sep, clock24)
+    system = "‎Messages and calls are end-to-end encrypted." if fmt == "ios" else \
+        "Messages and calls are end-to-end encrypted. No one outside of this chat can read or listen to them."
+    buffer.append(f"{header}{names[0] + ': ' if fmt == 'ios' else ''}{system}\n")
+    written += 1
+
+    while written < lines:
+        when += timedelta(seconds=rng.expovariate(1 / 240))
+        header = _header(fmt, when, sep, clock24)
+        if rng.random() < system_rate:
+            # System lines have no "Name: " part on Android
+            who, other = rng.sample(names, 2) if users > 1 else (names[0], names[0])
+            event = rng.choice((f"{who} added {other}", f"{who} left", f"{who} changed the subject to \"plans\""))
+            buffer.append(f"{header}{event}\n")
+            written += 1
+        else:
+            user = rng.choices(names, weights)[0]
+            buffer.append(f"{header}{user}: {_message(rng, fmt, written, forward_rate)}\n")
+            written += 1
+            messages += 1
+            if rng.random() < multiline_rate:
+                for _ in range(rng.randint(1, 4)):
+                    if written >= lines:
+                        break
+                    buffer.append(_message(rng, fmt, written) + "\n")
+                    written += 1
+        if len(buffer) >= 10_000:
+            out.write("".join(buffer))
+            buffer.clear()
+    out.write("".join(buffer))
+    return messages
+
+
+def generate_text(lines, **options):
+    """Returns a synthetic export as one string (convenient for small sizes)."""
+    import io
+    out = io.StringIO()
+    generate(out, lines, **options)
+    return out.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a seeded synthetic WhatsApp export.")
+    parser.add_argument("output")
+    parser.add_argument("--lines", type=int, default=100_000, help="Approximate number of lines (1k to 10M+)")
+    parser.add_argument("--format", choices=FORMATS, default="android")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--24h", dest="clock24", action="store_true", help="24-hour clock (Android only)")
+    parser.add_argument("--sep", default="/", help="Date separator: / . or -")
+    parser.add_argument("--forward-rate", type=float, default=0.0, help="Share of messages that are forwards")
+    args = parser.parse_args(argv)
+
+    with open(args.output, "w", encoding="utf-8") as out:
+        count = generate(out, args.lines, args.format, args.users, args.seed, sep=args.sep, clock24=args.clock24,
+                         forward_rate=args.forward_rate)
+    print(f"Wrote {args.output}: {count:,} messages in ~{args.lines:,} lines ({args.format})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# ✅ Charts rendered from small precomputed aggregates (24 hour bins, 12 month
+# bins, monthly timelines, 7 x 24 heatmaps, category counts) into PNG bytes.
+# Figures are created with matplotlib.figure.Figure instead of pyplot, so
+# nothing is registered in pyplot's global figure manager: each figure is
+# cleared right after rendering and freed like any other object. Rendered
+# images are cached by a hash of (chart, data), so reruns and repeated
+# uploads of the same chat don't redraw.
+MAX_IMAGES = 128   # rendered PNGs kept in memory (each is a few tens of KB)
+DPI = 100
+
+MONTHS = ["January", "February", "March", "April", "May", "June",
+          "July", "August", "September", "October", "November", "December"]
+
+_images = OrderedDict()
+_lock = threading.Lock()
+stats = {"hits": 0, "renders": 0}
+
+
+def _palette(name, n):
+    return colormaps[name](np.linspace(0.15, 0.85, max(n, 1)))
+
+
+def _hour_chart(fig, hour_counts):
+    ax = fig.add_subplot()
+    ax.bar(range(24), hour_counts, width=1.0, color="purple", edgecolor="black")
+    ax.set_xlabel("Hour of the Day")
+    ax.set_ylabel("Message Count")
+    ax.set_title("⏰ Peak Chat Hours")
+    ax.set_xticks(range(24))
+    ax.tick_params(axis="x", labelrotation=45)
+
+
+def _month_chart(fig, month_counts):
+    ax = fig.add_subplot()
+    ax.bar(MONTHS, month_counts, color=_palette("Blues_r", 12))
+    ax.set_xlabel("Month")
+    ax.set_ylabel("Message Count")
+    ax.set_title("📆 Peak Chat Month")
+    ax.tick_params(axis="x", labelrotation=45)
+
+
+def _timeline_chart(fig, timeline):
+    labels, counts = zip(*timeline) if timeline else ((), ())
+    ax = fig.add_subplot()
+    ax.plot(range(len(counts)), counts, color="teal", marker="o", markersize=3)
+    step = max(len(labels) // 12, 1)  # at most ~12 tick labels
+    ax.set_xticks(range(0, len(labels), step), labels[::step])
+    ax.set_ylabel("Message Count")
+    ax.set_title("📈 Messages per Month")
+    ax.tick_params(axis="x", labelrotation=45)
+
+
+def _sentiment_timeline_chart(fig, timeline):
+    labels, means = zip(*timeline) if timeline else ((), ())
+    ax = fig.add_subplot()
+    ax.plot(range(len(means)), [np.nan if mean is None else mean for mean in means], color="darkorange", marker="o",
+            markersize=3)
+    ax.axhline(0, color="grey", linewidth=0.8)
+    step = max(len(labels) // 12, 1)
+    ax.set_xticks(range(0, len(labels), step), labels[::step])
+    ax.set_ylabel("Average Sentiment Score")
+    ax.set_title("📈 Sentiment per Month")
+    ax.tick_params(axis="x", labelrotation=45)
+
+
+def _heatmap_chart(fig, matrix):
+    ax = fig.add_subplot()
+    image = ax.imshow(matrix, aspect="auto", cmap="YlOrRd")
+    ax.set_yticks(range(7), ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"])
+    ax.set_xticks(range(0, 24, 2))
+    ax.set_xlabel("Hour of the Day")
+    ax.set_title("🗓️ Weekly Activity")
+    fig.colorbar(image, ax=ax, label="Message Count")
+
+
+def _category_chart(fig, category_counts):
+    labels, counts = zip(*category_counts) if category_counts else ((), ())
+    ax = fig.add_subplot()
+    ax.bar(labels, counts, color=_palette("coolwarm", len(labels)))
+    ax.set_xlabel("Sentiment Category", fontsize=10, labelpad=10)
+    ax.set_ylabel("Message Count", fontsize=10, labelpad=10)
+    ax.set_title("📊 Sentiment Distribution", fontsize=12)
+    for label in ax.get_xticklabels():
+        label.set(rotation=20, ha="right", fontsize=9)
+
+
+def _histogram_chart(fig, histogram):
+    counts, edges = histogram
+    ax = fig.add_subplot()
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align="edge", color="blue", alpha=0.6, edgecolor="black")
+    ax.set_xlabel("Sentiment Score")
+    ax.set_ylabel("Message Count")
+    ax.set_title("Sentiment Distribution")
+
+
+def _emoji_chart(fig, top_emojis):
+    labels, sizes = zip(*top_emojis)
+    ax = fig.add_subplot()
+    ax.pie(sizes, labels=labels, autopct="%1.1f%%", colors=_palette("Pastel1", len(sizes)), textprops={"fontsize": 7})
+    ax.set_title("😃 Emoji Usage Distribution", fontsize=12)
+
+
+# name -> (draw(fig, data), figure size in inches)
+CHARTS = {
+    "peak_hours": (_hour_chart, (6, 4)),
+    "peak_month": (_month_chart, (8, 5)),
+    "timeline": (_timeline_chart, (8, 4)),
+    "activity_heatmap": (_heatmap_chart, (8, 3.5)),
+    "sentiment_timeline": (_sentiment_timeline_chart, (8, 4)),
+    "sentiment": (_category_chart, (5, 4)),
+    "sentiment_histogram": (_histogram_chart, (5, 3)),
+    "emoji_pie": (_emoji_chart, (5, 2)),
+}
+
+
+def _plain(data):
+    """Converts numpy arrays/scalars in chart data to plain Python, for hashing and drawing."""
+    if isinstance(data, np.ndarray):
+        return data.tolist()
+    if isinstance(data, np.generic):
+        return data.item()
+    if isinstance(data, (list, tuple)):
+        return [_plain(item) for item in data]
+    return data
+
+
+def chart_key(name, data):
+    """Returns the cache key of a chart: its name plus a hash of the aggregate it is drawn from."""
+    payload = json.dumps(_plain(data), ensure_ascii=False, default=str)
+    return f"{name}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+
+def render(name, data, dpi=DPI):
+    """Draws chart `name` from `data` and returns it as PNG bytes (uncached)."""
+    draw, size = CHARTS[name]
+    fig = Figure(figsize=size, dpi=dpi)
+    try:
+        draw(fig, _plain(data))
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        FigureCanvasAgg(fig).print_png(buffer)
+        return buffer.getvalue()
+    finally:
+        fig.clear()  # ✅ Explicit lifecycle: drop artists right away instead of waiting for the GC
+
+
+def _render_wordcloud(frequencies, size=(600, 250)):
+    from wordcloud import WordCloud
+
+    width, height = size
+    cloud = WordCloud(width=width, height=height, background_color="black", max_words=len(frequencies))
+    buffer = io.BytesIO()
+    cloud.generate_from_frequencies(dict(frequencies)).to_image().save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _cached_image(key, render_image, use_cache):
+    if use_cache:
+        with _lock:
+            image = _images.get(key)
+            if image is not None:
+                _images.move_to_end(key)
+                stats["hits"] += 1
+                return image
+
+    image = render_image()
+    with _lock:
+        stats["renders"] += 1
+        if use_cache:
+            _images[key] = image
+            while len(_images) > MAX_IMAGES:
+                _images.popitem(last=False)
+    return image
+
+
+def chart_image(name, data, use_cache=True):
+    """Returns chart `name` as PNG bytes, rendering it only if this aggregate hasn't been drawn before."""
+    return _cached_image(chart_key(name, data), lambda: render(name, data), use_cache)
+
+
+def wordcloud_image(frequencies, use_cache=True):
+    """Returns a word cloud of (word, count) pairs as PNG bytes, cached by the frequency table."""
+    frequencies = list(frequencies)
+    return _cached_image(chart_key("wordcloud", frequencies), lambda: _render_wordcloud(frequencies), use_cache)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+import preprocessor
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # ✅ Cache is optional; without pyarrow every upload is just parsed
+    pa = None
+
+# ✅ On-disk cache of parsed chats, keyed by the SHA-256 of the upload bytes.
+# Frames are stored as uncompressed Arrow IPC files so they can be memory-mapped
+# back in without a decode step.
+CACHE_DIR = os.getenv("CHAT_ANALYZER_CACHE_DIR", os.path.join(".cache", "chats"))
+CACHE_MAX_BYTES = int(os.getenv("CHAT_ANALYZER_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# Bump when the cached layout changes; the parser version is folded in so a
+# parser change invalidates every entry written by the previous parser.
+SCHEMA_VERSION = f"1.{preprocessor.PARSER_VERSION}"
+
+_HASH_CHUNK = 1 << 20
+_FORMAT_KEY = b"chat_analyzer.chat_format"
+
+
+def hash_upload(source):
+    """Returns the hex SHA-256 of a str, bytes or file-like upload, read in chunks."""
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        digest.update(source.encode("utf-8"))
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        if hasattr(source, "seek"):
+            source.seek(0)
+        while True:
+            chunk = source.read(_HASH_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        if hasattr(source, "seek"):
+            source.seek(0)
+    return digest.hexdigest()
+
+
+def _entry_path(key, cache_dir):
+    return os.path.join(cache_dir, f"{key}.v{SCHEMA_VERSION}.arrow")
+
+
+def load(key, cache_dir=CACHE_DIR, with_format=False):
+    """Memory-maps a cached frame back in, or returns None on a miss.
+
+    With `with_format`, returns (df, chat format tuple) instead; the format is
+    None when the frame was stored without one (and the frame None on a miss).
+    """
+    if pa is None:
+        return (None, None) if with_format else None
+    path = _entry_path(key, cache_dir)
+    try:
+        with pa.memory_map(path, "r") as source:
+            table = pa_ipc.open_file(source).read_all()
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return (None, None) if with_format else None
+    os.utime(path)  # ✅ Mark as recently used for LRU eviction
+    if not with_format:
+        return table.to_pandas()
+    chat_format = (table.schema.metadata or {}).get(_FORMAT_KEY)
+    return table.to_pandas(), tuple(json.loads(chat_format)) if chat_format else None
+
+
+def store(key, df, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, chat_format=None):
+    """Writes a parsed frame to the cache and evicts old entries above `max_bytes`.
+
+    `chat_format` (ChatFormat.as_tuple()) is kept in the file's schema metadata.
+    """
+    if pa is None:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if chat_format:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), _FORMAT_KEY: json.dumps(chat_format)})
+    path = _entry_path(key, cache_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa_ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)  # ✅ Atomic, so readers never see half-written files
+    evict(cache_dir, max_bytes)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """Deletes stale-schema entries, then least recently used ones until under `max_bytes`."""
+    try:
+        names = os.listdir(cache_dir)
+    except FileNotFoundError:
+        return
+
+    entries, states = [], []
+    suffix = f".v{SCHEMA_VERSION}.arrow"
+    state_suffix = f".v{SCHEMA_VERSION}.state.pkl"  # incremental.ChatState files, named "<key>.<size>.v..."
+    for name in names:
+        path = os.path.join(cache_dir, name)
+        if name.endswith(state_suffix):
+            states.append((name.split(".", 1)[0], path))
+            continue
+        if not name.endswith(suffix):
+            if name.endswith((".arrow", ".state.pkl")):
+                os.remove(path)  # written by an older parser/schema
+            continue
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+    # ✅ A state without its parsed chat can't be extended any more
+    for key, path in states:
+        if not os.path.exists(_entry_path(key, cache_dir)):
+            os.remove(path)
+
@@ -0,0 +1,167 @@
+import re
+
+# ✅ Registry of WhatsApp export formats.
+# Each entry is an anchored header template; "{sep}" is filled with the date
+# separator found while sniffing, so the per-line pattern has no alternation
+# over locales and no lazy groups to backtrack through. Groups are always
+# (day, clock, meridiem) and the rest of the line follows the match.
+_CLOCK = r"(\d{1,2}:\d{2}(?::\d{2})?)(?:\s?([AaPp]\.?\s?[Mm]\.?))?"
+
+FORMATS = {}
+MEDIA_PATTERNS = {}  # per format: the whole text of a message that stands for an attachment
+
+DATE_SEPARATORS = ("/", ".", "-")
+SNIFF_LINES = 300  # lines read once to pick the format
+
+
+def register_format(name, header_template, media_pattern):
+    """Registers an export format; on equal sniff scores the earlier registration wins.
+
+    `media_pattern` matches (whole message, case-insensitively) the line the
+    export writes in place of an attachment. It runs on Arrow strings (RE2),
+    so it must not use backreferences or lookarounds.
+    """
+    FORMATS[name] = header_template
+    MEDIA_PATTERNS[name] = media_pattern
+
+
+# Android: "12/31/20, 10:15 PM - Name: message", attachments as "<Media omitted>"
+register_format("android", r"(\d{1,2}{sep}\d{1,2}{sep}\d{2,4}),? " + _CLOCK + r" - ", "<media omitted>")
+# iOS: "[31/12/20, 22:15:01] Name: message" (optionally prefixed by a LTR mark),
+# attachments as "\u200eimage omitted"; documents keep their name: "a.pdf • \u200e3 pages \u200edocument omitted"
+register_format(
+    "ios", r"\u200e?\[(\d{1,2}{sep}\d{1,2}{sep}\d{2,4}),? " + _CLOCK + r"\] ",
+    "\u200e?(?:image|video|audio|sticker|gif|contact card) omitted|.*\u200edocument omitted",
+)
+
+
+def media_pattern(chat_format=None):
+    """The media placeholder pattern of a format, or of every registered format when it is unknown."""
+    if chat_format is not None:
+        return chat_format.media
+    return "|".join(f"(?:{pattern})" for pattern in MEDIA_PATTERNS.values())
+
+
+class ChatFormat:
+    """A detected export format: a specialised header pattern plus an explicit date format."""
+
+    def __init__(self, name, sep, date_format, ambiguous=False):
+        self.name = name
+        self.sep = sep
+        self.date_format = date_format
+        self.ambiguous = ambiguous  # no day above 12 seen yet: the day/month order is still a guess
+        template = FORMATS[name].replace("{sep}", re.escape(sep))
+        self.header = re.compile(template)
+        self.media = MEDIA_PATTERNS[name]
+
+    def __repr__(self):
+        return (f"ChatFormat({self.name!r}, sep={self.sep!r}, date_format={self.date_format!r}, "
+                f"ambiguous={self.ambiguous!r})")
+
+    def as_tuple(self):
+        """(name, sep, date_format, ambiguous): what ChatFormat(*...) needs to rebuild this format."""
+        return self.name, self.sep, self.date_format, self.ambiguous
+
+    def resolve_order(self, stamps):
+        """Settles an ambiguous day/month order from more timestamps; returns True once the order is known."""
+        if not self.ambiguous:
+            return True
+        order = date_order(stamps, self.sep)
+        if order is None:
+            return False
+        if order == "day" and self.date_format:
+            month_first = "%m{0}%d{0}".format(self.sep)
+            self.date_format = self.date_format.replace(month_first, "%d{0}%m{0}".format(self.sep), 1)
+        self.ambiguous = False
+        return True
+
+    def parse_line(self, line):
+        """Parses one line.
+
+        Returns None for continuation lines, otherwise (timestamp, user, message);
+        system lines ("Messages are end-to-end encrypted", "X added Y") have user None.
+        """
+        match = self.header.match(line)
+        if match is None:
+            return None
+        day, clock, meridiem = match.groups()
+        if meridiem:
+            timestamp = f"{day} {clock} {meridiem.replace('.', '').replace(' ', '').upper()}"
+        else:
+            timestamp = f"{day} {clock}"
+        user, colon, message = line[match.end():].partition(": ")
+        if not colon:
+            return timestamp, None, user.strip()
+        return timestamp, user.strip().lstrip("\u200e"), message.strip()
+
+
+def date_order(samples, sep="/"):
+    """Returns "day" or "month" (which field comes first) once a sample has a field above 12, else None.
+
+    Samples with a field above 12 in both positions keep pandas' previous
+    month-first behaviour.
+    """
+    day_first = month_first = False
+    for sample in samples:
+        fields = sample.partition(" ")[0].split(sep)
+        if len(fields) != 3:
+            continue
+        day_first |= int(fields[0]) > 12
+        month_first |= int(fields[1]) > 12
+        if month_first:
+            return "month"
+    return "day" if day_first else None
+
+
+def detect_date_format(samples, sep="/"):
+    """Detects one explicit strptime format from a sample of 'date time [AM/PM]' timestamps.
+
+    Day-first vs month-first is decided by any field that exceeds 12; when every
+    sample is ambiguous the format is month-first for now, and the parser
+    settles the order from the rest of the file (ChatFormat.resolve_order).
+    """
+    samples = [s for s in samples if s]
+    if not samples:
+        return None
+
+    four_digit_year = twelve_hour = seconds = False
+    for sample in samples:
+        date_part, _, time_part = sample.partition(" ")
+        fields = date_part.split(sep)
+        if len(fields) != 3:
+            continue
+        four_digit_year |= len(fields[2]) == 4
+        twelve_hour |= time_part.endswith("M")
+        seconds |= time_part.count(":") >= 2
+
+    date_fmt = "%d{0}%m{0}" if date_order(samples, sep) == "day" else "%m{0}%d{0}"
+    date_fmt = date_fmt.format(sep) + ("%Y" if four_digit_year else "%y")
+    time_fmt = ("%I" if twelve_hour else "%H") + ":%M" + (":%S" if seconds else "") + (" %p" if twelve_hour else "")
+    return f"{date_fmt} {time_fmt}"
+
+
+def sniff_format(lines):
+    """Picks the registered format and date separator that match the most sample lines.
+
+    Returns a ChatFormat (with its date format detected from the same sample;
+    `ambiguous` when no day in the sample exceeds 12), or None if no line looks
+    like a WhatsApp message header.
+    """
+    best, best_hits = None, 0
+    for name in FORMATS:
+        for sep in DATE_SEPARATORS:
+            candidate = ChatFormat(name, sep, None)
+            hits = sum(1 for line in lines if candidate.header.match(line))
+            if hits > best_hits:
+                best, best_hits = candidate, hits
+    if best is None:
+        return None
+
+    stamps = []
+    for line in lines:
+        parsed = best.parse_line(line)
+        if parsed:
+            stamps.append(parsed[0])
+    best.date_format = detect_date_format(stamps, best.sep)
+    best.ambiguous = date_order(stamps, best.sep) is None
+    return best
@@ -0,0 +1,134 @@
+import re
+import warnings
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from telemetry import instrument
+
+# ✅ Paged chat viewer.
+# Instead of sending the whole parsed frame to the browser, the app asks for
+# one page of rows at a time. Per chat, user -> row positions and the date
+# order are indexed once; a filter (user, date range, substring or regex)
+# narrows those positions with binary searches and only scans the message
+# text of the rows left. Filtered positions are remembered, so turning pages
+# just slices them: unfiltered and date-only filters as a range, a user's rows
+# as a slice of the index, and only text-filtered or out-of-order results as
+# new arrays, within MAX_FILTER_BYTES per chat.
+PAGE_SIZES = (50, 100, 250, 500)
+MAX_FILTERS = 16  # filtered row sets remembered per chat
+MAX_FILTER_BYTES = 8 * 1024 ** 2  # row arrays remembered per chat (1M positions); ranges and index slices are free
+
+_views = {}
+
+
+class ChatView:
+    """Row indexes of one parsed chat for paging through it with user, date and text filters."""
+
+    def __init__(self, df):
+        self._df = weakref.ref(df)
+        self.rows = len(df)
+        self.users = []
+        self._user_rows = {}       # user -> sorted row positions
+        if "user" in df.columns and len(df):
+            codes, uniques = pd.factorize(df["user"], sort=True)
+            order = np.argsort(codes, kind="stable")
+            bounds = np.cumsum(np.bincount(codes[codes >= 0], minlength=len(uniques)))
+            self.users = [str(user) for user in uniques]
+            self._user_rows = dict(zip(self.users, np.split(order[codes[order] >= 0], bounds[:-1])))
+
+        self._dates = None         # epoch nanoseconds per row, sorted by self._date_order
+        self._date_order = None    # None when the chat is already in date order
+        if "date" in df.columns and len(df):
+            dates = df["date"].to_numpy("datetime64[ns]").astype(np.int64)
+            if not (np.diff(dates) >= 0).all():
+                self._date_order = np.argsort(dates, kind="stable")
+                dates = dates[self._date_order]
+            self._dates = dates
+        self._filters = OrderedDict()  # key -> (rows, bytes held)
+
+    @property
+    def df(self):
+        df = self._df()
+        if df is None:
+            raise ValueError("the chat this view was built for no longer exists")
+        return df
+
+    def _date_rows(self, start, end):
+        """Sorted row positions dated in [start, end), or (lo, hi) bounds when the chat is in date order."""
+        lo = 0 if start is None else int(np.searchsorted(self._dates, pd.Timestamp(start).value, side="left"))
+        hi = self.rows if end is None else int(np.searchsorted(self._dates, pd.Timestamp(end).value, side="left"))
+        if self._date_order is None:
+            return lo, max(lo, hi)
+        return np.sort(self._date_order[lo:hi])
+
+    @instrument("chat_view_filter")
+    def filter(self, user=None, start=None, end=None, query=None, regex=False):
+        """Returns the sorted row positions matching every given filter (a range or an int64 array).
+
+        `start`/`end` bound the date (end exclusive); `query` is a
+        case-insensitive substring, or a regular expression with `regex`.
+        Raises ValueError for an invalid regular expression.
+        """
+        query = query or None
+        key = (user, start, end, query, regex)
+        if key in self._filters:
+            self._filters.move_to_end(key)
+            return self._filters[key][0]
+
+        rows = range(self.rows)
+        held = 0  # bytes of a newly allocated row array
+        if user is not None:
+            rows = self._user_rows.get(user, np.zeros(0, dtype=np.int64))
+        if (start is not None or end is not None) and self._dates is not None:
+            dated = self._date_rows(start, end)
+            if isinstance(dated, tuple):
+                lo, hi = dated
+                if isinstance(rows, range):
+                    rows = range(lo, hi)
+                else:
+                    rows = rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)]  # a view of the user's rows
+            else:
+                rows = dated if isinstance(rows, range) else np.intersect1d(rows, dated, assume_unique=True)
+                held = rows.nbytes
+        if query is not None:
+            messages = self.df["message"]
+            messages = (messages.iloc[rows.start:rows.stop] if isinstance(rows, range) else messages.take(rows)).fillna("")
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", UserWarning)  # "pattern has match groups": only a match is needed
+                    found = messages.str.contains(query, case=False, regex=regex).to_numpy(dtype=bool)
+            except (re.error, ValueError) as e:  # Arrow's regex engine raises ArrowInvalid, a ValueError
+                raise ValueError(f"invalid regular expression: {e}") from e
+            rows = rows.start + np.flatnonzero(found) if isinstance(rows, range) else rows[found]
+            held = rows.nbytes
+
+        self._filters[key] = (rows, held)
+        total = sum(size for _, size in self._filters.values())
+        while len(self._filters) > 1 and (len(self._filters) > MAX_FILTERS or total > MAX_FILTER_BYTES):
+            _, (_, size) = self._filters.popitem(last=False)
+            total -= size
+        return rows
+
+    def page(self, rows, number, size=PAGE_SIZES[0]):
+        """Returns page `number` (from 0) of the rows at the positions `rows` (as returned by filter)."""
+        start = max(number, 0) * size
+        return self.df.iloc[rows[start:start + size]]
+
+
+def page_count(rows, size):
+    return max(1, -(-len(rows) // size))
+
+
+def get_view(df):
+    """Returns the view of a parsed chat, built once per frame (and dropped with it)."""
+    key = id(df)
+    entry = _views.get(key)
+    if entry is not None and entry[0]() is df and entry[1].rows == len(df):
+        return entry[1]
+
+    view = ChatView(df)
+    _views[key] = (weakref.ref(df, lambda _, key=key: _views.pop(key, None)), view)
+    return view
@@ -1,40 +1,43 @@
-import google.generativeai as genai
-import os
-from dotenv import load_dotenv
+import llm_client
+import retrieval
+from telemetry import instrument
 
-# ✅ Load API key from .env file
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+PROMPT_TEMPLATE = "chatbot/2"  # bump when the prompt changes, so cached responses are not reused
+FALLBACK_MESSAGES = 200  # recent messages (within the filters) sent when no message matches the question
 
-def answer_query(df, user_query):
-    """Uses Google Gemini AI to answer user queries based on chat data."""
+@instrument("answer_query")
+def answer_query(df, user_query, user=None, start=None, end=None, chat_key=None, parent_key=None):
+    """Uses Google Gemini AI to answer user queries based on chat data.
+
+    Only the message windows most relevant to the question (BM25 over a
+    per-chat index) are sent, optionally restricted to one `user` and a
+    [`start`, `end`) date range. `chat_key`/`parent_key` (ChatState.key and
+    .parent) let a re-exported chat extend the index of the upload it continues.
+    """
 
     if df.empty or "message" not in df.columns or "user" not in df.columns:
         return "No chat data available for answering questions."
 
-    # ✅ Combine user and message for more context
-    df["combined"] = df["user"].astype(str) + ": " + df["message"].astype(str)
-    chat_lines = df["combined"].dropna().tolist()
-
-    # ✅ Limit to the last 200 messages to stay within API context size
-    limited_chat = "\n".join(chat_lines[-200:])
+    # ✅ Retrieve relevant message windows instead of the last 200 messages
+    index = retrieval.get_index(df, key=chat_key, parent=parent_key)
+    chat_lines = index.context(user_query, user=user, start=start, end=end)
+    if not chat_lines:
+        chat_lines = index.recent(FALLBACK_MESSAGES, user=user, start=start, end=end)
+    limited_chat = "\n".join(chat_lines)
 
     if len(limited_chat.strip()) == 0:
         return "No valid messages found in the chat for answering."
 
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-
         prompt = (
             "You are a smart chatbot analyzing a WhatsApp group chat. "
-            "Try to answer the user's question using the information from the chat below. "
+            "Try to answer the user's question using the excerpts from the chat below. "
             "If the chat doesn't directly provide the answer, use your best reasoning to guess based on context.\n\n"
             f"Chat:\n{limited_chat}\n\n"
             f"User Question: {user_query}"
         )
 
-        response = model.generate_content(prompt)
-        chatbot_response = response.text.strip()
+        chatbot_response = llm_client.generate(prompt, model="gemini-1.5-flash", template=PROMPT_TEMPLATE).strip()
 
         # ✅ Even if vague, always return something
         if len(chatbot_response) < 3:
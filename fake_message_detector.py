@@ -1,50 +1,172 @@
-import google.generativeai as genai
 import os
-from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
 
-# ✅ Load API key from .env file
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+import llm_client
+import local_models
+import near_duplicates
+from preprocessor import media_mask
+from telemetry import instrument
 
-def detect_fake_messages(df):
-    """Detects fake messages in WhatsApp chat using Google Gemini API and returns flagged messages with sender info."""
-    
-    if df.empty or "message" not in df.columns or "user" not in df.columns:
-        return "No chat data available for analysis.", [], 0.0
+# ✅ "llm" (Gemini), "hybrid" (local pre-filter, Gemini confirms) or "local" (offline classifier).
+# The local models are trained on a few dozen distinct sentences, so they are opt-in.
+ENGINE = os.getenv("CHAT_ANALYZER_MODERATION_ENGINE", "llm")
+MODEL = "gemini-1.5-flash"
+FAKE_THRESHOLD = 0.6       # P(fake) needed to flag a message locally
+PREFILTER_THRESHOLD = 0.2  # lower bar for escalating a message to Gemini in hybrid mode
+PROMPT_TEMPLATE = "fake_messages/1"  # bump when the prompt changes, so cached responses are not reused
+STRUCTURED_TEMPLATE = "fake_messages/json/1"
+LLM_LABELS = ("fake",)
+LLM_MIN_SCORE = 0.5  # Gemini's confidence needed to keep a structured flag
 
-    # Extract messages and their senders
-    messages = df[["user", "message"]].dropna()
 
-    # ✅ Remove "<Media omitted>" messages
-    filtered_messages = messages[messages["message"].str.contains("<Media omitted>") == False]
+def result_version(engine=None):
+    """Names the engine with every setting that decides its verdicts; stored results are keyed by it."""
+    template = STRUCTURED_TEMPLATE if llm_client.STRUCTURED else PROMPT_TEMPLATE
+    return (f"{engine or ENGINE}:{MODEL}:{template}:model{local_models.MODEL_VERSION}"
+            f":t{FAKE_THRESHOLD}/{PREFILTER_THRESHOLD}/{LLM_MIN_SCORE}")
 
-    if filtered_messages.empty:
-        return "No valid messages to analyze.", [], 0.0
 
+def score_fake_messages(messages):
+    """Returns P(fake) for each message with the local classifier."""
+    model = local_models.load_model("fake_news")
+    return model.predict_proba(messages)[:, model.labels.index("fake")]
+
+
+def _detect_with_gemini(filtered_messages):
+    """Sends the given messages to Gemini in concurrent chunks and returns the merged flagged lines (free text)."""
     # Convert messages to a structured format for AI processing
-    chat_text = "\n".join(f"{row['user']}: {row['message']}" for _, row in filtered_messages.iterrows())
+    chat_lines = [f"{user}: {message}" for user, message in zip(filtered_messages["user"], filtered_messages["message"])]
 
-    try:
-        model = genai.GenerativeModel("gemini-1.5-flash")  # ✅ Use an optimized model for text analysis
-        response = model.generate_content(
+    responses = llm_client.map_chunks(
+        chat_lines,
+        lambda chat_text: (
             f"Analyze the following WhatsApp messages and identify fake information. "
             "For each fake message, return the sender's name and message content. "
-            "Additionally, provide the percentage of fake messages in the chat.\n\n"
+            "If there are none, respond with 'No Fake Messages Found'.\n\n"
             f"{chat_text}"
-        )
+        ),
+        model=MODEL,  # ✅ Use an optimized model for text analysis
+        template=PROMPT_TEMPLATE,
+    )
 
-        fake_message_results = response.text.strip()
+    # ✅ Extract detected fake messages, skipping chunks without any
+    return llm_client.merge_lines(responses, skip_marker="No Fake Messages Found")
 
-        # ✅ If no fake messages are detected
-        if "No Fake Messages Found" in fake_message_results or len(fake_message_results) < 5:
-            return "✅ No Fake Messages Found", [], 0.0
 
-        # ✅ Extract detected fake messages
-        fake_messages = [msg.strip() for msg in fake_message_results.split("\n") if msg.strip()]
+def _classify_with_gemini(filtered_messages):
+    """Returns the rows of `filtered_messages` Gemini flags, sent as numbered messages and answered with ids."""
+    chat_lines = [f"{user}: {message}" for user, message in zip(filtered_messages["user"], filtered_messages["message"])]
+    flags = llm_client.classify_lines(
+        chat_lines,
+        lambda numbered: (
+            "Below are numbered WhatsApp messages. Identify the messages spreading fake or misleading information. "
+            f"{llm_client.flags_instructions(LLM_LABELS)}\n\n"
+            "Messages:\n" + numbered
+        ),
+        labels=LLM_LABELS,
+        model=MODEL,
+        template=STRUCTURED_TEMPLATE,
+    )
+    return filtered_messages.iloc[sorted(row for row, (_, score) in flags.items() if score >= LLM_MIN_SCORE)]
+
+
+def _match_lines(lines, clusters_by_text):
+    """Maps Gemini's "user: message" lines to clusters by normalized text; returns (flagged, unmatched lines)."""
+    flagged, unmatched = set(), []
+    normalized = near_duplicates.normalize(pd.Series([line.split(":", 1)[-1] for line in lines], dtype=object))
+    for line, text in zip(lines, normalized):
+        cluster = clusters_by_text.get(text)
+        if cluster is None:
+            unmatched.append(line)
+        else:
+            flagged.add(cluster)
+    return flagged, unmatched
+
+
+def classify_clusters(representatives, engine):
+    """Classifies one message per cluster; returns (flagged cluster positions, unmatched Gemini lines, decided).
+
+    `decided` is False when Gemini's free-text answer had lines that could not
+    be matched to the messages sent, so a missing flag cannot be read as "not
+    fake". Structured answers (llm_client.STRUCTURED) name message ids and are
+    always decided.
+    """
+    candidates = representatives
+    if engine != "llm":
+        scores = score_fake_messages(representatives["message"].tolist())
+        threshold = PREFILTER_THRESHOLD if engine == "hybrid" else FAKE_THRESHOLD
+        candidates = representatives[scores >= threshold]
+        if engine == "local" or candidates.empty:
+            return set(candidates.index), [], True
+
+    if llm_client.STRUCTURED:
+        return set(_classify_with_gemini(candidates).index), [], True
+    clusters_by_text = dict(zip(near_duplicates.normalize(candidates["message"]), candidates.index))
+    flagged, unmatched = _match_lines(_detect_with_gemini(candidates), clusters_by_text)
+    return flagged, unmatched, not unmatched
+
+
+@instrument("detect_fake_messages")
+def detect_fake_messages(df, engine=None, store_path=near_duplicates.STORE_PATH):
+    """Detects fake messages in WhatsApp chat and returns flagged messages with sender info.
+
+    `engine` overrides ENGINE: "local" scores messages offline, "llm" sends
+    them to Gemini, "hybrid" only sends messages the local model finds suspicious.
+
+    Forwards and their lightly edited copies are clustered first
+    (near_duplicates) and only one message per cluster is classified; the
+    verdict applies to every copy. Verdicts of long forwards are kept in the
+    forwards store and reused when the same forward shows up in another upload.
+    """
+    engine = engine or ENGINE
+
+    if df.empty or "message" not in df.columns or "user" not in df.columns:
+        return "No chat data available for analysis.", [], 0.0
+
+    # ✅ Extract messages and their senders, without "<Media omitted>" rows (the parser's is_media flag)
+    filtered_messages = df.loc[~media_mask(df), ["user", "message"]].dropna()
+
+    if filtered_messages.empty:
+        return "No valid messages to analyze.", [], 0.0
+
+    total_messages = len(filtered_messages)
+    try:
+        clusters = near_duplicates.find_clusters(filtered_messages["message"])
+        representatives = filtered_messages.iloc[clusters.representatives].reset_index(drop=True)
+
+        # ✅ Forwards classified in an earlier upload keep their verdict
+        classifier = result_version(engine)
+        store_ids, known = {}, {}
+        if store_path and clusters.long_clusters.any():
+            table = near_duplicates.cluster_table(filtered_messages, clusters)
+            ids, _ = near_duplicates.link_clusters(clusters, table, store_path)
+            store_ids = dict(zip(np.flatnonzero(clusters.long_clusters).tolist(), ids.tolist()))
+            stored = near_duplicates.get_verdicts(ids, classifier, store_path)
+            known = {cluster: stored[store_id] for cluster, store_id in store_ids.items() if store_id in stored}
+
+        pending = representatives.drop(index=list(known))
+        flagged, unmatched, decided = classify_clusters(pending, engine) if len(pending) else (set(), [], True)
+        flagged |= {cluster for cluster, fake in known.items() if fake}
+
+        new_verdicts = {
+            store_ids[cluster]: cluster in flagged
+            for cluster in pending.index if cluster in store_ids and (decided or cluster in flagged)
+        }
+        if new_verdicts:
+            near_duplicates.put_verdicts(new_verdicts, classifier, store_path)
+
+        # ✅ Every copy of a flagged forward is flagged
+        is_fake = np.isin(clusters.codes, list(flagged))
+        fake_rows = filtered_messages[is_fake]
+        fake_messages = [f"{user}: {message}" for user, message in zip(fake_rows["user"], fake_rows["message"])]
+        fake_messages += unmatched
+
+        if not fake_messages:
+            return "✅ No Fake Messages Found", [], 0.0
 
         # ✅ Calculate fake message percentage
-        fake_message_percentage = (len(fake_messages) / len(filtered_messages)) * 100
+        fake_message_percentage = (len(fake_messages) / total_messages) * 100
 
         return f"🚨 Fake Messages Detected! ({fake_message_percentage:.2f}% of messages are fake)", fake_messages, fake_message_percentage
 
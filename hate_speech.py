@@ -1,49 +1,127 @@
-import google.generativeai as genai
 import os
-from dotenv import load_dotenv
 
-# Load API key from .env file
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+import lexicon
+import llm_client
+import local_models
+from preprocessor import media_mask
+from telemetry import instrument
 
-def detect_hate_speech(df):
-    """Detects hate speech in WhatsApp messages using Google Gemini API and returns flagged messages along with senders."""
+# ✅ "llm" (Gemini), "hybrid" (local pre-filter, Gemini confirms) or "local" (offline classifier).
+# The local models are trained on a few dozen distinct sentences, so they are opt-in.
+ENGINE = os.getenv("CHAT_ANALYZER_MODERATION_ENGINE", "llm")
+MODEL = "gemini-1.5-flash"
+HATE_THRESHOLD = 0.6      # P(hate) + P(offensive) needed to flag a message locally
+PREFILTER_THRESHOLD = 0.2  # lower bar for escalating a message to Gemini in hybrid mode
+PROMPT_TEMPLATE = "hate_speech/1"  # bump when the prompt changes, so cached responses are not reused
+STRUCTURED_TEMPLATE = "hate_speech/json/1"
+LLM_LABELS = ("hate", "offensive")
+LLM_MIN_SCORE = 0.5  # Gemini's confidence needed to keep a structured flag
+# Negative-lexicon hits a message needs before it is sent to Gemini ("llm"/"hybrid"); 0 sends everything
+LEXICON_MIN_HITS = int(os.getenv("CHAT_ANALYZER_LEXICON_MIN_HITS", 1))
+
+
+def result_version(engine=None):
+    """Names the engine with every setting that decides its flags; stored results are keyed by it."""
+    template = STRUCTURED_TEMPLATE if llm_client.STRUCTURED else PROMPT_TEMPLATE
+    return (f"{engine or ENGINE}:{MODEL}:{template}:model{local_models.MODEL_VERSION}"
+            f":t{HATE_THRESHOLD}/{PREFILTER_THRESHOLD}/{LLM_MIN_SCORE}:lex{LEXICON_MIN_HITS}")
+
+
+def score_hate_speech(messages):
+    """Returns P(hate or offensive) for each message with the local classifier."""
+    model = local_models.load_model("hate_speech")
+    probs = model.predict_proba(messages)
+    neither = model.labels.index("neither")
+    return 1.0 - probs[:, neither]
+
+
+def _detect_with_gemini(filtered_messages):
+    """Sends the given messages to Gemini in concurrent chunks and parses the flagged "User: Message" lines (free text)."""
+    # Convert messages into a structured text format (User: Message)
+    chat_lines = [f"{user}: {message}" for user, message in zip(filtered_messages["user"], filtered_messages["message"])]
+
+    responses = llm_client.map_chunks(
+        chat_lines,
+        lambda chat_text: (
+            f"Below is a WhatsApp chat conversation. Identify and list any messages containing hate speech, along with the sender's name. "
+            "If no hate speech is found, respond with 'No Hate Speech Found'.\n\n"
+            "Chat Messages:\n" + chat_text
+        ),
+        model=MODEL,  # ✅ Use correct model
+        template=PROMPT_TEMPLATE,
+    )
+
+    # ✅ Chunks answering "No Hate Speech Found" are dropped; the rest are merged
+    hate_messages = []
+    for line in llm_client.merge_lines(responses, skip_marker="No Hate Speech Found"):
+        if ":" in line:  # Ensure the line has "User: Message" format
+            user, message = line.split(":", 1)
+            hate_messages.append((user.strip(), message.strip()))  # ✅ Store sender and message
+    return hate_messages  # every flagged line; the page decides how many to show
+
+
+def _classify_with_gemini(filtered_messages):
+    """Returns the rows of `filtered_messages` Gemini flags, sent as numbered messages and answered with ids."""
+    chat_lines = [f"{user}: {message}" for user, message in zip(filtered_messages["user"], filtered_messages["message"])]
+    flags = llm_client.classify_lines(
+        chat_lines,
+        lambda numbered: (
+            "Below are numbered WhatsApp messages. Identify the messages containing hate speech or offensive language. "
+            f"{llm_client.flags_instructions(LLM_LABELS)}\n\n"
+            "Messages:\n" + numbered
+        ),
+        labels=LLM_LABELS,
+        model=MODEL,
+        template=STRUCTURED_TEMPLATE,
+    )
+    return filtered_messages.iloc[sorted(row for row, (_, score) in flags.items() if score >= LLM_MIN_SCORE)]
+
+
+@instrument("detect_hate_speech")
+def detect_hate_speech(df, engine=None):
+    """Detects hate speech in WhatsApp messages and returns flagged messages along with senders.
+
+    `engine` overrides ENGINE: "local" scores every message offline; "llm" sends
+    Gemini only messages with at least LEXICON_MIN_HITS negative-lexicon hits;
+    "hybrid" also sends messages the local model finds suspicious.
+    """
+    engine = engine or ENGINE
 
     if df.empty or "message" not in df.columns or "user" not in df.columns:
         return "No chat data available for analysis.", []
 
     # Extract messages and users, while removing "<Media omitted>" lines
-    filtered_messages = df[df["message"].str.contains("<Media omitted>") == False].dropna(subset=["message"])
+    filtered_messages = df.loc[~media_mask(df), ["user", "message"]].dropna(subset=["message"])
     
     if filtered_messages.empty:
         return "No valid messages to analyze.", []
 
-    # Convert messages into a structured text format (User: Message)
-    chat_text = "\n".join(f"{row['user']}: {row['message']}" for _, row in filtered_messages.iterrows())
-
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")  # ✅ Use correct model
-        response = model.generate_content(
-            f"Below is a WhatsApp chat conversation. Identify and list any messages containing hate speech, along with the sender's name. "
-            "If no hate speech is found, respond with 'No Hate Speech Found'.\n\n"
-            "Chat Messages:\n" + chat_text
-        )
-
-        hate_speech_results = response.text.strip()
+        messages = filtered_messages["message"].tolist()
+        if engine == "local":
+            filtered_messages = filtered_messages[score_hate_speech(messages) >= HATE_THRESHOLD]
+        else:
+            # ✅ Only escalate messages with enough negative-lexicon hits (or, in hybrid
+            # mode, a suspicious local score) to the expensive Gemini call
+            escalate = lexicon.get_matcher().scan(messages) >= LEXICON_MIN_HITS
+            if engine == "hybrid":
+                escalate |= score_hate_speech(messages) >= PREFILTER_THRESHOLD
+            filtered_messages = filtered_messages[escalate]
 
-        # ✅ If API response contains "No Hate Speech Found", return success message
-        if "No Hate Speech Found" in hate_speech_results or len(hate_speech_results) < 5:
+        if filtered_messages.empty:
             return "✅ No Hate Speech Found", []
 
-        # ✅ Otherwise, extract detected hate speech messages along with senders
-        hate_messages = []
-        for line in hate_speech_results.split("\n"):
-            if ":" in line:  # Ensure the line has "User: Message" format
-                user, message = line.split(":", 1)
-                hate_messages.append((user.strip(), message.strip()))  # ✅ Store sender and message
+        if engine == "local":
+            hate_messages = list(zip(filtered_messages["user"], filtered_messages["message"]))
+        elif llm_client.STRUCTURED:
+            flagged = _classify_with_gemini(filtered_messages)
+            hate_messages = list(zip(flagged["user"], flagged["message"]))
+        else:
+            hate_messages = _detect_with_gemini(filtered_messages)
 
-        return "🚨 Hate Speech Detected", hate_messages[:5]  # ✅ Limit output to first 5 messages  
- 
+        if not hate_messages:
+            return "✅ No Hate Speech Found", []
+        return "🚨 Hate Speech Detected", hate_messages
 
     except Exception as e:
         return f"❌ Error detecting hate speech: {e}", []
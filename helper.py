@@ -1,158 +1,161 @@
+import heapq
+import os
+
+import numpy as np
 import pandas as pd
-import re
-import emoji
-import matplotlib.pyplot as plt
-import seaborn as sns
-from collections import Counter
-from wordcloud import WordCloud
+
+from aggregates import get_aggregates, user_word_freq
+from charts import chart_image, wordcloud_image
+from telemetry import instrument
+
+WORDCLOUD_MAX_WORDS = int(os.getenv("CHAT_ANALYZER_WORDCLOUD_MAX_WORDS", 200))  # words drawn in the cloud
 
 # ✅ Function 1: Fetch Chat Statistics
+@instrument("fetch_stats")
 def fetch_stats(df):
     """Computes chat statistics like total messages, words, media, and links."""
     if df.empty:
         return 0, 0, 0, 0
 
-    num_messages = df.shape[0]
-    num_words = df['message'].apply(lambda x: len(str(x).split())).sum()
-    num_media = df[df['message'].str.lower() == '<media omitted>'].shape[0]
-    num_links = df['message'].apply(lambda x: len(re.findall(r'http\S+', str(x)))).sum()
-
-    return num_messages, num_words, num_media, num_links
+    agg = get_aggregates(df)
+    return agg.num_messages, agg.num_words, agg.num_media, agg.num_links
 
 # ✅ Function 2: Find Most Active Users
+@instrument("active_users")
 def active_users(df):
     """Finds the most active users in the chat."""
     if df.empty or 'user' not in df.columns:
         return pd.Series(), pd.Series()
 
-    user_counts = df['user'].value_counts().head(10)
-    user_percentages = round((df['user'].value_counts(normalize=True) * 100), 2)
+    counts = get_aggregates(df).user_counts
+    user_counts = counts.head(10)
+    user_percentages = round((counts / counts.sum() * 100), 2).rename("proportion")
     
     return user_counts, user_percentages
 
 # ✅ Function 3: Generate Word Cloud (Smaller Size)
-def create_wordcloud(df):
-    """Generates a word cloud from chat messages."""
+def word_frequencies(df, user=None, max_words=WORDCLOUD_MAX_WORDS):
+    """Returns the `max_words` most frequent words (stop words removed) as (word, count) pairs."""
+    from wordcloud import STOPWORDS
+    # One user's words are counted once per (chat, user); whole chats reuse the memoized aggregates
+    word_freq = user_word_freq(df, user) if user is not None else get_aggregates(df).word_freq
+    words = (item for item in word_freq.items() if item[0] not in STOPWORDS)
+    return heapq.nlargest(max_words, words, key=lambda item: item[1])
+
+@instrument("create_wordcloud")
+def create_wordcloud(df, user=None, max_words=WORDCLOUD_MAX_WORDS):
+    """Generates a word cloud of the most used words (optionally of one user), as PNG bytes."""
     if df.empty:
         return None
 
-    text = " ".join(str(msg) for msg in df['message'] if msg)
-    wordcloud = WordCloud(width=600, height=250, background_color="black").generate(text)
-    
-    return wordcloud.to_image()
+    # ✅ Built from the top-N of the precomputed word frequencies, so the cost doesn't grow with chat length
+    frequencies = word_frequencies(df, user=user, max_words=max_words)
+    if not frequencies:
+        return None
+    return wordcloud_image(frequencies)
 
 # ✅ Function 4: Find Most Common Words (Top 15)
+@instrument("most_common_words")
 def most_common_words(df, num_words=15):
     """Finds the most frequently used words in chat."""
     if df.empty:
         return pd.DataFrame()
 
-    words = " ".join(df['message']).lower().split()
-
-    # Load stop words (if available)
-    try:
-        stop_words = set(open("stop_words.txt").read().split())
-    except FileNotFoundError:
-        stop_words = set()
-
-    filtered_words = [word for word in words if word not in stop_words and len(word) > 2]
-    word_freq = Counter(filtered_words)
+    # Stop words and short words are already filtered out by the aggregate pass
+    word_freq = get_aggregates(df).word_freq
 
     return pd.DataFrame(word_freq.most_common(num_words), columns=['Word', 'Count'])
 
 # ✅ Function 5: Peak Chat Hours Analysis (Smaller Graph)
-def peak_chat_hours(df):
-    """Analyzes peak chat hours by plotting a histogram of message timestamps."""
+@instrument("peak_chat_hours")
+def peak_chat_hours(df, user=None, year=None):
+    """Plots messages per hour of the day (optionally of one user / year); returns the chart as PNG bytes."""
     if df.empty or 'date' not in df.columns:
         return None
 
-    df['hour'] = df['date'].dt.hour
+    # ✅ Drawn from a slice of the precomputed rollup cube, not the raw rows
+    return chart_image("peak_hours", get_aggregates(df).rollup.hourly(user, year))
 
-    plt.figure(figsize=(6, 4))  # Adjust size
-    sns.histplot(df['hour'], bins=24, kde=False, color='purple')
-    plt.xlabel("Hour of the Day")
-    plt.ylabel("Message Count")
-    plt.title("⏰ Peak Chat Hours")
-    plt.xticks(range(0, 24), rotation=45)  # ✅ Rotate labels for better spacing
 
-    return plt
+# ✅ Function 6: Peak Chat Month Analysis (NEW FEATURE 🚀)
+@instrument("peak_chat_month")
+def peak_chat_month(df, user=None, year=None):
+    """Plots messages per month from January to December; returns the chart as PNG bytes.
 
+    Without `year` every year is added up per calendar month; pick a year to
+    see that year alone (monthly_timeline keeps the years apart).
+    """
+    if df.empty or 'date' not in df.columns:
+        return None
 
-# ✅ Function 6: Peak Chat Month Analysis (NEW FEATURE 🚀)
-def peak_chat_month(df):
-    """Analyzes peak chat months and ensures correct order from January to December."""
-    if df.empty or 'month' not in df.columns:
+    return chart_image("peak_month", get_aggregates(df).rollup.month_of_year(user, year))
+
+
+@instrument("monthly_timeline")
+def monthly_timeline(df, user=None):
+    """Plots messages per year-month, from the first to the last message; PNG bytes."""
+    if df.empty or 'date' not in df.columns:
         return None
 
-    # Define proper month order
-    month_order = ["January", "February", "March", "April", "May", "June", 
-                   "July", "August", "September", "October", "November", "December"]
+    return chart_image("timeline", get_aggregates(df).rollup.timeline(user))
 
-    # Ensure 'month' column is a categorical type with correct order
-    df['month'] = pd.Categorical(df['month'], categories=month_order, ordered=True)
 
-    # Count messages per month in correct order
-    month_counts = df['month'].value_counts().sort_index()
+@instrument("activity_heatmap")
+def activity_heatmap(df, user=None, year=None):
+    """Plots a weekday x hour heatmap of messages; PNG bytes."""
+    if df.empty or 'date' not in df.columns:
+        return None
+
+    return chart_image("activity_heatmap", get_aggregates(df).rollup.heatmap(user, year))
+
 
-    # Plot the graph
-    plt.figure(figsize=(8, 5))
-    sns.barplot(x=month_counts.index, y=month_counts.values, palette="Blues_r")
-    plt.xlabel("Month")
-    plt.ylabel("Message Count")
-    plt.title("📆 Peak Chat Month")
-    plt.xticks(rotation=45)  # Rotate for better readability
 
-    return plt
+@instrument("sentiment_timeline")
+def sentiment_timeline(df, user=None, year=None):
+    """Plots the average sentiment score per month; PNG bytes.
+
+    The rollup's sentiment layer is filled once per chat (distinct messages are
+    scored through the sentiment memo); later views only slice it.
+    """
+    import sentiment_analysis
+
+    if df.empty or 'date' not in df.columns:
+        return None
 
+    cube = get_aggregates(df).rollup
+    if cube.sentiment is None:
+        codes, uniques = pd.factorize(df['message'].fillna("").astype(str))
+        cube.add_sentiment(np.asarray(sentiment_analysis.score_texts(list(uniques)), dtype=float)[codes])
+    return chart_image("sentiment_timeline", cube.mean_sentiment(user, year))
 
 
 # ✅ Function 7: Emoji Analysis (Pie Chart, Smaller Size)
+@instrument("emoji_pie_chart")
 def emoji_pie_chart(df):
-    """Creates a pie chart for emoji usage in chats (smaller size)."""
+    """Creates a pie chart for emoji usage in chats (smaller size), as PNG bytes."""
     if df.empty:
         return None
 
-    all_emojis = []
-    df['message'].dropna().apply(lambda msg: all_emojis.extend([char for char in str(msg) if char in emoji.EMOJI_DATA]))
-
-    emoji_counts = Counter(all_emojis)
-    top_emojis = emoji_counts.most_common(10)
+    top_emojis = get_aggregates(df).emoji_freq.most_common(10)
 
     if not top_emojis:
         return None
 
-    labels, sizes = zip(*top_emojis)
-
-    fig, ax = plt.subplots(figsize=(3, 3))  # ✅ Thread-safe Fix
-    ax.pie(sizes, labels=labels, autopct='%1.1f%%', colors=sns.color_palette("pastel"), textprops={'fontsize': 7})
-    ax.set_title("😃 Emoji Usage Distribution", fontsize=12)
-    
-    return fig
+    return chart_image("emoji_pie", top_emojis)
 
 # ✅ Function 8: Sentiment Analysis Visualization (Fixed)
 def sentiment_analysis(df):
-    """Plots a histogram of sentiment scores with expanded categories."""
+    """Plots a histogram of sentiment scores with expanded categories, as PNG bytes."""
     if df.empty or 'sentiment' not in df.columns:
         return None
 
-    fig, ax = plt.subplots(figsize=(5, 3))  # ✅ Thread-safe Fix
-    sns.histplot(df['sentiment'], bins=20, kde=True, color='blue', ax=ax)
-    ax.set_xlabel("Sentiment Score")
-    ax.set_ylabel("Message Count")
-    ax.set_title("Sentiment Distribution")
-
-    return fig
+    counts, edges = np.histogram(df['sentiment'].dropna(), bins=20)
+    return chart_image("sentiment_histogram", (counts, edges))
 # ✅ Function: Sentiment Analysis Bar Chart
 def sentiment_analysis_bar(df):
-    """Generates a sentiment distribution bar graph."""
+    """Generates a sentiment distribution bar graph, as PNG bytes."""
     if df.empty or 'sentiment_category' not in df.columns:
         return None
 
-    fig, ax = plt.subplots(figsize=(6, 4))  # ✅ Smaller graph
-    sns.countplot(data=df, x='sentiment_category', palette="coolwarm", ax=ax)
-    ax.set_xlabel("Sentiment Category")
-    ax.set_ylabel("Message Count")
-    ax.set_title("📊 Sentiment Analysis")
-
-    return fig  # ✅ Returns the figure
-
+    counts = df['sentiment_category'].value_counts(sort=False)
+    return chart_image("sentiment", [(str(label), int(count)) for label, count in counts.items() if count])
@@ -0,0 +1,289 @@
+import copy
+import hashlib
+import os
+import pickle
+import threading
+
+import chat_cache
+import chat_formats
+import preprocessor
+from aggregates import AGGREGATES_VERSION, compute_aggregates, remember
+from telemetry import instrument
+
+# ✅ Incremental re-analysis of re-exported chats.
+# Users re-export the same group every week; each new file is the old one
+# plus new messages. For every analysed upload we keep a small ChatState next
+# to the parsed frame in chat_cache: its byte size, the detected format, the
+# aggregates and the results of the row-wise analyses (sentiment counts,
+# moderation flags). A new upload whose first `size` bytes hash to a stored
+# chat is treated as an extension: only the appended tail is parsed and
+# analysed, and its counts and flags are merged into the stored ones.
+STATE_SUFFIX = f".v{chat_cache.SCHEMA_VERSION}.state.pkl"
+_READ_CHUNK = 1 << 20
+_lock = threading.Lock()
+
+
+class ChatState:
+    """What is remembered about one analysed upload."""
+
+    def __init__(self, key, size, chat_format, aggregates, rows, results=None, parent=None):
+        self.key = key                  # SHA-256 of the upload bytes
+        self.size = size                # upload size in bytes (prefix length for extensions)
+        self.chat_format = chat_format  # ChatFormat.as_tuple() of the format the chat was parsed with
+        self.aggregates = aggregates
+        self.rows = rows
+        self.results = results or {}    # name -> (rows covered, value)
+        self.parent = parent            # key of the export this one extends, if any
+        self.new_rows = rows            # rows parsed and analysed for this upload
+        self.cache_dir = chat_cache.CACHE_DIR
+        self.version = AGGREGATES_VERSION
+
+
+def _state_path(key, size, cache_dir):
+    # The size is part of the file name, so prefix candidates are found without unpickling anything
+    return os.path.join(cache_dir, f"{key}.{size}{STATE_SUFFIX}")
+
+
+def save_state(state, cache_dir=chat_cache.CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _state_path(state.key, state.size, cache_dir)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _lock:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_state(key, size, cache_dir=chat_cache.CACHE_DIR):
+    try:
+        with open(_state_path(key, size, cache_dir), "rb") as f:
+            state = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+    return state if getattr(state, "version", None) == AGGREGATES_VERSION else None
+
+
+def stored_chats(cache_dir=chat_cache.CACHE_DIR):
+    """Returns (key, size) of every chat with a stored state."""
+    try:
+        names = os.listdir(cache_dir)
+    except FileNotFoundError:
+        return []
+    chats = []
+    for name in names:
+        if name.endswith(STATE_SUFFIX):
+            key, size = name[:-len(STATE_SUFFIX)].split(".")
+            chats.append((key, int(size)))
+    return chats
+
+
+def _byte_chunks(source, start=0):
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = memoryview(source)
+        for offset in range(start, len(data), _READ_CHUNK):
+            yield bytes(data[offset:offset + _READ_CHUNK])
+        return
+    source.seek(start)
+    while True:
+        chunk = source.read(_READ_CHUNK)
+        if not chunk:
+            break
+        yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+    source.seek(0)
+
+
+def scan_upload(source, candidates):
+    """Hashes an upload in one pass and finds the longest stored chat it starts with.
+
+    `candidates` are (key, size) pairs; the digest is checked as the stream
+    passes each candidate's size. Returns (hash, size, matching (key, size) or None).
+    """
+    pending = sorted(candidates, key=lambda candidate: candidate[1])
+    digest = hashlib.sha256()
+    position, match = 0, None
+    for chunk in _byte_chunks(source):
+        while pending and pending[0][1] <= position + len(chunk):
+            key, size = pending.pop(0)
+            if size < position:
+                continue
+            cut = size - position
+            digest.update(chunk[:cut])
+            chunk, position = chunk[cut:], size
+            if digest.copy().hexdigest() == key:
+                match = (key, size)
+        digest.update(chunk)
+        position += len(chunk)
+    full_hash = digest.hexdigest()
+    if match and match[0] == full_hash:
+        match = None  # identical upload, not an extension
+    return full_hash, position, match
+
+
+def _tail_bytes(source, start):
+    return b"".join(_byte_chunks(source, start))
+
+
+def _parse_full(source, key, size, cache_dir):
+    """Returns ((df, state), mode): the frame already in chat_cache ("hit") or a fresh parse ("parsed")."""
+    df, fmt = chat_cache.load(key, cache_dir, with_format=True)
+    mode = "hit"
+    if df is None or fmt is None:  # a frame stored without its format can't be extended later
+        df, chat_format = preprocessor.preprocess(source, with_format=True)
+        fmt = chat_format.as_tuple() if chat_format else None
+        mode = "parsed"
+    return (df, ChatState(key, size, fmt, compute_aggregates(df), len(df))), mode
+
+
+def _extend(parent, source, key, size, cache_dir):
+    """Parses only the bytes after the parent's prefix; returns (df, state) or None if that isn't possible."""
+    if parent is None or parent.chat_format is None:
+        return None
+    old_df = chat_cache.load(parent.key, cache_dir)  # the format comes from the parent's state
+    if old_df is None or len(old_df) != parent.rows:
+        return None
+
+    tail = _tail_bytes(source, parent.size)
+    chat_format = chat_formats.ChatFormat(*parent.chat_format)
+    first_line = tail.split(b"\n", 1)[0].decode("utf-8", errors="replace").rstrip("\r")
+    if first_line and not chat_format.header.match(first_line):
+        return None  # the old export ended mid-message; parse everything again
+
+    tail_df, chat_format = preprocessor.preprocess(tail, chat_format=chat_format, with_format=True)
+    if chat_format.date_format != parent.chat_format[2]:
+        return None  # a day above 12 in the tail: the old rows were read month-first by mistake
+    df = preprocessor.concat_frames([old_df, tail_df]) if len(tail_df) else old_df
+    aggregates = copy.deepcopy(parent.aggregates).merge(compute_aggregates(tail_df))
+    state = ChatState(key, size, chat_format.as_tuple(), aggregates, len(df), dict(parent.results), parent.key)
+    state.new_rows = len(tail_df)
+    return df, state
+
+
+def _load_stored(key, size, cache_dir):
+    state = load_state(key, size, cache_dir)
+    df = chat_cache.load(key, cache_dir) if state else None
+    return (df, state) if df is not None and len(df) == state.rows else None
+
+
+@instrument("load_or_parse_incremental")
+def load_or_parse(source, cache_dir=chat_cache.CACHE_DIR, key=None):
+    """Returns (df, state, mode) for an upload; mode is "hit", "extended" or "parsed".
+
+    "extended" means the upload starts with a chat analysed earlier, so only
+    its new tail was parsed and aggregated. Pass `key` when the upload hash is
+    already known, so a repeated upload is not read at all.
+    """
+    chats = stored_chats(cache_dir)
+    stored = next((_load_stored(key, size, cache_dir) for stored_key, size in chats if stored_key == key), None)
+    mode = "hit"
+    if stored is None:
+        full_hash, size, match = scan_upload(source, [chat for chat in chats if chat[0] != key])
+        key = key or full_hash
+        stored = _load_stored(key, size, cache_dir)
+    if stored is None:
+        stored = _extend(load_state(*match, cache_dir), source, key, size, cache_dir) if match else None
+        mode = "extended"
+        if stored is None:
+            stored, mode = _parse_full(source, key, size, cache_dir)
+        if not stored[0].empty:
+            if mode != "hit":
+                chat_cache.store(key, stored[0], cache_dir, chat_format=stored[1].chat_format)
+            save_state(stored[1], cache_dir)
+
+    df, state = stored
+    state.cache_dir = cache_dir
+    remember(df, state.aggregates)  # every helper view reads the (merged) aggregates
+    return df, state, mode
+
+
+def update_result(state, name, df, compute, merge, valid=lambda value: True):
+    """Returns the result `name` for all rows of `df`, computing it only for rows not covered yet.
+
+    `compute(frame)` analyses some rows; `merge(old, new)` combines the stored
+    result with the one of the new rows. Results failing `valid` (e.g. an LLM
+    error) are returned but not stored.
+    """
+    with _lock:
+        covered, value = state.results.get(name, (0, None))
+    if value is not None and covered == len(df):
+        return value
+    if value is None or covered > len(df):
+        value = compute(df)
+    else:
+        value = merge(value, compute(df.iloc[covered:]))
+    if valid(value):
+        with _lock:
+            state.results[name] = (len(df), value)
+        save_state(state, state.cache_dir)
+    return value
+
+
+def _merge_counts(old, new):
+    return {label: old.get(label, 0) + new.get(label, 0) for label in {**old, **new}}
+
+
+def sentiment_counts(state, df):
+    """Returns [(category, messages)] for the chat, scoring only messages appended since the last analysis."""
+    import sentiment_analysis
+
+    def compute(frame):
+        if frame.empty:
+            return {}
+        counts = sentiment_analysis.analyze_sentiment(frame[["message"]].copy())["sentiment_category"].value_counts()
+        return {str(label): int(count) for label, count in counts.items()}
+
+    counts = update_result(state, "sentiment_counts", df, compute, _merge_counts)
+    return [(label, counts.get(label, 0)) for label in sentiment_analysis.SENTIMENT_LABELS]
+
+
+def _checked_messages(frame):
+    return int((~preprocessor.media_mask(frame) & frame["message"].notna()).sum())
+
+
+def detect_hate_speech(state, df, engine=None):
+    """hate_speech.detect_hate_speech over the new rows only, merged with the flags found before."""
+    import hate_speech
+
+    engine = engine or hate_speech.ENGINE
+
+    def compute(frame):
+        status, flags = hate_speech.detect_hate_speech(frame, engine=engine) if len(frame) else ("", [])
+        return status, list(flags)
+
+    def merge(old, new):
+        if new[0].startswith("❌"):
+            return new
+        flags = old[1] + new[1]
+        return ("🚨 Hate Speech Detected" if flags else "✅ No Hate Speech Found"), flags
+
+    # The key names the model, prompt template and thresholds, so changing any of them recomputes the flags
+    return update_result(state, f"hate_speech:{hate_speech.result_version(engine)}", df, compute, merge,
+                         valid=lambda value: not value[0].startswith("❌"))
+
+
+def detect_fake_messages(state, df, engine=None):
+    """fake_message_detector.detect_fake_messages over the new rows only, merged with earlier flags."""
+    import fake_message_detector
+
+    engine = engine or fake_message_detector.ENGINE
+
+    def compute(frame):
+        if not len(frame):
+            return "", [], 0
+        status, flags, _ = fake_message_detector.detect_fake_messages(frame, engine=engine)
+        return status, list(flags), _checked_messages(frame)
+
+    def merge(old, new):
+        if new[0].startswith("❌"):
+            return new
+        flags = old[1] + new[1]
+        return ("🚨 Fake Messages Detected" if flags else "✅ No Fake Messages Found"), flags, old[2] + new[2]
+
+    key = f"fake_messages:{fake_message_detector.result_version(engine)}"
+    status, flags, checked = update_result(state, key, df, compute, merge,
+                                           valid=lambda value: not value[0].startswith("❌"))
+    if not flags:
+        return status, flags, 0.0
+    fake_message_percentage = len(flags) / max(checked, 1) * 100
+    return f"🚨 Fake Messages Detected! ({fake_message_percentage:.2f}% of messages are fake)", flags, fake_message_percentage
@@ -0,0 +1,34 @@
+import importlib
+import threading
+
+# ✅ Deferred imports for the Streamlit page.
+# `helper = lazy_module("helper")` gives a stand-in that imports the real
+# module on first attribute access, so pandas, matplotlib, wordcloud, nltk and
+# the model code are only loaded once an upload actually needs them, and the
+# page itself renders right away.
+
+
+class LazyModule:
+    """Proxy that imports `name` the first time one of its attributes is used (thread-safe)."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._module or self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
@@ -0,0 +1,103 @@
+import os
+import re
+
+import numpy as np
+
+# ✅ Multi-pattern matcher over the negative-word lexicon.
+# The ~5k terms are folded into a character trie and emitted as one regex, so
+# the engine walks each position of the text once along the trie (the same
+# work an Aho-Corasick automaton does, but in C). Terms only match on word
+# boundaries and case-insensitively.
+LEXICON_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "neg_words.txt")  # found from any working directory
+SCAN_BATCH = 50_000  # messages joined per regex scan
+
+_matchers = {}
+
+
+def load_terms(path=LEXICON_FILE):
+    """Reads lexicon terms, one per line, ignoring blanks and ';' comments."""
+    with open(path, encoding="utf-8", errors="replace") as file:
+        terms = {line.strip().casefold() for line in file}
+    return sorted(term for term in terms if term and not term.startswith(";"))
+
+
+def _trie_pattern(terms):
+    """Builds a regex that matches any of `terms`, structured as a trie (longest match first)."""
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = True  # end-of-term marker
+
+    def emit(node):
+        is_end = "" in node
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char != ""]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+        body = "(?:" + "|".join(branches) + ")"
+        return body + "?" if is_end else body
+
+    return emit(trie)
+
+
+class LexiconMatcher:
+    """Compiled matcher returning per-message hit counts and offsets."""
+
+    def __init__(self, terms):
+        self.terms = list(terms)
+        source = r"(?<!\w)(?:" + _trie_pattern(self.terms) + r")(?!\w)"
+        # Lower-casing the text and matching case-sensitively is ~2.5x faster than
+        # re.IGNORECASE; the latter is only used when lower() changes the length
+        # (e.g. "İ"), since offsets must stay valid for the original text.
+        self.lower_pattern = re.compile(source)
+        self.pattern = re.compile(source, re.IGNORECASE)
+
+    def _finditer(self, text):
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            return self.lower_pattern.finditer(lowered)
+        return self.pattern.finditer(text)
+
+    def find(self, text):
+        """Returns (start, end, term) for every lexicon hit in one text."""
+        return [(m.start(), m.end(), m.group().casefold()) for m in self._finditer(text)]
+
+    def scan(self, messages, with_offsets=False):
+        """Scans all messages in one linear pass.
+
+        Returns an int array of hit counts per message and, if `with_offsets`
+        is set, a list with the (start, end, term) hits of every message.
+        """
+        messages = [str(message) for message in messages]
+        counts = np.zeros(len(messages), dtype=np.int64)
+        offsets = [[] for _ in messages] if with_offsets else None
+
+        for first in range(0, len(messages), SCAN_BATCH):
+            batch = messages[first:first + SCAN_BATCH]
+            # Messages are joined by newlines, which are never part of a term,
+            # and hits are mapped back to their message by start offset.
+            starts = np.cumsum([0] + [len(message) + 1 for message in batch[:-1]])
+            text = "\n".join(batch)
+            hits = [(m.start(), m.end(), m.group()) for m in self._finditer(text)]
+            if not hits:
+                continue
+            hit_starts = np.fromiter((start for start, _, _ in hits), dtype=np.int64, count=len(hits))
+            rows = np.searchsorted(starts, hit_starts, side="right") - 1
+            counts[first:first + len(batch)] += np.bincount(rows, minlength=len(batch))
+            if with_offsets:
+                starts = starts.tolist()
+                for row, (start, end, term) in zip(rows.tolist(), hits):
+                    base = starts[row]
+                    offsets[first + row].append((start - base, end - base, term.casefold()))
+
+        return (counts, offsets) if with_offsets else counts
+
+
+def get_matcher(path=LEXICON_FILE):
+    """Returns the compiled matcher for a lexicon file, building it once per process."""
+    if path not in _matchers:
+        _matchers[path] = LexiconMatcher(load_terms(path))
+    return _matchers[path]
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import telemetry
+
+# ✅ Persistent, content-addressed cache of LLM responses.
+# Entries are keyed by model name, prompt template version and a hash of the
+# prompt (i.e. of the chunk content), so re-running an analysis only calls the
+# model for chunks it has not seen before.
+CACHE_PATH = os.getenv("CHAT_ANALYZER_LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite"))
+ENABLED = os.getenv("CHAT_ANALYZER_LLM_CACHE", "1") != "0"   # set to 0 to bypass globally
+TTL_SECONDS = float(os.getenv("CHAT_ANALYZER_LLM_CACHE_TTL", 30 * 24 * 3600))
+MAX_BYTES = int(os.getenv("CHAT_ANALYZER_LLM_CACHE_MAX_BYTES", 200 * 1024 ** 2))
+EVICT_EVERY = 50  # inserts between eviction sweeps
+
+_lock = threading.Lock()
+_inserts = 0
+stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+
+def cache_key(model, template, prompt):
+    """Returns the content address of one request."""
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return f"{model}|{template}|{digest}"
+
+
+def _connect(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "key TEXT PRIMARY KEY, model TEXT, template TEXT, response TEXT, "
+        "created REAL, accessed REAL, size INTEGER)"
+    )
+    return conn
+
+
+def get(model, template, prompt, path=CACHE_PATH, ttl=TTL_SECONDS):
+    """Returns the cached response, or None on a miss or an expired entry."""
+    key = cache_key(model, template, prompt)
+    now = time.time()
+    conn = _connect(path)
+    try:
+        with conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] <= ttl:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            else:
+                row = None
+    finally:
+        conn.close()
+
+    with _lock:
+        stats["hits" if row else "misses"] += 1
+    if row:
+        telemetry.count_llm(cache_hits=1)
+    return row[0] if row else None
+
+
+def put(model, template, prompt, response, path=CACHE_PATH, max_bytes=MAX_BYTES):
+    """Stores a response and periodically evicts expired and least recently used entries."""
+    global _inserts
+    key = cache_key(model, template, prompt)
+    now = time.time()
+    conn = _connect(path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, template, response, created, accessed, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, template, response, now, now, len(response.encode("utf-8"))),
+            )
+    finally:
+        conn.close()
+
+    with _lock:
+        stats["writes"] += 1
+        _inserts += 1
+        sweep = _inserts % EVICT_EVERY == 0
+    if sweep:
+        evict(path, max_bytes)
+
+
+def evict(path=CACHE_PATH, max_bytes=MAX_BYTES, ttl=TTL_SECONDS):
+    """Deletes expired entries, then least recently used ones until the cache fits in `max_bytes`."""
+    conn = _connect(path)
+    try:
+        with conn:
+            removed = conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl,)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > max_bytes:
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+                    if total <= max_bytes:
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+                    removed += 1
+    finally:
+        conn.close()
+    with _lock:
+        stats["evictions"] += removed
+    return removed
+
+
+def cache_stats():
+    """Returns a copy of the hit/miss/write/eviction counters."""
+    with _lock:
+        return dict(stats)
@@ -0,0 +1,310 @@
+import contextvars
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import llm_cache
+import scheduler
+import telemetry
+
+# ✅ One Gemini client shared by every LLM feature.
+# Long message lists are split into token-budgeted chunks, dispatched on a
+# bounded thread pool, rate limited with a token bucket and retried with
+# exponential backoff. Setting GEMINI_API_BASE (e.g. to llm_stub.py) switches
+# from the SDK to plain REST calls against that server.
+load_dotenv()
+
+API_KEY = os.getenv("GEMINI_API_KEY")
+API_BASE = os.getenv("GEMINI_API_BASE")  # None -> google.generativeai SDK
+DEFAULT_MODEL = "gemini-1.5-flash"
+
+MAX_CONCURRENCY = int(os.getenv("CHAT_ANALYZER_LLM_CONCURRENCY", 4))
+REQUESTS_PER_MINUTE = float(os.getenv("CHAT_ANALYZER_LLM_RPM", 60))
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0     # seconds; doubled on every retry, plus jitter
+REQUEST_TIMEOUT = 120  # seconds per request (REST and SDK)
+CHUNK_TOKENS = 6_000   # default token budget of one chunk of chat lines
+MAX_REASKS = 2         # extra requests for a chunk whose structured response fails validation
+# ✅ Moderation asks for JSON message ids instead of free-text "User: Message" lines; set to 0 for the old prompts
+STRUCTURED = os.getenv("CHAT_ANALYZER_LLM_STRUCTURED", "1") != "0"
+
+_sdk_configured = False
+_sdk_lock = threading.Lock()
+_stats_lock = threading.Lock()
+stats = {"requests": 0, "retries": 0, "reasks": 0, "failures": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+
+class LLMError(RuntimeError):
+    """Raised when a request still fails after all retries."""
+
+
+class InvalidResponse(ValueError):
+    """A structured response that does not match the requested schema."""
+
+
+def is_transient(error):
+    """True for errors worth retrying: HTTP 429 and 5xx, timeouts and dropped connections.
+
+    Both urllib's HTTPError and the SDK's google.api_core errors carry the
+    HTTP status in `code`. Anything else (an invalid key, a 400, a blocked
+    response) fails the same way on every attempt.
+    """
+    status = getattr(error, "code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, (TimeoutError, ConnectionError, http.client.HTTPException, urllib.error.URLError))
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` are available, then takes them."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+rate_limiter = TokenBucket(REQUESTS_PER_MINUTE / 60.0, max(1.0, MAX_CONCURRENCY))
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) used for chunk budgeting."""
+    return len(text) // 4 + 1
+
+
+def chunk_lines(lines, max_tokens=CHUNK_TOKENS):
+    """Splits lines into consecutive chunks whose estimated size stays within `max_tokens`.
+
+    A single line longer than the budget becomes its own chunk.
+    """
+    chunks, current, used = [], [], 0
+    for line in lines:
+        cost = estimate_tokens(line)
+        if current and used + cost > max_tokens:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(line)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _record(**counts):
+    with _stats_lock:
+        for name, value in counts.items():
+            stats[name] += value
+    telemetry.count_llm(**counts)  # charged to the stage calls running in this context
+
+
+def _generate_sdk(prompt, model, json_mode=False):
+    global _sdk_configured
+    import google.generativeai as genai
+
+    with _sdk_lock:
+        if not _sdk_configured:
+            genai.configure(api_key=API_KEY)
+            _sdk_configured = True
+    config = {"response_mime_type": "application/json"} if json_mode else None
+    response = genai.GenerativeModel(model).generate_content(
+        prompt, generation_config=config, request_options={"timeout": REQUEST_TIMEOUT})
+    usage = getattr(response, "usage_metadata", None)
+    _record(
+        prompt_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+        output_tokens=getattr(usage, "candidates_token_count", 0) or 0,
+    )
+    return response.text
+
+
+def _generate_rest(prompt, model, api_base, json_mode=False):
+    url = f"{api_base.rstrip('/')}/v1beta/models/{model}:generateContent?key={API_KEY or ''}"
+    payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+    if json_mode:
+        payload["generationConfig"] = {"responseMimeType": "application/json"}
+    body = json.dumps(payload).encode("utf-8")
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+        payload = json.loads(response.read().decode("utf-8"))
+    usage = payload.get("usageMetadata", {})
+    _record(prompt_tokens=usage.get("promptTokenCount", 0), output_tokens=usage.get("candidatesTokenCount", 0))
+    parts = payload["candidates"][0]["content"]["parts"]
+    return "".join(part.get("text", "") for part in parts)
+
+
+def generate(prompt, model=DEFAULT_MODEL, retries=MAX_RETRIES, api_base=None, template="default/1", use_cache=None,
+             json_mode=False):
+    """Sends one prompt and returns the response text, with rate limiting and retries.
+
+    Responses are served from / stored in llm_cache under (model, template,
+    prompt hash); bump the `template` version whenever a prompt's wording
+    changes. `use_cache=False` bypasses the cache for this call.
+    `json_mode` asks Gemini for a JSON response (responseMimeType).
+    """
+    api_base = api_base or API_BASE
+    use_cache = llm_cache.ENABLED if use_cache is None else use_cache
+    if use_cache:
+        cached = llm_cache.get(model, template, prompt)
+        if cached is not None:
+            return cached
+
+    for attempt in range(retries + 1):
+        scheduler.raise_if_cancelled()  # an abandoned report stage stops here instead of sending more requests
+        rate_limiter.acquire()
+        _record(requests=1)
+        try:
+            if api_base:
+                text = _generate_rest(prompt, model, api_base, json_mode)
+            else:
+                text = _generate_sdk(prompt, model, json_mode)
+            if use_cache:
+                llm_cache.put(model, template, prompt, text)
+            return text
+        except Exception as e:  # SDK and HTTP errors alike; only transient ones are retried
+            if attempt == retries or not is_transient(e):
+                _record(failures=1)
+                raise LLMError(f"{model} request failed after {attempt + 1} attempts: {e}") from e
+            _record(retries=1)
+            time.sleep(BACKOFF_BASE * (2 ** attempt) * (1 + random.random()))
+
+
+def map_chunks(lines, build_prompt, model=DEFAULT_MODEL, max_tokens=CHUNK_TOKENS,
+               concurrency=MAX_CONCURRENCY, api_base=None, template="default/1", use_cache=None):
+    """Splits `lines` into chunks and runs `build_prompt(chunk_text)` for each concurrently.
+
+    Returns the response texts in chunk order, so callers can merge them.
+    Chunks are cut greedily from the start, so appending lines to a chat only
+    changes the last chunks and the rest are answered from the response cache.
+    """
+    chunks = ["\n".join(chunk) for chunk in chunk_lines(lines, max_tokens)]
+
+    def run(chunk):
+        return generate(build_prompt(chunk), model, api_base=api_base, template=template, use_cache=use_cache)
+
+    return _map(run, chunks, concurrency)
+
+
+def _map(func, items, concurrency):
+    """`[func(item) for item in items]` on up to `concurrency` threads, each in a copy of the caller's context."""
+    if len(items) <= 1 or concurrency <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, func, item) for item in items]
+        return [future.result() for future in futures]
+
+
+def merge_lines(responses, skip_marker=None):
+    """Merges chunk responses into one list of non-empty lines, dropping "nothing found" answers."""
+    merged = []
+    for response in responses:
+        text = response.strip()
+        if skip_marker and skip_marker in text:
+            continue
+        merged.extend(line.strip() for line in text.split("\n") if line.strip())
+    return merged
+
+
+def flags_instructions(labels):
+    """The prompt part describing numbered input and the JSON answer parse_flags expects."""
+    choices = " or ".join(f'"{label}"' for label in labels)
+    return (
+        "Each line is '<id><TAB><sender>: <message>'. Respond with JSON only, in the form "
+        f'{{"flagged": [{{"id": <id>, "label": {choices}, "score": <confidence from 0 to 1>}}]}}. '
+        'List only flagged messages, never repeat their text, and answer {"flagged": []} if there are none.'
+    )
+
+
+def parse_flags(text, ids, labels):
+    """Validates a `{"flagged": [{"id", "label", "score"}]}` response; returns {id: (label, score)}.
+
+    Raises InvalidResponse when the text is not that JSON object, or an entry
+    has an id outside `ids`, a label outside `labels` or a score outside [0, 1].
+    """
+    text = text.strip()
+    if text.startswith("```"):  # tolerate a fenced code block around the JSON
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        payload = json.loads(text)
+    except ValueError as e:
+        raise InvalidResponse(f"not JSON: {e}") from e
+    entries = payload.get("flagged") if isinstance(payload, dict) else None
+    if not isinstance(entries, list):
+        raise InvalidResponse('expected an object with a "flagged" list')
+
+    flags = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise InvalidResponse(f"flag is not an object: {entry!r}")
+        item, label, score = entry.get("id"), entry.get("label"), entry.get("score", 1.0)
+        if isinstance(item, str) and item.isdigit():
+            item = int(item)
+        if item not in ids:
+            raise InvalidResponse(f"unknown message id {item!r}")
+        if label not in labels:
+            raise InvalidResponse(f"unknown label {label!r} for message {item}")
+        if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 1:
+            raise InvalidResponse(f"score {score!r} of message {item} is not in [0, 1]")
+        flags[item] = (label, float(score))
+    return flags
+
+
+def classify_lines(lines, build_prompt, labels, model=DEFAULT_MODEL, max_tokens=CHUNK_TOKENS,
+                   concurrency=MAX_CONCURRENCY, api_base=None, template="default/1", use_cache=None,
+                   reasks=MAX_REASKS):
+    """Classifies numbered lines in concurrent chunks; returns {line index: (label, score)} of flagged lines.
+
+    Each chunk is sent as "<id>\t<line>" rows numbered from 1, and
+    `build_prompt(numbered_text)` must ask for parse_flags' JSON schema, so
+    the model answers with ids instead of echoing messages. A chunk whose
+    response fails validation is asked again on its own (up to `reasks`
+    times, bypassing the cached answer); valid re-asked answers replace the
+    cached one. Raises LLMError when a chunk never validates.
+    """
+    use_cache = llm_cache.ENABLED if use_cache is None else use_cache
+    chunks, start = [], 0
+    for chunk in chunk_lines(lines, max_tokens):
+        chunks.append((start, chunk))
+        start += len(chunk)
+
+    def run(job):
+        offset, chunk = job
+        prompt = build_prompt("\n".join(f"{number}\t{line}" for number, line in enumerate(chunk, 1)))
+        ids = range(1, len(chunk) + 1)
+        for attempt in range(reasks + 1):
+            text = generate(prompt, model, api_base=api_base, template=template, use_cache=use_cache and not attempt,
+                            json_mode=True)
+            try:
+                flags = parse_flags(text, ids, labels)
+            except InvalidResponse as e:
+                if attempt == reasks:
+                    raise LLMError(f"invalid {template} response after {reasks + 1} attempts: {e}") from e
+                _record(reasks=1)
+                continue
+            if attempt and use_cache:
+                llm_cache.put(model, template, prompt, text)
+            return {offset + number - 1: flag for number, flag in flags.items()}
+
+    results = _map(run, chunks, concurrency)
+    return {index: flag for flags in results for index, flag in flags.items()}
@@ -0,0 +1,92 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ✅ Local stand-in for the Gemini REST API (POST /v1beta/models/<model>:generateContent).
+# Point the app at it with GEMINI_API_BASE=http://127.0.0.1:<port> to exercise
+# chunking, concurrency, retries and caching without network or API costs.
+
+
+class StubState:
+    """Behaviour knobs and request log shared by all handler threads."""
+
+    def __init__(self, reply="No Hate Speech Found", latency=0.0, failure_rate=0.0, seed=0):
+        self.reply = reply            # str, or callable(prompt, model) -> str
+        self.latency = latency        # seconds slept before answering
+        self.failure_rate = failure_rate  # fraction of requests answered with HTTP 429
+        self.random = random.Random(seed)
+        self.requests = []
+        self.lock = threading.Lock()
+
+
+def _make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            prompt = "".join(
+                part.get("text", "") for content in payload.get("contents", []) for part in content.get("parts", [])
+            )
+            model = self.path.split("/models/")[-1].split(":")[0]
+            with state.lock:
+                state.requests.append({"model": model, "prompt": prompt})
+                fail = state.random.random() < state.failure_rate
+            if state.latency:
+                time.sleep(state.latency)
+            if fail:
+                self._send(429, {"error": {"code": 429, "message": "Resource exhausted (stub)"}})
+                return
+
+            text = state.reply(prompt, model) if callable(state.reply) else state.reply
+            self._send(200, {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+                "usageMetadata": {
+                    "promptTokenCount": len(prompt) // 4 + 1,
+                    "candidatesTokenCount": len(text) // 4 + 1,
+                },
+            })
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):  # keep benchmark output quiet
+            pass
+
+    return Handler
+
+
+def start(port=0, **options):
+    """Starts the stub in a background thread; returns (server, state, base_url)."""
+    state = StubState(**options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the Gemini generateContent API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--reply", default="No Hate Speech Found", help="Text returned for every prompt")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    args = parser.parse_args()
+
+    server, _, base_url = start(args.port, reply=args.reply, latency=args.latency, failure_rate=args.failure_rate)
+    print(f"Gemini stub listening on {base_url} (set GEMINI_API_BASE={base_url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import os
+import re
+import sys
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# ✅ Offline text classifiers trained from the bundled datasets.
+# Features are hashed word uni/bigrams plus character trigrams, the model is a
+# multinomial logistic regression in plain numpy, and the trained weights are
+# saved as one .npz artifact, shipped in models/ and loaded once per process.
+MODEL_DIR = os.getenv("CHAT_ANALYZER_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+MODEL_VERSION = 1          # bump when features or training change, then retrain with `python local_models.py`
+N_FEATURES = 1 << 18
+SCORE_BATCH = 20_000       # messages featurized and scored per batch
+
+# name -> (training csv, class labels in label-column order, label given to background text)
+MODELS = {
+    "hate_speech": ("hate_speech_dataset_large.csv", ["hate", "offensive", "neither"], "neither"),
+    "fake_news": ("fake_news_dataset_large.csv", ["real", "fake"], "real"),
+}
+# Everyday sentences (the sentiment dataset) are added as negatives to every
+# model, so ordinary chat is not scored by class priors alone.
+BACKGROUND_DATASET = "sentiment_dataset_large.csv"
+
+_WORD = re.compile(r"\w+(?:'\w+)?")
+_loaded = {}
+
+
+def _tokens(text):
+    words = _WORD.findall(text.lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+def hash_features(texts, n_features=N_FEATURES):
+    """Hashes texts into a CSR-style (indices, values, indptr) triple of L2-normalized counts."""
+    mask = n_features - 1
+    indices, indptr = [], [0]
+    for text in texts:
+        indices.extend(zlib.crc32(token.encode("utf-8")) & mask for token in _tokens(str(text)))
+        indptr.append(len(indices))
+    indices = np.asarray(indices, dtype=np.int64)
+    indptr = np.asarray(indptr, dtype=np.int64)
+    lengths = np.diff(indptr)
+    values = np.repeat(1.0 / np.sqrt(np.maximum(lengths, 1)), lengths).astype(np.float32)
+    return indices, values, indptr
+
+
+class LinearTextClassifier:
+    """Multinomial logistic regression over hashed n-gram features."""
+
+    def __init__(self, labels, n_features=N_FEATURES):
+        self.labels = list(labels)
+        self.n_features = n_features
+        self.weights = np.zeros((n_features, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+
+    def _logits(self, indices, values, indptr):
+        n_rows = len(indptr) - 1
+        logits = np.tile(self.bias, (n_rows, 1))
+        lengths = np.diff(indptr)
+        non_empty = lengths > 0
+        if indices.size:
+            contributions = self.weights[indices] * values[:, None]
+            sums = np.add.reduceat(contributions, indptr[:-1][non_empty], axis=0)
+            logits[non_empty] += sums
+        return logits
+
+    def fit(self, texts, y, sample_weight=None, epochs=150, learning_rate=2.0, l2=1e-4):
+        """Fits the model with full-batch gradient descent on the softmax loss."""
+        indices, values, indptr = hash_features(texts, self.n_features)
+        y = np.asarray(y)
+        n_rows, n_classes = len(y), len(self.labels)
+        sample_weight = np.ones(n_rows) if sample_weight is None else np.asarray(sample_weight, dtype=float)
+        sample_weight = sample_weight / sample_weight.sum()
+        targets = np.eye(n_classes)[y]
+        row_ids = np.repeat(np.arange(n_rows), np.diff(indptr))
+
+        for _ in range(epochs):
+            probs = _softmax(self._logits(indices, values, indptr))
+            error = (probs - targets) * sample_weight[:, None]
+            for c in range(n_classes):
+                grad = np.bincount(indices, weights=values * error[row_ids, c], minlength=self.n_features)
+                self.weights[:, c] -= learning_rate * (grad + l2 * self.weights[:, c]).astype(np.float32)
+            self.bias -= learning_rate * error.sum(axis=0).astype(np.float32)
+        return self
+
+    def predict_proba(self, texts, batch_size=SCORE_BATCH):
+        """Returns an (n_texts, n_classes) probability array, scoring in large batches."""
+        texts = list(texts)
+        out = np.empty((len(texts), len(self.labels)), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            out[start:start + len(batch)] = _softmax(self._logits(*hash_features(batch, self.n_features)))
+        return out
+
+    def predict(self, texts):
+        """Returns the most likely label for each text."""
+        return [self.labels[i] for i in self.predict_proba(texts).argmax(axis=1)]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path, weights=self.weights, bias=self.bias,
+            labels=np.array(self.labels), version=MODEL_VERSION,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["version"]) != MODEL_VERSION:
+                raise ValueError(f"Model artifact {path} has an outdated version")
+            model = cls(data["labels"].tolist(), n_features=data["weights"].shape[0])
+            model.weights = data["weights"]
+            model.bias = data["bias"]
+        return model
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def load_dataset(name):
+    """Loads a bundled dataset plus background negatives, collapsed to distinct (text, label) rows with counts."""
+    csv_path, labels, background_label = MODELS[name]
+    data = pd.read_csv(csv_path)
+    background = pd.read_csv(BACKGROUND_DATASET)[["text"]].assign(label=labels.index(background_label))
+    return pd.concat([data, background]).groupby(["text", "label"], as_index=False).size()
+
+
+def train(name, holdout=0.2, seed=0):
+    """Trains a model on a bundled dataset and returns (model, held-out accuracy).
+
+    The split is made over distinct texts, since the datasets repeat the same
+    sentences many times and a row-level split would leak test rows into training.
+    """
+    _, labels, _ = MODELS[name]
+    data = load_dataset(name)
+    rng = np.random.default_rng(seed)
+    is_test = rng.random(len(data)) < holdout
+    train_rows, test_rows = data[~is_test], data[is_test]
+
+    model = LinearTextClassifier(labels).fit(train_rows["text"], train_rows["label"], train_rows["size"])
+    accuracy = None
+    if not test_rows.empty:
+        predicted = model.predict_proba(test_rows["text"]).argmax(axis=1)
+        accuracy = float(np.average(predicted == test_rows["label"].to_numpy(), weights=test_rows["size"]))
+
+    # The shipped artifact is refit on every distinct text once accuracy is measured.
+    model = LinearTextClassifier(labels).fit(data["text"], data["label"], data["size"])
+    return model, accuracy
+
+
+def model_path(name, model_dir=MODEL_DIR):
+    return os.path.join(model_dir, f"{name}.v{MODEL_VERSION}.npz")
+
+
+def load_model(name, model_dir=MODEL_DIR):
+    """Returns the trained model, loading the shipped artifact once per process.
+
+    Never trains inside a request: a missing or outdated artifact raises
+    FileNotFoundError; run `python local_models.py` to rebuild it.
+    """
+    if name not in _loaded:
+        path = model_path(name, model_dir)
+        try:
+            _loaded[name] = LinearTextClassifier.load(path)
+        except (FileNotFoundError, ValueError) as e:
+            raise FileNotFoundError(f"No trained {name} model at {path}; run `python local_models.py`") from e
+    return _loaded[name]
+
+
+def main(argv=None):
+    """Trains every bundled model and reports held-out accuracy and scoring throughput."""
+    argv = sys.argv[1:] if argv is None else argv
+    model_dir = argv[0] if argv else MODEL_DIR
+    for name in MODELS:
+        start = time.perf_counter()
+        model, accuracy = train(name)
+        model.save(model_path(name, model_dir))
+        elapsed = time.perf_counter() - start
+
+        texts = load_dataset(name)["text"].tolist()
+        sample = (texts * (100_000 // len(texts) + 1))[:100_000]
+        start = time.perf_counter()
+        model.predict_proba(sample)
+        throughput = len(sample) / (time.perf_counter() - start)
+
+        accuracy_text = "n/a" if accuracy is None else f"{accuracy:.3f}"
+        print(f"{name}: trained in {elapsed:.1f}s, held-out accuracy {accuracy_text}, {throughput:,.0f} messages/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+import os
+import pathlib
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from preprocessor import media_mask
+from telemetry import instrument
+
+# ✅ Near-duplicate ("forwarded message") clustering with MinHash LSH.
+# Forwards are pasted over and over with tiny edits. Messages are normalized
+# (lower-cased, punctuation and extra spaces dropped); identical texts share a
+# cluster, and texts of at least MIN_CHARS characters are also grouped when
+# their 5-byte shingle sets are near-identical. Shingle hashing and MinHash
+# signatures are computed with numpy over all distinct texts at once; LSH
+# bands propose candidate pairs, which are confirmed by signature agreement.
+# Long clusters are linked across uploads in a small sqlite store, so a verdict
+# reached for a forward in one chat is reused in the next. The store keeps
+# MinHash signatures and band keys only, never message text, and at most
+# MAX_FORWARDS forwards (least recently seen go first).
+SHINGLE_BYTES = 5
+NUM_PERM = 64              # MinHash permutations per signature
+BANDS = 16                 # LSH bands of NUM_PERM // BANDS rows; candidates from ~0.5 Jaccard up
+SIMILARITY = 0.7           # estimated Jaccard needed to join a cluster
+MIN_CHARS = 40             # shorter texts ("ok", "good morning") only group when identical
+SIGNATURE_BATCH = 100      # texts per vectorized signature block (a few MB of hash values)
+STORE_PATH = os.getenv("CHAT_ANALYZER_FORWARDS_DB", os.path.join(".cache", "forwards.sqlite"))
+MAX_FORWARDS = int(os.getenv("CHAT_ANALYZER_FORWARDS_MAX", 50_000))  # ~40 MB of signatures, band keys and verdicts
+_SQL_CHUNK = 500
+
+_rng = np.random.default_rng(20240229)  # fixed: signatures must stay comparable across processes and uploads
+_PERM_A = (_rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64) | 1).astype(np.uint32)
+_PERM_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64).astype(np.uint32)
+
+
+def normalize(messages):
+    """Lower-cased texts with runs of non-word characters collapsed to one space (vectorized)."""
+    return messages.fillna("").astype(str).str.lower().str.replace(r"[\W_]+", " ", regex=True).str.strip()
+
+
+def _shingle_hashes(texts):
+    """Returns (hash per shingle, text index per shingle) for every 5-byte window inside each text."""
+    encoded = [text.encode("utf-8") for text in texts]
+    lengths = np.fromiter(map(len, encoded), np.int64, len(encoded))
+    buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    windows = len(buffer) - SHINGLE_BYTES + 1
+    if windows <= 0:
+        return np.zeros(0, np.uint32), np.zeros(0, np.int64)
+
+    # Polynomial rolling hash over every window of the concatenated buffer, in uint32 arithmetic
+    hashes = np.zeros(windows, dtype=np.uint32)
+    for offset in range(SHINGLE_BYTES):
+        hashes = hashes * np.uint32(16777619) + buffer[offset:offset + windows]
+    hashes *= np.uint32(0x9E3779B1)
+
+    # Keep only windows that lie inside one text
+    owner = np.repeat(np.arange(len(texts)), lengths)[:windows]
+    ends = np.cumsum(lengths)
+    valid = np.arange(windows) + SHINGLE_BYTES <= ends[owner]
+    return hashes[valid], owner[valid]
+
+
+def signatures(texts):
+    """MinHash signatures (len(texts) x NUM_PERM uint32) of texts of at least SHINGLE_BYTES bytes."""
+    result = np.full((len(texts), NUM_PERM), np.iinfo(np.uint32).max, dtype=np.uint32)
+    for start in range(0, len(texts), SIGNATURE_BATCH):
+        hashes, owner = _shingle_hashes(texts[start:start + SIGNATURE_BATCH])
+        if not len(hashes):
+            continue
+        # permutation-major so the per-text minimum reduces contiguous runs
+        values = _PERM_A[:, None] * hashes  # wraps mod 2**32: one universal hash per permutation
+        values += _PERM_B[:, None]
+        starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])  # owner is sorted
+        present = owner[starts]
+        result[start + present] = np.minimum.reduceat(values, starts, axis=1).T
+    return result
+
+
+def band_keys(signature_matrix):
+    """One 64-bit key per (text, band), mixing the band's rows."""
+    rows = NUM_PERM // BANDS
+    bands = signature_matrix.reshape(len(signature_matrix), BANDS, rows).astype(np.uint64)
+    keys = np.zeros(bands.shape[:2], dtype=np.uint64)
+    for row in range(rows):
+        keys = keys * np.uint64(1099511628211) + bands[:, :, row]
+    return keys
+
+
+def agreement(a, b):
+    """Estimated Jaccard similarity of paired signatures (share of equal MinHash rows)."""
+    return (a == b).mean(axis=-1)
+
+
+def connected_labels(n, left, right):
+    """Component label (smallest member) of each of n nodes joined by the edges left[i] - right[i]."""
+    labels = np.arange(n)
+    while True:
+        before = labels
+        labels = labels.copy()
+        np.minimum.at(labels, left, labels[right])
+        np.minimum.at(labels, right, labels[left])
+        labels = labels[labels]  # pointer jumping: follow labels to their own label
+        if np.array_equal(labels, before):
+            return labels
+
+
+def lsh_groups(signature_matrix):
+    """Returns a group label per signature; rows joined through shared LSH buckets and confirmed agreement."""
+    n = len(signature_matrix)
+    if n < 2:
+        return np.arange(n)
+    keys = band_keys(signature_matrix).T.copy()  # band-major: each band's keys contiguous
+    left, right = [], []
+    for band_key in keys:
+        order = np.argsort(band_key, kind="stable")
+        sorted_keys = band_key[order]
+        first = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        heads = order[np.maximum.accumulate(np.where(first, np.arange(n), 0))]  # bucket representative per row
+        candidates = np.flatnonzero(heads != order)
+        members, reps = order[candidates], heads[candidates]
+        confirmed = agreement(signature_matrix[members], signature_matrix[reps]) >= SIMILARITY
+        left.append(members[confirmed])
+        right.append(reps[confirmed])
+    return connected_labels(n, np.concatenate(left), np.concatenate(right))
+
+
+class Clusters:
+    """Near-duplicate clusters of one set of messages."""
+
+    def __init__(self, codes, representatives, signatures, long_clusters):
+        self.codes = codes                        # cluster per message row (0 .. n_clusters - 1, first-seen order)
+        self.representatives = representatives    # row of each cluster's first message
+        self.signatures = signatures              # MinHash signature of each long cluster, in cluster order
+        self.long_clusters = long_clusters        # bool per cluster: grouped by MinHash (at least MIN_CHARS)
+
+    def __len__(self):
+        return len(self.representatives)
+
+    @property
+    def sizes(self):
+        return np.bincount(self.codes, minlength=len(self))
+
+
+@instrument("near_duplicates")
+def find_clusters(messages):
+    """Clusters a Series of messages; identical normalized texts always share a cluster."""
+    normalized = normalize(messages)
+    text_codes, unique_texts = pd.factorize(normalized)
+    unique_texts = list(unique_texts)
+    labels = np.arange(len(unique_texts))
+    is_long = np.fromiter(map(len, unique_texts), np.int64, len(unique_texts)) >= MIN_CHARS
+    long_index = np.flatnonzero(is_long)
+    long_signatures = signatures([unique_texts[i] for i in long_index])
+    if len(long_index):
+        labels[long_index] = long_index[lsh_groups(long_signatures)]
+
+    # Renumber clusters in order of first appearance in the chat
+    codes, _ = pd.factorize(labels[text_codes])
+    codes = np.asarray(codes, dtype=np.int64)
+    n_clusters = int(codes.max()) + 1 if len(codes) else 0
+    representatives = np.full(n_clusters, len(codes), dtype=np.int64)
+    np.minimum.at(representatives, codes, np.arange(len(codes)))
+    rep_texts = text_codes[representatives] if n_clusters else np.zeros(0, np.int64)
+    signature_rows = np.cumsum(is_long) - 1  # unique text -> row of long_signatures
+    long_clusters = is_long[rep_texts]
+    return Clusters(codes, representatives, long_signatures[signature_rows[rep_texts[long_clusters]]], long_clusters)
+
+
+def cluster_table(df, clusters):
+    """One row per cluster: size, distinct senders, first sender / date, last date and the first text."""
+    rows = pd.DataFrame({"cluster": clusters.codes, "user": df["user"].astype(str).to_numpy()})
+    if "date" in df.columns:
+        rows["date"] = df["date"].to_numpy()
+    grouped = rows.groupby("cluster", sort=True)
+    table = pd.DataFrame({
+        "size": clusters.sizes,
+        "senders": grouped["user"].nunique().to_numpy(),
+        "first_sender": rows["user"].to_numpy()[clusters.representatives],
+        "text": df["message"].astype(str).to_numpy()[clusters.representatives],
+    })
+    if "date" in rows.columns:
+        table.insert(3, "first_seen", rows["date"].to_numpy()[clusters.representatives])
+        table.insert(4, "last_seen", grouped["date"].max().to_numpy())
+    return table
+
+
+def forward_stats(df, min_size=2, store_path=STORE_PATH):
+    """Near-duplicate clusters of at least `min_size` messages, largest first.
+
+    Long clusters are looked up in the cross-upload store: `first_sender` /
+    `first_seen` refer to the forward's earliest known appearance, and
+    `seen_before` says whether that was in another upload, before this chat.
+    The store is only read here; forwards are recorded when fake-message
+    detection links them (link_clusters).
+    """
+    messages = df.loc[~media_mask(df) & df["message"].notna()]
+    clusters = find_clusters(messages["message"])
+    table = cluster_table(messages, clusters)
+    table.insert(len(table.columns) - 1, "seen_before", False)  # text stays last
+    if store_path and clusters.long_clusters.any():
+        earliest = lookup_clusters(clusters, table, store_path)
+        known = np.flatnonzero(clusters.long_clusters)
+        table.loc[known, "first_sender"] = earliest["first_sender"]
+        if "first_seen" in table.columns:
+            first_seen = pd.to_datetime(pd.Series(earliest["first_seen"], dtype=object)).to_numpy()
+            table.loc[known, "seen_before"] = first_seen < table["first_seen"].to_numpy()[known]
+            table.loc[known, "first_seen"] = first_seen
+        else:
+            table.loc[known, "seen_before"] = earliest["seen_before"]
+    table = table[table["size"] >= min_size]
+    return table.sort_values(["size", "senders"], ascending=False).reset_index(drop=True)
+
+
+# ----- Cross-upload store -------------------------------------------------------------------
+
+def _open_store(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)  # several batch workers may write at once
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(clusters)")]
+    if "text" in columns:
+        # Older stores kept each forward's text: drop them and reclaim the pages holding it
+        conn.executescript("DROP TABLE clusters; DROP TABLE IF EXISTS bands; DROP TABLE IF EXISTS verdicts; VACUUM;")
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS clusters (id INTEGER PRIMARY KEY, signature BLOB,"
+        " first_sender TEXT, first_seen TEXT, used REAL);"
+        "CREATE INDEX IF NOT EXISTS clusters_used ON clusters (used);"
+        "CREATE TABLE IF NOT EXISTS bands (band INTEGER, key INTEGER, cluster INTEGER, PRIMARY KEY (band, key));"
+        "CREATE INDEX IF NOT EXISTS bands_cluster ON bands (cluster);"
+        "CREATE TABLE IF NOT EXISTS verdicts (cluster INTEGER, classifier TEXT, flagged INTEGER,"
+        " PRIMARY KEY (cluster, classifier));"
+    )
+    return conn
+
+
+def _open_readonly(path):
+    """Opens an existing store without creating, migrating or writing anything; None if there is none."""
+    if not os.path.exists(path):
+        return None
+    return sqlite3.connect(f"{pathlib.Path(path).absolute().as_uri()}?mode=ro", uri=True, timeout=30)
+
+
+def _store_keys(sigs):
+    """LSH band keys plus one whole-signature key (pseudo-band BANDS), as signed 64-bit sqlite integers.
+
+    The store keeps one forward per (band, key), so a forward whose buckets
+    are all taken by other texts is still found again through its own
+    whole-signature key.
+    """
+    keys = band_keys(sigs)
+    whole = np.zeros(len(keys), dtype=np.uint64)
+    for band in range(BANDS):
+        whole = whole * np.uint64(1099511628211) + keys[:, band]
+    return np.column_stack([keys, whole]).astype(np.int64)
+
+
+@contextmanager
+def _store(path):
+    """One transaction on the forwards store."""
+    conn = _open_store(path)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _stored_clusters(conn, ids):
+    """Returns {id: (signature, first_sender, first_seen)} of stored forwards."""
+    found = {}
+    for start in range(0, len(ids), _SQL_CHUNK):
+        chunk = ids[start:start + _SQL_CHUNK]
+        rows = conn.execute(
+            f"SELECT id, signature, first_sender, first_seen FROM clusters WHERE id IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        found.update((cluster, (np.frombuffer(sig, dtype=np.uint32), sender, seen)) for cluster, sig, sender, seen in rows)
+    return found
+
+
+def _match(conn, sigs, keys):
+    """Finds stored forwards matching each signature; returns (ids, matched, {id: stored forward})."""
+    ids = np.zeros(len(sigs), dtype=np.int64)
+    matched = np.zeros(len(sigs), dtype=bool)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS probe (row INTEGER, band INTEGER, key INTEGER)")
+    conn.execute("DELETE FROM probe")
+    rows, bands = np.divmod(np.arange(keys.size), keys.shape[1])
+    conn.executemany("INSERT INTO probe VALUES (?, ?, ?)", zip(rows.tolist(), bands.tolist(), keys.ravel().tolist()))
+    pairs = np.array(conn.execute(
+        "SELECT bands.cluster, probe.row FROM probe JOIN bands ON bands.band = probe.band AND bands.key = probe.key"
+    ).fetchall(), dtype=np.int64).reshape(-1, 2)
+    if not len(pairs):
+        return ids, matched, {}
+
+    # ✅ Confirm bucket matches by signature agreement; the oldest matching forward wins
+    pair_ids, pair_rows = np.divmod(np.unique(pairs[:, 0] * len(sigs) + pairs[:, 1]), len(sigs))  # by id, row
+    stored = _stored_clusters(conn, np.unique(pair_ids).tolist())
+    stored_sigs = np.stack([stored[cluster][0] for cluster in pair_ids.tolist()])
+    confirmed = agreement(sigs[pair_rows], stored_sigs) >= SIMILARITY
+    matched_rows, first = np.unique(pair_rows[confirmed], return_index=True)
+    ids[matched_rows] = pair_ids[confirmed][first]
+    matched[matched_rows] = True
+    return ids, matched, stored
+
+
+def _earliest(table, index, ids, matched, stored):
+    """First sender / date of each long cluster: this chat's, or the stored forward's when that is older.
+
+    Returns (senders, dates, rows whose stored appearance this chat predates).
+    """
+    senders = table["first_sender"].to_numpy()[index].astype(object)
+    dates = (table["first_seen"].astype(str).to_numpy()[index] if "first_seen" in table.columns
+             else np.full(len(index), "", dtype=object)).astype(object)
+    older = []
+    for row in np.flatnonzero(matched).tolist():
+        _, stored_sender, stored_date = stored[int(ids[row])]
+        if dates[row] and (not stored_date or dates[row] < stored_date):
+            older.append(row)
+        else:
+            senders[row], dates[row] = stored_sender, stored_date
+    return senders, dates, older
+
+
+def lookup_clusters(clusters, table, path=STORE_PATH):
+    """Earliest appearance of every long cluster, read from the store without changing it.
+
+    Returns {"seen_before", "first_sender", "first_seen"} like link_clusters.
+    """
+    index = np.flatnonzero(clusters.long_clusters)
+    ids, matched, stored = np.zeros(len(index), dtype=np.int64), np.zeros(len(index), dtype=bool), {}
+    conn = _open_readonly(path)
+    if conn is not None:
+        try:
+            ids, matched, stored = _match(conn, clusters.signatures, _store_keys(clusters.signatures))
+        except sqlite3.OperationalError:  # an empty or half-created store
+            pass
+        finally:
+            conn.close()
+    senders, dates, _ = _earliest(table, index, ids, matched, stored)
+    return {"seen_before": matched, "first_sender": senders, "first_seen": dates}
+
+
+def _evict(conn, max_forwards=MAX_FORWARDS):
+    """Deletes the least recently seen forwards (with their band keys and verdicts) above `max_forwards`."""
+    excess = conn.execute("SELECT COUNT(*) FROM clusters").fetchone()[0] - max_forwards
+    if excess <= 0:
+        return
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS evicted (id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM evicted")
+    conn.execute("INSERT INTO evicted SELECT id FROM clusters ORDER BY used LIMIT ?", (excess,))
+    conn.execute("DELETE FROM bands WHERE cluster IN (SELECT id FROM evicted)")
+    conn.execute("DELETE FROM verdicts WHERE cluster IN (SELECT id FROM evicted)")
+    conn.execute("DELETE FROM clusters WHERE id IN (SELECT id FROM evicted)")
+
+
+@instrument("link_forwards")
+def link_clusters(clusters, table, path=STORE_PATH, max_forwards=MAX_FORWARDS):
+    """Maps every long cluster to a store id, adding new forwards; returns (ids, earliest appearance).
+
+    A stored forward matches when it heads an LSH bucket of the cluster (the
+    first forward stored with that band key) or has the same signature, and
+    its signature agrees at SIMILARITY or more; all bucket lookups run as one
+    join. The earliest sender/date across uploads is kept for each stored
+    forward, and the least recently seen forwards above `max_forwards` are dropped.
+    """
+    index = np.flatnonzero(clusters.long_clusters)
+    sigs = clusters.signatures
+    keys = _store_keys(sigs)
+    now = time.time()
+
+    with _store(path) as conn:
+        ids, seen_before, stored = _match(conn, sigs, keys)
+        senders, dates, older = _earliest(table, index, ids, seen_before, stored)
+        conn.executemany("UPDATE clusters SET used = ? WHERE id = ?", [(now, int(i)) for i in ids[seen_before].tolist()])
+        conn.executemany("UPDATE clusters SET first_sender = ?, first_seen = ? WHERE id = ?",
+                         [(senders[row], dates[row], int(ids[row])) for row in older])
+
+        new = np.flatnonzero(~seen_before)
+        if len(new):
+            first_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM clusters").fetchone()[0]
+            ids[new] = first_id + np.arange(len(new))
+            conn.executemany(
+                "INSERT INTO clusters VALUES (?, ?, ?, ?, ?)",
+                [(int(ids[row]), sigs[row].tobytes(), senders[row], dates[row], now) for row in new.tolist()],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO bands VALUES (?, ?, ?)",
+                [(band, int(keys[row, band]), int(ids[row])) for row in new.tolist() for band in range(keys.shape[1])],
+            )
+            _evict(conn, max_forwards)
+    return ids, {"seen_before": seen_before, "first_sender": senders, "first_seen": dates}
+
+
+def get_verdicts(ids, classifier, path=STORE_PATH):
+    """Returns {store id: flagged} of forwards already classified by `classifier`."""
+    found = {}
+    ids = [int(i) for i in ids]
+    with _store(path) as conn:
+        for start in range(0, len(ids), _SQL_CHUNK):
+            chunk = ids[start:start + _SQL_CHUNK]
+            rows = conn.execute(
+                f"SELECT cluster, flagged FROM verdicts WHERE classifier = ? AND cluster IN ({','.join('?' * len(chunk))})",
+                [classifier, *chunk],
+            )
+            found.update((cluster, bool(flagged)) for cluster, flagged in rows)
+    return found
+
+
+def put_verdicts(verdicts, classifier, path=STORE_PATH):
+    """Stores {store id: flagged} for `classifier`."""
+    with _store(path) as conn:
+        # Forwards evicted in the meantime get no verdict
+        conn.executemany("INSERT OR REPLACE INTO verdicts SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM clusters WHERE id = ?)",
+                         [(int(cluster), classifier, int(flagged), int(cluster)) for cluster, flagged in verdicts.items()])
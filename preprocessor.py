@@ -1,36 +1,234 @@
 import pandas as pd
-import re
-
-def preprocess(data):
-    messages = []
-    dates = []
-    users = []
-
-    # ✅ Updated regex pattern to support different WhatsApp formats (12-hour and 24-hour)
-    pattern = r'(\d{1,2}/\d{1,2}/\d{2,4},? \s?\d{1,2}:\d{2}\s?[APMampm]*?) - (.*?): (.+)'
-
-    for line in data.split("\n"):
-        match = re.match(pattern, line)
-        if match:
-            date, user, message = match.groups()
-            dates.append(date.strip())
-            users.append(user.strip())
-            messages.append(message.strip())
-        elif messages:
-            # ✅ Handle multiline messages correctly
-            messages[-1] += " " + line.strip()
+import codecs
+from itertools import chain, islice
+
+import chat_formats
+from telemetry import instrument
+
+# ✅ Compact chat table: users and month names are dictionary-encoded
+# (categorical), messages stay in pandas' Arrow-backed string column, dates are
+# datetime64 (int64 epoch values), and per-message length / media / link /
+# emoji flags are computed once here so analyses read them instead of
+# re-scanning the text.
+COLUMNS = ["date", "user", "message", "month", "length", "is_media", "has_link", "emoji_count"]
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June",
+               "July", "August", "September", "October", "November", "December"]
+
+PARSER_VERSION = 5  # bump whenever parsing output changes (invalidates chat_cache entries)
+
+CHUNK_SIZE = 1 << 20        # bytes/characters read from the source per chunk
+BATCH_SIZE = 50_000         # messages per yielded DataFrame batch
+SYSTEM_USER = "group_notification"  # user recorded for system lines when they are kept
+
+
+def _iter_chunks(source, chunk_size=CHUNK_SIZE):
+    """Yields text chunks from a str, bytes or (text/binary) file-like source."""
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+        return
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = memoryview(source)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for start in range(0, len(source), chunk_size):
+            yield decoder.decode(source[start:start + chunk_size])
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+        return
+
+    # File-like: Streamlit's UploadedFile, open(..., "rb") or open(..., "r")
+    if hasattr(source, "seek"):
+        try:
+            source.seek(0)
+        except (OSError, ValueError):
+            pass
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        yield decoder.decode(chunk) if isinstance(chunk, (bytes, bytearray)) else chunk
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_lines(source, chunk_size=CHUNK_SIZE):
+    """Yields lines from the source without ever holding the whole export in memory."""
+    pending = ""
+    for chunk in _iter_chunks(source, chunk_size):
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
 
-    # ✅ Return empty DataFrame if no valid messages are found
-    if not dates or not messages:
-        return pd.DataFrame(columns=["date", "user", "message", "month"])
 
+def _build_frame(dates, users, messages, chat_format):
+    """Builds one DataFrame batch, parsing dates with the format's explicit date format."""
     df = pd.DataFrame({"date": dates, "user": users, "message": messages})
 
     # ✅ Convert date to datetime format, dropping invalid entries
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    date_format = chat_format.date_format
+    if date_format:
+        df["date"] = pd.to_datetime(df["date"], format=date_format, errors="coerce")
+    else:
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
     df = df.dropna(subset=["date"])
 
-    # ✅ New Feature: Extract month for Peak Chat Month Analysis
-    df["month"] = df["date"].dt.strftime("%B")  # Extracts month name (e.g., January)
+    # ✅ New Feature: Extract month for Peak Chat Month Analysis (e.g. January; one byte per row)
+    df["month"] = pd.Categorical.from_codes(df["date"].dt.month.to_numpy() - 1, categories=MONTH_NAMES, ordered=True)
+    return add_message_flags(df, chat_format)
+
+
+def add_message_flags(df, chat_format=None):
+    """Adds the per-message length, is_media, has_link and emoji_count columns (vectorized string kernels).
+
+    Media lines are matched with `chat_format`'s placeholder, or any known
+    format's when it is not given.
+    """
+    from aggregates import emoji_pattern
+
+    messages = df["message"].fillna("")
+    df["length"] = messages.str.len().astype("int32")
+    df["is_media"] = _is_media(messages, chat_format)
+    df["has_link"] = messages.str.contains("http", regex=False).astype(bool)
+    df["emoji_count"] = messages.str.count(emoji_pattern().pattern).astype("int16")
+    return df
+
+
+def _is_media(messages, chat_format=None):
+    """Boolean Series: which messages are exactly the format's media placeholder (case-insensitive)."""
+    return messages.str.fullmatch(chat_formats.media_pattern(chat_format), case=False).astype(bool)
+
+
+def media_mask(df):
+    """Boolean Series of media placeholder rows: the precomputed flag, or computed for frames without it."""
+    if "is_media" in df.columns:
+        return df["is_media"]
+    return _is_media(df["message"].fillna(""))
+
 
+def concat_frames(frames):
+    """Concatenates chat tables, keeping `user` dictionary-encoded across frames with different users."""
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    users = pd.api.types.union_categoricals([frame["user"].astype("category") for frame in frames])
+    df = pd.concat([frame.drop(columns="user") for frame in frames], ignore_index=True) if len(frames) > 1 \
+        else frames[0].drop(columns="user").reset_index(drop=True)
+    df.insert(1, "user", users)
     return df
+
+
+def memory_per_message(df):
+    """Bytes of memory per message (deep, string buffers included), overall and per column."""
+    usage = df.memory_usage(deep=True, index=False)
+    rows = max(len(df), 1)
+    return usage.sum() / rows, (usage / rows).round(2).to_dict()
+
+
+def open_stream(source, chunk_size=CHUNK_SIZE, chat_format=None):
+    """Returns (lines, chat_format): the source's lines and its format, sniffed from the first lines unless given."""
+    lines = iter_lines(source, chunk_size)
+    if chat_format is None:
+        head = list(islice(lines, chat_formats.SNIFF_LINES))
+        chat_format = chat_formats.sniff_format(head)
+        lines = chain(head, lines)
+    return lines, chat_format
+
+
+def parse_lines(lines, chat_format, batch_size=BATCH_SIZE, include_system=False):
+    """Parses lines of an export in a known format and yields DataFrame batches (see preprocess_stream)."""
+    dates, users, messages = [], [], []
+    current = None  # parts of the message still receiving continuation lines
+    held = []       # raw batches kept back while the day/month order is ambiguous
+
+    def flush():
+        batch = (dates[:], users[:], [" ".join(parts) for parts in messages])
+        dates.clear()
+        users.clear()
+        messages.clear()
+        if not chat_format.resolve_order(batch[0]):
+            held.append(batch)
+            return []
+        frames = [_build_frame(*raw, chat_format) for raw in held + [batch]]
+        held.clear()
+        return frames
+
+    parse_line = chat_format.parse_line
+    for line in lines:
+        parsed = parse_line(line)
+        if parsed is None:
+            if current is not None:
+                # ✅ Handle multiline messages correctly
+                current.append(line.strip())
+            continue
+
+        timestamp, user, message = parsed
+        if user is None:
+            if not include_system:
+                current = None
+                continue
+            user = SYSTEM_USER
+
+        # The previous message can no longer grow, so the batch is safe to emit.
+        if len(messages) >= batch_size:
+            yield from flush()
+        dates.append(timestamp)
+        users.append(user)
+        current = [message]
+        messages.append(current)
+
+    if messages:
+        yield from flush()
+    # No day above 12 anywhere: month-first, as detect_date_format guessed
+    for raw in held:
+        yield _build_frame(*raw, chat_format)
+
+
+def preprocess_stream(source, batch_size=BATCH_SIZE, chunk_size=CHUNK_SIZE, include_system=False, chat_format=None):
+    """Parses a WhatsApp export incrementally and yields DataFrame batches.
+
+    `source` may be a str, bytes or a file-like object opened in text or binary
+    mode. The first lines are sniffed once to pick the export format (Android,
+    iOS, date separator, day-first vs month-first); the rest of the file then
+    goes through that format's anchored parser in a single pass. Only one chunk
+    of raw text and one batch of parsed rows are held at a time; continuation
+    lines are collected in a list and joined once instead of being appended to
+    the previous message string on every line. While no day above 12 has been
+    seen the day/month order is unknown, so batches are held back (unparsed)
+    until a later timestamp settles it, instead of parsing them with a guess
+    and dropping the dates that don't fit.
+
+    System lines ("Messages are end-to-end encrypted", "X added Y") end the
+    previous message and are dropped, unless `include_system` is set, in which
+    case they are kept with user SYSTEM_USER.
+
+    Pass `chat_format` to skip sniffing, e.g. when parsing the appended tail
+    of an export whose format is already known.
+    """
+    lines, chat_format = open_stream(source, chunk_size, chat_format)
+    if chat_format is None:
+        return
+    yield from parse_lines(lines, chat_format, batch_size, include_system)
+
+
+@instrument("preprocess")
+def preprocess(data, include_system=False, chat_format=None, with_format=False):
+    """Parses a WhatsApp export (str, bytes or file-like) into a DataFrame.
+
+    With `with_format`, returns (df, chat_format): the format the parser used,
+    day/month order settled from the whole file (None if nothing matched).
+    """
+    lines, chat_format = open_stream(data, chat_format=chat_format)
+    batches = [
+        batch for batch in (parse_lines(lines, chat_format, include_system=include_system) if chat_format else ())
+        if not batch.empty
+    ]
+
+    # ✅ Return empty DataFrame if no valid messages are found
+    df = concat_frames(batches)
+    return (df, chat_format) if with_format else df
@@ -0,0 +1,67 @@
+import chat_cache
+
+# ✅ Session-scoped memoization of analysis results.
+# Every analysis in app.py goes through get_or_compute, keyed by
+# (upload hash, analysis name, parameters), so widget interactions reuse
+# earlier results instead of re-running parsing, sentiment, plots and LLM calls.
+# `store` is any mutable mapping; app.py passes st.session_state.
+RESULTS_KEY = "_analysis_results"
+UPLOAD_KEYS = "_upload_hashes"
+STATS_KEY = "_analysis_cache_stats"
+
+
+def upload_key(store, uploaded_file):
+    """Returns the content hash of an upload, hashing each distinct upload only once per session."""
+    file_id = getattr(uploaded_file, "file_id", None) or (
+        getattr(uploaded_file, "name", None), getattr(uploaded_file, "size", None)
+    )
+    hashes = store.setdefault(UPLOAD_KEYS, {})
+    if file_id not in hashes:
+        hashes[file_id] = chat_cache.hash_upload(uploaded_file)
+    return hashes[file_id]
+
+
+def _params_key(params):
+    return tuple(sorted(params.items()))
+
+
+def get_or_compute(store, upload_hash, analysis, compute, **params):
+    """Returns (result, cache_hit), running `compute(**params)` only on a miss."""
+    results = store.setdefault(RESULTS_KEY, {})
+    stats = store.setdefault(STATS_KEY, {"hits": 0, "misses": 0})
+    key = (upload_hash, analysis, _params_key(params))
+    if key in results:
+        stats["hits"] += 1
+        return results[key], True
+
+    stats["misses"] += 1
+    result = compute(**params)
+    results[key] = result
+    return result, False
+
+
+def put(store, upload_hash, analysis, result, **params):
+    """Stores a result computed elsewhere (e.g. by the analysis scheduler)."""
+    store.setdefault(RESULTS_KEY, {})[(upload_hash, analysis, _params_key(params))] = result
+
+
+def get(store, upload_hash, analysis, **params):
+    """Returns a cached result, or None when it has not been computed yet."""
+    return store.get(RESULTS_KEY, {}).get((upload_hash, analysis, _params_key(params)))
+
+
+def discard(store, upload_hash, analysis, **params):
+    """Removes one cached result, e.g. after a failed LLM call that should be retried."""
+    store.get(RESULTS_KEY, {}).pop((upload_hash, analysis, _params_key(params)), None)
+
+
+def forget_other_uploads(store, upload_hash):
+    """Drops results belonging to previous uploads so the session does not grow unbounded."""
+    results = store.get(RESULTS_KEY, {})
+    for key in [key for key in results if key[0] != upload_hash]:
+        del results[key]
+
+
+def cache_stats(store):
+    """Returns the session's hit/miss counters."""
+    return dict(store.get(STATS_KEY, {"hits": 0, "misses": 0}))
@@ -0,0 +1,168 @@
+import math
+import re
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import llm_client
+from telemetry import instrument
+
+# ✅ Per-chat BM25 retrieval index for the chatbot.
+# Messages are tokenized once into an inverted index (term -> postings of
+# message ids and term frequencies). New messages can be appended without a
+# rebuild, and a question only touches the postings of its own terms. Indexes
+# are kept per upload; a re-export that extends an indexed upload takes its
+# parent's index over and only indexes the appended messages.
+K1 = 1.5
+B = 0.75
+TOP_K = 20           # best-matching messages expanded into context windows
+WINDOW = 3           # messages of context kept on each side of a hit
+CONTEXT_TOKENS = 3_000
+MAX_INDEXES = 4      # upload indexes kept in memory, least recently used go first
+
+_TOKEN = re.compile(r"\w+")
+_indexes = OrderedDict()  # upload key (incremental.ChatState.key) -> ChatIndex
+_frame_indexes = {}       # id(df) -> (weakref to df, ChatIndex), for chats without an upload key
+_lock = threading.Lock()
+
+
+def tokenize(text):
+    return _TOKEN.findall(str(text).lower())
+
+
+class ChatIndex:
+    """Inverted BM25 index over the messages of one chat."""
+
+    def __init__(self):
+        self.postings = {}                 # term -> (array of doc ids, array of term frequencies)
+        self.doc_lengths = array("i")
+        self.timestamps = array("q")       # epoch nanoseconds, for date filters
+        self.user_codes = array("i")       # per-message code into self.users
+        self.users = {}                    # user name -> code
+        self.lines = []                    # "user: message", what gets sent to the model
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @instrument("retrieval_index")
+    def add(self, df):
+        """Appends the rows of `df` (date, user, message) to the index."""
+        if "date" in df.columns:
+            dates = pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[ns]").astype(np.int64).tolist()
+        else:
+            dates = [0] * len(df)
+        for timestamp, user, message in zip(dates, df["user"].astype(str), df["message"].astype(str)):
+            doc_id = len(self.doc_lengths)
+            tokens = tokenize(message)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for term, tf in counts.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = (array("i"), array("i"))
+                postings[0].append(doc_id)
+                postings[1].append(tf)
+            self.doc_lengths.append(len(tokens))
+            self.timestamps.append(int(timestamp))
+            self.user_codes.append(self.users.setdefault(user, len(self.users)))
+            self.lines.append(f"{user}: {message}")
+            self.total_length += len(tokens)
+        return self
+
+    def search(self, query, top_k=TOP_K, user=None, start=None, end=None):
+        """Returns up to `top_k` (doc id, score) pairs, best first, optionally filtered by user and [start, end)."""
+        n_docs = len(self)
+        if not n_docs:
+            return []
+        scores = np.zeros(n_docs)
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)
+        avg_length = max(self.total_length / n_docs, 1e-9)
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            docs = np.frombuffer(postings[0], dtype=np.int32)
+            tf = np.frombuffer(postings[1], dtype=np.int32).astype(float)
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = K1 * (1 - B + B * doc_lengths[docs] / avg_length)
+            scores[docs] += idf * tf * (K1 + 1) / (tf + norm)
+
+        candidates = np.flatnonzero((scores > 0) & self._filter_mask(user, start, end))
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k)[:top_k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(doc), float(scores[doc])) for doc in order]
+
+    def _filter_mask(self, user=None, start=None, end=None):
+        """Boolean mask of the messages sent by `user` within [start, end) (None: no restriction)."""
+        mask = np.ones(len(self), dtype=bool)
+        if user is not None:
+            mask &= np.frombuffer(self.user_codes, dtype=np.int32) == self.users.get(user, -1)
+        if start is not None or end is not None:
+            timestamps = np.frombuffer(self.timestamps, dtype=np.int64)
+            if start is not None:
+                mask &= timestamps >= pd.Timestamp(start).value
+            if end is not None:
+                mask &= timestamps < pd.Timestamp(end).value
+        return mask
+
+    def recent(self, count, user=None, start=None, end=None):
+        """Returns the last `count` chat lines that pass the user and date filters, in chronological order."""
+        docs = np.flatnonzero(self._filter_mask(user, start, end))[-count:]
+        return [self.lines[i] for i in docs]
+
+    def context(self, query, max_tokens=CONTEXT_TOKENS, window=WINDOW, **filters):
+        """Returns the chat lines around the best hits, in chronological order, within a token budget."""
+        selected, used = set(), 0
+        for doc, _ in self.search(query, **filters):
+            window_docs = [i for i in range(max(0, doc - window), min(len(self), doc + window + 1)) if i not in selected]
+            cost = sum(llm_client.estimate_tokens(self.lines[i]) for i in window_docs)
+            if used + cost > max_tokens:
+                if selected:
+                    break
+                continue
+            selected.update(window_docs)
+            used += cost
+        return [self.lines[i] for i in sorted(selected)]
+
+
+def get_index(df, key=None, parent=None):
+    """Returns the index of a parsed chat, built once per upload.
+
+    `key` identifies the upload (incremental.ChatState.key). When the upload
+    extends an indexed one (`parent`, ChatState.parent), the parent's index
+    is taken over and only the rows after it are added. Without a key the
+    index is kept per frame object.
+    """
+    if key is None:
+        return _frame_index(df)
+    with _lock:
+        index = _indexes.pop(key, None)
+        if index is None and parent is not None:
+            index = _indexes.pop(parent, None)  # the older export's index now serves the newer one
+        if index is None or len(index) > len(df):
+            index = ChatIndex()
+        if len(index) < len(df):
+            index.add(df.iloc[len(index):])
+        _indexes[key] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _frame_index(df):
+    key = id(df)
+    entry = _frame_indexes.get(key)
+    if entry is not None and entry[0]() is df and len(entry[1]) == len(df):
+        return entry[1]
+
+    index = ChatIndex().add(df)
+    _frame_indexes[key] = (weakref.ref(df, lambda _, key=key: _frame_indexes.pop(key, None)), index)
+    return index
@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+
+# ✅ Time/user rollup cube.
+# Built once per chat from integer-encoded timestamps and user codes: dense
+# arrays indexed [user, year-month, weekday, hour] holding message counts,
+# word counts and (optionally) sentiment score sums. Drill-down queries such
+# as "messages per hour for user X in 2023", weekday x hour heatmaps and
+# year-aware monthly timelines are sums over a slice of the cube and never
+# touch the message rows. Size: users x months x 168 cells per layer.
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def encode_times(dates):
+    """Returns (months since 1970-01, weekday with Monday = 0, hour) arrays for a datetime Series."""
+    minutes = dates.to_numpy("datetime64[m]")
+    months = minutes.astype("datetime64[M]").astype(np.int64)
+    weekdays = (minutes.astype("datetime64[D]").astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    hours = minutes.astype(np.int64) // 60 % 24
+    return months, weekdays, hours
+
+
+def month_label(month):
+    """"Jan 2023" for a month index counted from 1970-01."""
+    return f"{MONTH_NAMES[month % 12]} {1970 + month // 12}"
+
+
+class ChatRollup:
+    """Dense counters over user x year-month x weekday x hour for one chat."""
+
+    def __init__(self, users, first_month, counts, words, cells):
+        self.users = list(users)          # user code -> name
+        self.first_month = first_month    # months since 1970-01 of month index 0
+        self.counts = counts              # int32 [user, month, weekday, hour]
+        self.words = words                # int32, same shape
+        self.sentiment = None             # float64 sums of compound scores, once add_sentiment ran
+        self.cells = cells                # flat cube cell of every row (-1: no date), used to add per-row layers
+        self._codes = {user: code for code, user in enumerate(self.users)}
+        self._totals = {}
+
+    @property
+    def years(self):
+        if not self.counts.shape[1]:
+            return []
+        first, last = self.first_month // 12, (self.first_month + self.counts.shape[1] - 1) // 12
+        return [1970 + year for year in range(first, last + 1)]
+
+    def _slice(self, layer, user=None, year=None):
+        """Returns the `layer` cube for `user` (or all users summed) over the months of `year` (or all)."""
+        cube = getattr(self, layer)
+        if cube is None:
+            raise ValueError(f"no {layer} layer; call add_{layer} first")
+        if user is None:
+            if layer not in self._totals:
+                self._totals[layer] = cube.sum(axis=0)  # all-users marginal, computed once
+            cube = self._totals[layer]
+        else:
+            code = self._codes.get(user)
+            if code is None:
+                return np.zeros((0, 7, 24), dtype=cube.dtype)
+            cube = cube[code]
+        if year is not None and cube.shape[0]:
+            start = (year - 1970) * 12 - self.first_month
+            cube = cube[max(start, 0):max(start + 12, 0)]
+        return cube
+
+    def hourly(self, user=None, year=None):
+        """Messages per hour of the day (24 values)."""
+        return self._slice("counts", user, year).sum(axis=(0, 1))
+
+    def heatmap(self, user=None, year=None, layer="counts"):
+        """Weekday x hour matrix (7 x 24) of messages, or of "words" / "sentiment" sums."""
+        return self._slice(layer, user, year).sum(axis=0)
+
+    def month_of_year(self, user=None, year=None):
+        """Messages per calendar month, January first (12 values); all years summed unless `year` is given."""
+        per_month = self._slice("counts", user, year).sum(axis=(1, 2))
+        if not len(per_month):
+            return np.zeros(12, dtype=np.int64)
+        if year is not None:
+            start = (year - 1970) * 12 - self.first_month
+            result = np.zeros(12, dtype=np.int64)
+            offset = max(-start, 0)
+            result[offset:offset + len(per_month)] = per_month
+            return result
+        return np.bincount((self.first_month + np.arange(len(per_month))) % 12, weights=per_month,
+                           minlength=12).astype(np.int64)
+
+    def timeline(self, user=None, layer="counts"):
+        """[(\"Jan 2023\", value)] for every month from the first to the last message, gaps included."""
+        per_month = self._slice(layer, user).sum(axis=(1, 2))
+        return [(month_label(self.first_month + i), value.item()) for i, value in enumerate(per_month)]
+
+    def add_sentiment(self, scores):
+        """Adds the sentiment layer from one compound score per row of the chat the rollup was built from."""
+        scores = np.asarray(scores, dtype=np.float64)
+        if len(scores) != len(self.cells):
+            raise ValueError(f"expected {len(self.cells)} scores, got {len(scores)}")
+        dated = self.cells >= 0
+        self.sentiment = np.bincount(self.cells[dated], weights=scores[dated],
+                                     minlength=self.counts.size).reshape(self.counts.shape)
+        self._totals.pop("sentiment", None)
+        return self
+
+    def mean_sentiment(self, user=None, year=None):
+        """Average compound score per month as [(\"Jan 2023\", mean or None)], from the sentiment layer."""
+        sums = self._slice("sentiment", user, year).sum(axis=(1, 2))
+        counts = self._slice("counts", user, year).sum(axis=(1, 2))
+        start = 0 if year is None else max((year - 1970) * 12 - self.first_month, 0)
+        return [(month_label(self.first_month + start + i), float(s / n) if n else None)
+                for i, (s, n) in enumerate(zip(sums, counts))]
+
+    def merge(self, other):
+        """Returns the rollup of this chat followed by `other` (e.g. newly appended messages)."""
+        users = self.users + [user for user in other.users if user not in self._codes]
+        spans = [(r.first_month, r.first_month + r.counts.shape[1]) for r in (self, other) if r.counts.shape[1]]
+        first = min(start for start, _ in spans) if spans else None
+        shape = (len(users), (max(end for _, end in spans) - first) if spans else 0, 7, 24)
+        codes = {user: code for code, user in enumerate(users)}
+
+        def place(rollup, layer):
+            out = np.zeros(shape, dtype=layer.dtype)
+            if layer.shape[1]:
+                start = rollup.first_month - first
+                user_map = np.array([codes[user] for user in rollup.users], dtype=np.int64)
+                out[user_map, start:start + layer.shape[1]] = layer
+            return out
+
+        counts = place(self, self.counts) + place(other, other.counts)
+        words = place(self, self.words) + place(other, other.words)
+        cells = np.concatenate([self._remap_cells(codes, first, shape), other._remap_cells(codes, first, shape)])
+        merged = ChatRollup(users, first, counts, words, cells)
+        if self.sentiment is not None and other.sentiment is not None:
+            merged.sentiment = place(self, self.sentiment) + place(other, other.sentiment)
+        return merged
+
+    def _remap_cells(self, codes, first, shape):
+        cells = self.cells.copy()
+        dated = cells >= 0
+        if dated.any():
+            user_codes, months, weekdays, hours = np.unravel_index(cells[dated], self.counts.shape)
+            user_map = np.array([codes[user] for user in self.users], dtype=np.int64)
+            cells[dated] = np.ravel_multi_index(
+                (user_map[user_codes], months + self.first_month - first, weekdays, hours), shape)
+        return cells
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_totals"] = {}  # derived; recomputed on first use
+        return state
+
+
+def build_rollup(df, word_counts=None):
+    """Builds the ChatRollup of a parsed chat; `word_counts` holds the words of each row, if known."""
+    users, user_codes = [], np.zeros(len(df), dtype=np.int64)
+    if "user" in df.columns and len(df):
+        user_codes, uniques = pd.factorize(df["user"], use_na_sentinel=False)
+        users = [str(user) for user in uniques]
+
+    if "date" not in df.columns or not len(df):
+        empty = np.zeros((len(users), 0, 7, 24), dtype=np.int32)
+        return ChatRollup(users, None, empty, empty.copy(), np.full(len(df), -1, dtype=np.int64))
+
+    dated = df["date"].notna().to_numpy()
+    months, weekdays, hours = encode_times(df["date"].fillna(pd.Timestamp(0)))
+    first = int(months[dated].min()) if dated.any() else 0
+    shape = (len(users), (int(months[dated].max()) - first + 1) if dated.any() else 0, 7, 24)
+
+    cells = np.full(len(df), -1, dtype=np.int64)
+    if dated.any():
+        cells[dated] = np.ravel_multi_index(
+            (user_codes[dated], months[dated] - first, weekdays[dated], hours[dated]), shape)
+    size = int(np.prod(shape))
+    counts = np.bincount(cells[dated], minlength=size).astype(np.int32).reshape(shape)
+    if word_counts is None:
+        word_counts = df["message"].fillna("").astype(str).str.split().str.len().to_numpy()
+    words = np.bincount(cells[dated], weights=np.asarray(word_counts)[dated],
+                        minlength=size).astype(np.int32).reshape(shape)
+    return ChatRollup(users, first, counts, words, cells)
@@ -0,0 +1,186 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+# ✅ Dependency-aware analysis scheduler.
+# Each stage declares the named inputs it needs ("df", "sentiment", ...). Stages
+# whose inputs are ready run concurrently; results are yielded in completion
+# order so the page can render each section as soon as it is done. Stages
+# sharing a `lock` name (e.g. everything rendering with matplotlib)
+# never run at the same time. A stage's timeout counts from the moment it
+# starts running, not while it waits for a worker or its lock.
+DEFAULT_TIMEOUT = 300  # seconds
+QUEUE_POLL = 0.5       # seconds between deadline checks while a submitted stage has not started yet
+
+
+class Stage:
+    """One analysis step: `func(*inputs)` produces the value published under `name`."""
+
+    def __init__(self, name, func, inputs=("df",), timeout=DEFAULT_TIMEOUT, lock=None, process=False):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.timeout = timeout
+        self.lock = lock          # stages with the same lock name run one at a time
+        self.process = process    # run on the process pool (func and inputs must be picklable)
+
+
+class StageResult:
+    """Outcome of a stage: `value` on success, otherwise `error` (an exception)."""
+
+    def __init__(self, name, value=None, error=None, elapsed=0.0):
+        self.name = name
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class StageSkipped(RuntimeError):
+    """A stage did not run because one of its inputs failed or the run was cancelled."""
+
+
+_stop = contextvars.ContextVar("stage_stop", default=None)  # Event set when the running stage is abandoned
+
+
+def raise_if_cancelled():
+    """Raises StageSkipped inside a stage that timed out or whose run was cancelled.
+
+    Threads can't be killed, so long stages call this between units of work
+    (llm_client does before every request) to stop instead of running on.
+    Outside a scheduled stage it does nothing.
+    """
+    stop = _stop.get()
+    if stop is not None and stop.is_set():
+        raise StageSkipped("stage cancelled")
+
+
+class AnalysisScheduler:
+    """Runs a set of stages over thread (and optionally process) pools."""
+
+    def __init__(self, stages, max_workers=6, max_processes=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+        self.max_processes = max_processes
+        self._cancelled = threading.Event()
+        self._locks = {stage.lock: threading.Lock() for stage in stages if stage.lock}
+        self._stops = {stage.name: threading.Event() for stage in stages}
+        self._started = {}  # stage name -> monotonic time it started running
+
+    def cancel(self):
+        """Stops scheduling new stages and tells running ones to stop at their next raise_if_cancelled()."""
+        self._cancelled.set()
+        for stop in self._stops.values():
+            stop.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _call(self, stage, args):
+        _stop.set(self._stops[stage.name])  # runs in its own copy of the caller's context (see run)
+        if stage.lock:
+            with self._locks[stage.lock]:
+                return self._start(stage, args)
+        return self._start(stage, args)
+
+    def _start(self, stage, args):
+        if self._stops[stage.name].is_set():
+            raise StageSkipped(f"{stage.name} cancelled")
+        self._started[stage.name] = time.monotonic()
+        return stage.func(*args)
+
+    def _deadline(self, stage):
+        """When a running stage times out, or None while it waits for a worker or its lock."""
+        started = self._started.get(stage.name)
+        return None if started is None else started + stage.timeout
+
+    def run(self, inputs):
+        """Yields a StageResult for every stage, in completion order.
+
+        `inputs` maps initial input names (e.g. "df") to values. Stages that
+        exceed their timeout (counted from when they start running; process
+        stages from submission) are reported with a TimeoutError; stages that
+        depend on a failed stage are reported with StageSkipped.
+        """
+        values = dict(inputs)
+        failed = set()
+        pending = dict(self.stages)
+        running = {}  # future -> (stage, submitted)
+
+        threads = ThreadPoolExecutor(max_workers=self.max_workers)
+        processes = None
+        try:
+            while pending or running:
+                if self.cancelled:
+                    for future in running:
+                        future.cancel()
+                    for name in list(pending) + [stage.name for stage, _ in running.values()]:
+                        yield StageResult(name, error=StageSkipped(f"{name} cancelled"))
+                    return
+
+                for name, stage in list(pending.items()):
+                    if any(dep in failed for dep in stage.inputs):
+                        del pending[name]
+                        failed.add(name)
+                        yield StageResult(name, error=StageSkipped(f"{name} skipped: an input failed"))
+                    elif all(dep in values for dep in stage.inputs):
+                        del pending[name]
+                        args = [values[dep] for dep in stage.inputs]
+                        submitted = time.monotonic()
+                        if stage.process:
+                            processes = processes or ProcessPoolExecutor(max_workers=self.max_processes)
+                            future = processes.submit(stage.func, *args)
+                            self._started[name] = submitted
+                        else:
+                            # A context copy per stage: session settings (e.g. profiling) carry over, stage state doesn't
+                            future = threads.submit(contextvars.copy_context().run, self._call, stage, args)
+                        running[future] = (stage, submitted)
+
+                if not running:
+                    if pending:  # inputs that no stage produces
+                        for name in list(pending):
+                            failed.add(name)
+                            yield StageResult(name, error=StageSkipped(f"{name} skipped: missing inputs"))
+                        pending.clear()
+                    continue
+
+                now = time.monotonic()
+                deadlines = [self._deadline(stage) for stage, _ in running.values()]
+                timeout = min([deadline - now for deadline in deadlines if deadline is not None], default=None)
+                if None in deadlines:  # a queued stage may start (and start its clock) at any moment
+                    timeout = QUEUE_POLL if timeout is None else min(timeout, QUEUE_POLL)
+                done, _ = wait(list(running), timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+
+                now = time.monotonic()
+                for future in list(running):
+                    stage, submitted = running[future]
+                    started = self._started.get(stage.name, submitted)
+                    deadline = self._deadline(stage)
+                    if future in done:
+                        del running[future]
+                        error = future.exception()
+                        if error is None:
+                            values[stage.name] = future.result()
+                            yield StageResult(stage.name, value=values[stage.name], elapsed=now - started)
+                        else:
+                            failed.add(stage.name)
+                            yield StageResult(stage.name, error=error, elapsed=now - started)
+                    elif deadline is not None and now >= deadline:
+                        del running[future]
+                        future.cancel()
+                        self._stops[stage.name].set()
+                        failed.add(stage.name)
+                        yield StageResult(stage.name, error=TimeoutError(f"{stage.name} timed out after {stage.timeout}s"),
+                                          elapsed=now - started)
+        finally:
+            # Don't block on abandoned (timed out / cancelled) work; ask it to stop instead.
+            for stage, _ in running.values():
+                self._stops[stage.name].set()
+            threads.shutdown(wait=False, cancel_futures=True)
+            if processes:
+                processes.shutdown(wait=False, cancel_futures=True)
@@ -1,51 +1,179 @@
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-from nltk.sentiment import SentimentIntensityAnalyzer
-import nltk
+import numpy as np
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-nltk.download('vader_lexicon')
+from charts import chart_image
+from telemetry import instrument
 
-sia = SentimentIntensityAnalyzer()
+# ✅ VADER is loaded on first use from the lexicon bundled with the repo
+# (nltk_data/sentiment/vader_lexicon.zip), so importing this module never
+# touches the network (no nltk.download).
+NLTK_DATA = os.getenv("CHAT_ANALYZER_NLTK_DATA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "nltk_data"))
+_analyzer = None
+_analyzer_lock = threading.Lock()
 
-def analyze_sentiment(df):
+# ✅ Batch scoring settings
+MEMO_PATH = os.getenv("CHAT_ANALYZER_SENTIMENT_MEMO", os.path.join(".cache", "sentiment_memo.sqlite"))
+MEMO_VERSION = 2              # bump when the scorer changes so old memo rows are ignored
+MEMO_MAX_ROWS = int(os.getenv("CHAT_ANALYZER_SENTIMENT_MEMO_MAX_ROWS", 500_000))  # ~45 MB; least recently used go first
+_DAY = 24 * 3600              # last-use stamps are refreshed at most once a day per row
+PARALLEL_THRESHOLD = 20_000   # distinct unscored texts before fanning out to a process pool
+WORKER_CHUNK = 5_000          # texts per process-pool task
+_SQL_CHUNK = 500              # bound parameters per memo lookup
+
+# ✅ Expanded Sentiment Categories, as (-inf, -0.6], (-0.6, -0.2], (-0.2, 0.2], (0.2, 0.6], (0.6, inf)
+SENTIMENT_BINS = [-np.inf, -0.6, -0.2, 0.2, 0.6, np.inf]
+SENTIMENT_LABELS = ["Very Negative", "Negative", "Neutral", "Positive", "Very Positive"]
+
+def get_analyzer():
+    """Returns the VADER analyzer, built once per process.
+
+    The bundled lexicon is searched first, then any nltk_data directory already
+    installed on the machine.
+    """
+    global _analyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            import nltk
+            from nltk.sentiment import SentimentIntensityAnalyzer
+
+            if NLTK_DATA not in nltk.data.path:
+                nltk.data.path.insert(0, NLTK_DATA)
+            _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+
+def _score_chunk(texts):
+    """Scores a list of texts with VADER (also the process-pool task, so it must stay top-level)."""
+    polarity_scores = get_analyzer().polarity_scores
+    return [polarity_scores(text)['compound'] for text in texts]
+
+
+def _text_key(text):
+    """Memo key of a message: a 128-bit hash, so message text is never written to disk."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _open_memo(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)  # several batch workers may write at once
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'scores'").fetchone():
+        # Older memos were keyed by the raw message text: drop them and reclaim the pages holding it
+        conn.execute("DROP TABLE scores")
+        conn.execute("VACUUM")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS memo (key BLOB, version INTEGER, score REAL, used REAL, PRIMARY KEY (key, version))"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS memo_used ON memo (used)")
+    return conn
+
+
+def _memo_lookup(conn, keys):
+    """Returns {key: score} of the memoized keys, refreshing the last-use stamp of rows not used today."""
+    found, stale = {}, []
+    now = time.time()
+    for start in range(0, len(keys), _SQL_CHUNK):
+        chunk = keys[start:start + _SQL_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT key, score, used FROM memo WHERE version = ? AND key IN ({placeholders})",
+            [MEMO_VERSION, *chunk],
+        )
+        for key, score, used in rows:
+            found[key] = score
+            if used < now - _DAY:
+                stale.append((now, key, MEMO_VERSION))
+    if stale:
+        with conn:
+            conn.executemany("UPDATE memo SET used = ? WHERE key = ? AND version = ?", stale)
+    return found
+
+
+def _memo_evict(conn, max_rows=MEMO_MAX_ROWS):
+    """Deletes rows of older scorer versions, then the least recently used rows above `max_rows`."""
+    with conn:
+        conn.execute("DELETE FROM memo WHERE version != ?", (MEMO_VERSION,))
+        excess = conn.execute("SELECT COUNT(*) FROM memo").fetchone()[0] - max_rows
+        if excess > 0:
+            conn.execute("DELETE FROM memo WHERE rowid IN (SELECT rowid FROM memo ORDER BY used LIMIT ?)", (excess,))
+
+
+def score_texts(texts, memo_path=MEMO_PATH, max_workers=None):
+    """Returns VADER compound scores for a list of distinct texts.
+
+    Scores already in the persistent memo are reused; the rest are computed
+    (on a process pool for large batches) and written back to the memo, which
+    keeps at most MEMO_MAX_ROWS hashed texts. Pass memo_path=None to skip the memo.
+    """
+    conn = _open_memo(memo_path) if memo_path else None
+    try:
+        keys = [_text_key(text) for text in texts] if conn else texts
+        memo = _memo_lookup(conn, keys) if conn else {}
+        scores = {text: memo[key] for text, key in zip(texts, keys) if key in memo}
+        missing = [(text, key) for text, key in zip(texts, keys) if key not in memo]
+        missing, missing_keys = [text for text, _ in missing], [key for _, key in missing]
+
+        if len(missing) >= PARALLEL_THRESHOLD:
+            chunks = [missing[i:i + WORKER_CHUNK] for i in range(0, len(missing), WORKER_CHUNK)]
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                computed = [score for chunk_scores in pool.map(_score_chunk, chunks) for score in chunk_scores]
+        else:
+            computed = _score_chunk(missing)
+
+        scores.update(zip(missing, computed))
+        if conn and missing:
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO memo (key, version, score, used) VALUES (?, ?, ?, ?)",
+                    [(key, MEMO_VERSION, score, now) for key, score in zip(missing_keys, computed)],
+                )
+            _memo_evict(conn)
+    finally:
+        if conn:
+            conn.close()
+    return [scores[text] for text in texts]
+
+
+def categorize_scores(scores):
+    """Buckets compound scores into the five sentiment categories in one vectorized pass."""
+    return pd.cut(scores, bins=SENTIMENT_BINS, labels=SENTIMENT_LABELS, right=True)
+
+
+@instrument("analyze_sentiment")
+def analyze_sentiment(df, memo_path=MEMO_PATH):
     """Analyzes sentiment of each message and classifies it into categories."""
     if 'message' not in df.columns or df.empty:
         return df
 
-    # Compute sentiment scores
-    df['sentiment_score'] = df['message'].apply(lambda msg: sia.polarity_scores(str(msg))['compound'])
-
-    # ✅ Expanded Sentiment Categories
-    def categorize_sentiment(score):
-        if score <= -0.6:
-            return "Very Negative"
-        elif -0.6 < score <= -0.2:
-            return "Negative"
-        elif -0.2 < score <= 0.2:
-            return "Neutral"
-        elif 0.2 < score <= 0.6:
-            return "Positive"
-        else:
-            return "Very Positive"
+    # ✅ Score each distinct message text only once ("ok", "😂", "<Media omitted>" repeat a lot);
+    # the column is factorized as stored, and only the distinct texts become Python strings for VADER
+    codes, uniques = pd.factorize(df['message'])
+    unique_scores = np.asarray(score_texts(list(uniques), memo_path=memo_path), dtype=float)
+    df['sentiment_score'] = np.append(unique_scores, 0.0)[codes]  # code -1 (missing message) scores neutral
 
-    df['sentiment_category'] = df['sentiment_score'].apply(categorize_sentiment)
+    df['sentiment_category'] = categorize_scores(df['sentiment_score'])
     return df  # ✅ Returns the DataFrame with sentiment labels
 
+@instrument("plot_sentiment_distribution")
 def plot_sentiment_distribution(df):
-    """Creates a bar graph for sentiment distribution."""
+    """Creates a bar graph for sentiment distribution; returns it as PNG bytes."""
     if df.empty or 'sentiment_category' not in df.columns:
         return None
 
+    # ✅ Drawn from the five category counts, in category order
     sentiment_counts = df['sentiment_category'].value_counts()
+    return plot_sentiment_counts([(label, int(sentiment_counts.get(label, 0))) for label in SENTIMENT_LABELS])
 
-    fig, ax = plt.subplots(figsize=(5, 4))  # ✅ Keep graph small
-    sns.barplot(x=sentiment_counts.index, y=sentiment_counts.values, palette="coolwarm", ax=ax)
-
-    ax.set_xlabel("Sentiment Category", fontsize=10, labelpad=10)  # ✅ Adjust font and padding
-    ax.set_ylabel("Message Count", fontsize=10, labelpad=10)
-    ax.set_title("📊 Sentiment Distribution", fontsize=12)
-
-    ax.set_xticklabels(ax.get_xticklabels(), rotation=20, ha='right', fontsize=9)  # ✅ Rotate to avoid overlap
-
-    return fig  # ✅ Returns the figure for Streamlit
+def plot_sentiment_counts(counts):
+    """Bar graph of [(category, messages)] counts (e.g. from incremental.sentiment_counts); PNG bytes."""
+    if not any(count for _, count in counts):
+        return None
+    return chart_image("sentiment", list(counts))
@@ -1,33 +1,82 @@
-import google.generativeai as genai
-import os
-from dotenv import load_dotenv
-
-# ✅ Load API key securely from .env
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+import llm_client
+from preprocessor import media_mask
+from telemetry import instrument
 
 # ✅ Correct Gemini model name
 GEMINI_MODEL = "gemini-1.5-pro"
+PROMPT_TEMPLATE = "summary/3"  # bump when a prompt changes, so cached responses are not reused
+
+# ✅ Hierarchical map-reduce summarization settings
+SEGMENT_TOKENS = 6_000   # chat tokens per first-level segment
+REDUCE_TOKENS = 6_000    # partial-summary tokens combined per reduce step
+SEGMENT_WORDS = 120      # length of each partial summary
+
+def _summarize_groups(lines, build_prompt, max_tokens, level):
+    """Summarizes consecutive token-bounded groups of lines concurrently, one summary per group.
 
+    Over-long answers are clipped so every reduce step is guaranteed to shrink the list.
+    """
+    return [
+        " ".join(summary.split()[:2 * SEGMENT_WORDS])
+        for summary in llm_client.map_chunks(
+            lines, build_prompt, model=GEMINI_MODEL, max_tokens=max_tokens,
+            template=f"{PROMPT_TEMPLATE}/level{level}",
+        )
+    ]
+
+@instrument("summarize_chat")
 def summarize_chat(df, max_words=250):
-    """Summarizes a given WhatsApp chat using Gemini API (limits summary to 250 words)."""
+    """Summarizes a given WhatsApp chat using Gemini API (limits summary to 250 words).
+
+    The whole chat is covered: it is split into token-bounded segments that are
+    summarized in parallel (map), then the partial summaries are combined
+    recursively (reduce) into the final summary. Segments are cut from the
+    start of the chat and every call goes through the LLM response cache, so
+    after new messages are appended only the tail segments are re-summarized.
+    """
     
     if df.empty or "message" not in df.columns:
         return "No chat data available for summarization."
     
-    # ✅ Remove "<Media omitted>" messages
-    chat_text = " ".join(df["message"].dropna())
-    chat_text = chat_text.replace("<Media omitted>", "")
-
-    # ✅ Limit input size for API efficiency
-    chat_text = chat_text[:6000]  
+    # ✅ Remove "<Media omitted>" messages (the parser's is_media flag); each line is "date user: message"
+    rows = df.loc[~media_mask(df), [column for column in ("date", "user", "message") if column in df.columns]]
+    rows = rows.dropna(subset=["message"])
+    chat_lines = rows["message"].astype(str)
+    if "user" in rows.columns:
+        chat_lines = rows["user"].astype(str) + ": " + chat_lines
+    if "date" in rows.columns:
+        chat_lines = rows["date"].dt.strftime("%Y-%m-%d %H:%M") + " " + chat_lines
+    chat_lines = chat_lines.tolist()
+    if not chat_lines:
+        return "No chat data available for summarization."
 
     try:
-        model = genai.GenerativeModel(GEMINI_MODEL)
-        response = model.generate_content(f"Summarize the following chat in {max_words} words:\n\n{chat_text}")
+        # Map: summarize every segment of the chat
+        partials = _summarize_groups(
+            chat_lines,
+            lambda segment: f"Summarize this part of a WhatsApp chat in at most {SEGMENT_WORDS} words, "
+                            f"keeping names, topics, decisions and dates:\n\n{segment}",
+            SEGMENT_TOKENS, level=0,
+        )
+
+        # Reduce: merge partial summaries until a single one is left
+        level = 1
+        while len(partials) > 1:
+            partials = _summarize_groups(
+                partials,
+                lambda summaries: f"Combine these consecutive summaries of one WhatsApp chat into a single summary "
+                                  f"of at most {SEGMENT_WORDS} words, in chronological order:\n\n{summaries}",
+                REDUCE_TOKENS, level=level,
+            )
+            level += 1
+
+        response = llm_client.generate(
+            f"Summarize the following chat in {max_words} words:\n\n{partials[0]}",
+            model=GEMINI_MODEL, template=f"{PROMPT_TEMPLATE}/final",
+        )
         
         # ✅ Extract and trim summary if it exceeds the word limit
-        summary = response.text.strip()
+        summary = response.strip()
         if len(summary.split()) > max_words:
             summary = " ".join(summary.split()[:max_words])  
 
@@ -0,0 +1,207 @@
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    import resource
+except ImportError:  # ✅ Windows: peak memory is simply not reported
+    resource = None
+
+# ✅ Lightweight per-stage instrumentation.
+# Analysis entry points are wrapped with @instrument("stage"). Every call
+# records wall time, CPU time of the calling thread, growth of the process's
+# peak RSS, rows processed and the LLM requests/tokens/retries/cache hits made
+# by the call itself. LLM usage is counted per call through a context
+# variable, so stages running concurrently are not charged for each other's
+# requests. Records stay in memory (bounded) and can be exported as JSON
+# lines or Prometheus text. Set CHAT_ANALYZER_PROFILE=1 (or call
+# set_profiling(True) in one context, e.g. one Streamlit session's run) to
+# also capture a cProfile of each top-level stage call.
+MAX_RECORDS = 1_000
+PROFILE = os.getenv("CHAT_ANALYZER_PROFILE", "0") == "1"  # process-wide default; set_profiling overrides it
+PROFILE_DIR = os.getenv("CHAT_ANALYZER_PROFILE_DIR", os.path.join(".cache", "profiles"))
+PROFILE_LINES = 25   # functions kept in the text summary of a profile
+
+LLM_COUNTERS = ("requests", "retries", "reasks", "failures", "prompt_tokens", "output_tokens")
+
+records = deque(maxlen=MAX_RECORDS)
+_lock = threading.Lock()
+_active = contextvars.ContextVar("telemetry_active", default=())  # LLM counters of the enclosing stage calls
+_profiling = contextvars.ContextVar("telemetry_profiling", default=None)
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB elsewhere
+
+
+def set_profiling(enabled):
+    """Turns cProfile capture on or off for stages called from the current context only.
+
+    The app calls this at the start of every script run, so one session's
+    checkbox never profiles another session's stages. Context copies made
+    afterwards (scheduler stages, LLM chunk threads) inherit the setting.
+    """
+    _profiling.set(bool(enabled))
+
+
+def profiling():
+    """Whether stages called from the current context capture a cProfile."""
+    enabled = _profiling.get()
+    return PROFILE if enabled is None else enabled
+
+
+def count_llm(**counts):
+    """Adds LLM usage (requests, prompt_tokens, cache_hits, ...) to every stage call running in this context.
+
+    Called by llm_client and llm_cache; threads they fan out to run in a copy
+    of the caller's context, so their usage reaches the same stage.
+    """
+    active = _active.get()
+    if not active:
+        return
+    with _lock:
+        for counters in active:
+            for name, value in counts.items():
+                counters[name] = counters.get(name, 0) + value
+
+
+def _rows(args, result):
+    for value in (result, *args[:1]):
+        if hasattr(value, "columns") and hasattr(value, "__len__"):  # a DataFrame
+            return len(value)
+    return None
+
+
+def _profile_summary(profiler, stage):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{stage}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}.prof")
+    profiler.dump_stats(path)
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return path, text.getvalue()
+
+
+def instrument(stage):
+    """Decorator recording one telemetry record per call of the wrapped function under `stage`."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            active = _active.get()
+            depth = len(active)
+            profiler = cProfile.Profile() if depth == 0 and profiling() else None  # only outermost stages
+            llm = dict.fromkeys((*LLM_COUNTERS, "cache_hits"), 0)
+            token = _active.set((*active, llm))
+            rss_before = _peak_rss_mb()
+            cpu_start = time.thread_time()
+            start = time.perf_counter()
+            error, result = None, None
+            try:
+                if profiler:
+                    profiler.enable()
+                result = func(*args, **kwargs)
+                return result
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                if profiler:
+                    profiler.disable()
+                _active.reset(token)
+                record = {
+                    "stage": stage,
+                    "started": time.time() - (time.perf_counter() - start),
+                    "wall_seconds": round(time.perf_counter() - start, 6),
+                    "cpu_seconds": round(time.thread_time() - cpu_start, 6),
+                    "peak_rss_delta_mb": None,
+                    "rows": _rows(args, result),
+                    "nested": depth > 0,
+                    "error": error,
+                }
+                rss_after = _peak_rss_mb()
+                if rss_before is not None:
+                    record["peak_rss_delta_mb"] = round(rss_after - rss_before, 2)
+                with _lock:
+                    record.update({f"llm_{name}": value for name, value in llm.items()})
+                if profiler:
+                    record["profile_path"], record["profile"] = _profile_summary(profiler, stage)
+                with _lock:
+                    records.append(record)
+        return wrapper
+    return decorate
+
+
+def get_records(stage=None):
+    """Returns a copy of the recorded calls, oldest first (optionally of one stage)."""
+    with _lock:
+        return [dict(record) for record in records if stage is None or record["stage"] == stage]
+
+
+def clear():
+    with _lock:
+        records.clear()
+
+
+def summary():
+    """Returns per-stage totals: calls, errors, wall/CPU seconds, rows and LLM counters."""
+    totals = {}
+    for record in get_records():
+        total = totals.setdefault(record["stage"], {"calls": 0, "errors": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                                    "max_wall_seconds": 0.0, "rows": 0, "peak_rss_delta_mb": 0.0})
+        total["calls"] += 1
+        total["errors"] += record["error"] is not None
+        total["wall_seconds"] += record["wall_seconds"]
+        total["cpu_seconds"] += record["cpu_seconds"]
+        total["max_wall_seconds"] = max(total["max_wall_seconds"], record["wall_seconds"])
+        total["rows"] += record["rows"] or 0
+        total["peak_rss_delta_mb"] += record["peak_rss_delta_mb"] or 0.0
+        for name, value in record.items():
+            if name.startswith("llm_"):
+                total[name] = total.get(name, 0) + value
+    return totals
+
+
+def to_jsonl(path=None):
+    """Returns the records as JSON lines (without profile text), also writing them to `path` if given."""
+    text = "".join(json.dumps({k: v for k, v in record.items() if k != "profile"}) + "\n" for record in get_records())
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return text
+
+
+def to_prometheus(prefix="chat_analyzer"):
+    """Returns the per-stage totals in the Prometheus text exposition format."""
+    metrics = {
+        "calls": ("stage_calls_total", "counter", "Calls of the analysis stage"),
+        "errors": ("stage_errors_total", "counter", "Calls that raised an exception"),
+        "wall_seconds": ("stage_wall_seconds_total", "counter", "Wall-clock time spent in the stage"),
+        "cpu_seconds": ("stage_cpu_seconds_total", "counter", "CPU time of the calling thread spent in the stage"),
+        "max_wall_seconds": ("stage_max_wall_seconds", "gauge", "Slowest single call of the stage"),
+        "rows": ("stage_rows_total", "counter", "Chat rows processed by the stage"),
+        "peak_rss_delta_mb": ("stage_peak_rss_growth_megabytes_total", "counter", "Growth of the process peak RSS"),
+    }
+    metrics.update({f"llm_{name}": (f"stage_llm_{name}_total", "counter", f"LLM {name.replace('_', ' ')} made by the stage")
+                    for name in LLM_COUNTERS})
+    metrics["llm_cache_hits"] = ("stage_llm_cache_hits_total", "counter", "LLM responses served from the cache")
+
+    totals = summary()
+    lines = []
+    for key, (name, kind, help_text) in metrics.items():
+        samples = [(stage, total[key]) for stage, total in sorted(totals.items()) if key in total]
+        if not samples:
+            continue
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        lines.extend(f'{prefix}_{name}{{stage="{stage}"}} {value:g}' for stage, value in samples)
+    return "\n".join(lines) + "\n"
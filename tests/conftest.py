@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules live flat in the repository root (and the synthetic chat generator in benchmarks/)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
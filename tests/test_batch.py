@@ -0,0 +1,50 @@
+import json
+import os
+
+import batch
+import synth_chat
+
+
+def _write_manifest(out_dir, lines):
+    with open(os.path.join(out_dir, batch.MANIFEST), "w", encoding="utf-8") as f:
+        f.write("".join(lines))
+
+
+def test_load_manifest_keeps_the_last_outcome_per_file(tmp_path):
+    _write_manifest(tmp_path, [
+        json.dumps({"path": "a.txt", "status": "ok"}) + "\n",
+        json.dumps({"path": "b.txt", "status": "ok"}) + "\n",
+        json.dumps({"path": "b.txt", "status": "error", "error": "boom"}) + "\n",  # re-run failed: analyze again
+        json.dumps({"path": "c.txt", "status": "error", "error": "boom"}) + "\n",
+        json.dumps({"path": "c.txt", "status": "ok"}) + "\n",
+        '{"path": "d.txt", "sta',  # cut short by an interrupted run
+    ])
+    assert sorted(batch.load_manifest(tmp_path)) == ["a.txt", "c.txt"]
+
+
+def test_load_manifest_without_a_manifest(tmp_path):
+    assert batch.load_manifest(tmp_path) == {}
+
+
+def test_run_resumes_from_the_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the sentiment memo and forwards store default to ./.cache
+    export = tmp_path / "chat.txt"
+    export.write_text(synth_chat.generate_text(200, seed=4), encoding="utf-8")
+    out_dir = tmp_path / "results"
+    logs = []
+
+    table = batch.run([str(export)], str(out_dir), workers=1, moderation_engine="local", log=logs.append)
+    assert len(table) == 1
+    entry = batch.load_manifest(out_dir)[str(export)]
+    assert entry["status"] == "ok"
+    assert os.path.exists(out_dir / entry["result"])
+
+    logs.clear()
+    batch.run([str(export)], str(out_dir), workers=1, moderation_engine="local", log=logs.append)
+    assert logs[0] == "1 exports, 1 already done, 0 to analyze"
+
+    # A changed file no longer matches its manifest entry and is analysed again
+    os.utime(export, ns=(entry["mtime"] + 10 ** 9, entry["mtime"] + 10 ** 9))
+    logs.clear()
+    batch.run([str(export)], str(out_dir), workers=1, moderation_engine="local", log=logs.append)
+    assert logs[0] == "1 exports, 0 already done, 1 to analyze"
@@ -0,0 +1,85 @@
+import chat_formats
+import preprocessor
+
+
+def _android(days, month=3, start=0):
+    """Android lines "DD/MM/23, HH:MM - user: message" for each day in `days` (day written first)."""
+    return [f"{day:02d}/{month:02d}/23, {10 + i // 60 % 10:02d}:{i % 60:02d} - User {i % 3}: message {i}"
+            for i, day in enumerate(days, start)]
+
+
+def test_date_order():
+    assert chat_formats.date_order(["03/04/23 10:00"]) is None
+    assert chat_formats.date_order(["03/04/23 10:00", "13/04/23 10:00"]) == "day"
+    assert chat_formats.date_order(["04/13/23 10:00"]) == "month"
+    assert chat_formats.date_order(["13/14/23 10:00"]) == "month"  # impossible either way: keep month-first
+    assert chat_formats.date_order(["13.04.23 10:00"], sep=".") == "day"
+
+
+def test_sniff_format_day_above_12():
+    chat_format = chat_formats.sniff_format(_android([1, 2, 13]))
+    assert chat_format.name == "android"
+    assert chat_format.date_format == "%d/%m/%y %H:%M"
+    assert not chat_format.ambiguous
+
+
+def test_sniff_format_ambiguous_window():
+    chat_format = chat_formats.sniff_format(_android([1, 2, 3]))
+    assert chat_format.ambiguous
+    assert chat_format.date_format.startswith("%m/%d/")
+
+
+def test_sniff_format_ios():
+    lines = ["[31/12/20, 22:15:01] Ana: hi", "[01/01/21, 00:00:05] Ben: happy new year"]
+    chat_format = chat_formats.sniff_format(lines)
+    assert chat_format.name == "ios"
+    assert chat_format.date_format == "%d/%m/%y %H:%M:%S"
+
+
+def test_day_order_settled_after_the_sniff_window():
+    # Every day in the sniffed lines is 12 or less; the first day above 12 comes much later
+    days = [1 + i // 60 for i in range(chat_formats.SNIFF_LINES + 600)]  # days 1 .. 12, then 13 .. 15
+    text = "\n".join(_android(days))
+    df, chat_format = preprocessor.preprocess(text, with_format=True)
+    assert not chat_format.ambiguous
+    assert chat_format.date_format.startswith("%d/%m/")
+    assert len(df) == len(days)
+    assert (df["date"].dt.month == 3).all()
+    assert df["date"].dt.day.tolist() == days
+
+
+def test_month_order_settled_after_the_sniff_window():
+    lines = [f"02/01/23, 10:{i % 60:02d} - User 0: message {i}" for i in range(chat_formats.SNIFF_LINES)]
+    lines.append("02/20/23, 11:00 - User 0: later")
+    df, chat_format = preprocessor.preprocess("\n".join(lines), with_format=True)
+    assert chat_format.date_format.startswith("%m/%d/")
+    assert (df["date"].dt.month == 2).all()
+    assert df["date"].iloc[-1].day == 20
+
+
+def test_fully_ambiguous_chat_stays_month_first():
+    df, chat_format = preprocessor.preprocess("\n".join(_android([1, 2, 3, 4])), with_format=True)
+    assert chat_format.ambiguous
+    assert df["date"].dt.month.tolist() == [1, 2, 3, 4]
+    assert (df["date"].dt.day == 3).all()
+
+
+def test_ios_media_placeholders():
+    lines = [
+        "[31/12/20, 22:15:01] Ana: ‎image omitted",
+        "[31/12/20, 22:15:02] Ben: ‎video omitted",
+        "[31/12/20, 22:15:03] Ana: ‎sticker omitted",
+        "[31/12/20, 22:15:04] Ben: notes.pdf • ‎3 pages ‎document omitted",
+        "[31/12/20, 22:15:05] Ana: the image omitted from the report",
+        "[31/12/20, 22:15:06] Ben: <Media omitted>",
+    ]
+    df = preprocessor.preprocess("\n".join(lines))
+    assert df["is_media"].tolist() == [True, True, True, True, False, False]
+    assert preprocessor.media_mask(df.drop(columns="is_media")).tolist() == [True] * 4 + [False, True]
+
+
+def test_android_media_placeholder():
+    lines = _android([1, 2, 13])
+    lines[1] = lines[1].replace("message 1", "<Media omitted>")
+    lines[2] = lines[2].replace("message 2", "‎image omitted")
+    assert preprocessor.preprocess("\n".join(lines))["is_media"].tolist() == [False, True, False]
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import chat_viewer
+
+
+def _chat(shuffle=False):
+    rng = np.random.default_rng(3)
+    size = 500
+    dates = pd.date_range("2023-01-01", periods=size, freq="37min")
+    df = pd.DataFrame({
+        "date": dates,
+        "user": rng.choice(["Ana", "Ben", "Chloé"], size),
+        "message": [f"Message {i} about {'Pizza' if i % 5 == 0 else 'work'}" for i in range(size)],
+    })
+    df.loc[7, "message"] = None
+    if shuffle:  # exports can have out-of-order timestamps
+        df = df.sample(frac=1, random_state=1).reset_index(drop=True)
+    return df
+
+
+def _expected(df, user=None, start=None, end=None, query=None):
+    mask = np.ones(len(df), dtype=bool)
+    if user is not None:
+        mask &= (df["user"] == user).to_numpy()
+    if start is not None:
+        mask &= (df["date"] >= start).to_numpy()
+    if end is not None:
+        mask &= (df["date"] < end).to_numpy()
+    if query is not None:
+        mask &= df["message"].fillna("").str.contains(query, case=False, regex=False).to_numpy()
+    return np.flatnonzero(mask).tolist()
+
+
+FILTERS = [
+    {},
+    {"user": "Ana"},
+    {"start": pd.Timestamp("2023-01-03"), "end": pd.Timestamp("2023-01-05")},
+    {"user": "Ben", "start": pd.Timestamp("2023-01-02")},
+    {"query": "pizza"},
+    {"user": "Chloé", "end": pd.Timestamp("2023-01-06"), "query": "PIZZA"},
+    {"user": "nobody"},
+]
+
+
+@pytest.mark.parametrize("shuffle", [False, True])
+@pytest.mark.parametrize("filters", FILTERS)
+def test_filter_matches_a_pandas_mask(shuffle, filters):
+    df = _chat(shuffle)
+    view = chat_viewer.ChatView(df)
+    rows = view.filter(**filters)
+    assert list(rows) == _expected(df, **filters)
+    assert view.filter(**filters) is rows  # remembered
+
+
+def test_unfiltered_and_date_filters_need_no_arrays():
+    view = chat_viewer.ChatView(_chat())
+    assert isinstance(view.filter(), range)
+    assert isinstance(view.filter(start=pd.Timestamp("2023-01-03")), range)
+
+
+def test_regex_filter_and_invalid_pattern():
+    df = _chat()
+    view = chat_viewer.ChatView(df)
+    assert list(view.filter(query=r"message 1\d about", regex=True)) == list(range(10, 20))
+    with pytest.raises(ValueError, match="invalid regular expression"):
+        view.filter(query="(", regex=True)
+
+
+def test_page():
+    df = _chat()
+    view = chat_viewer.ChatView(df)
+    rows = view.filter(user="Ana")
+    page = view.page(rows, 1, size=50)
+    assert page.index.tolist() == list(rows)[50:100]
+    assert view.page(rows, 99, size=50).empty
+    assert chat_viewer.page_count(rows, 50) == -(-len(rows) // 50)
+    assert chat_viewer.page_count(range(0), 50) == 1
+
+
+def test_cached_arrays_stay_within_the_byte_budget(monkeypatch):
+    monkeypatch.setattr(chat_viewer, "MAX_FILTER_BYTES", 1_000)
+    df = _chat()
+    view = chat_viewer.ChatView(df)
+    for word in ("message", "about", "work", "pizza", "1", "2"):
+        view.filter(query=word)
+    held = sum(size for _, size in view._filters.values())
+    assert held <= 1_000 or len(view._filters) == 1
+
+
+def test_get_view_is_built_once_per_frame():
+    df = _chat()
+    assert chat_viewer.get_view(df) is chat_viewer.get_view(df)
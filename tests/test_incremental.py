@@ -0,0 +1,82 @@
+import io
+
+import pandas as pd
+
+import chat_formats
+import incremental
+import preprocessor
+import synth_chat
+
+
+def _lines(count, day_first=True):
+    """Android lines "date, HH:MM - User n: message number i", one per minute from 1 January 2023."""
+    lines = []
+    for i in range(count):
+        when = pd.Timestamp("2023-01-01") + pd.Timedelta(minutes=i)
+        date = when.strftime("%d/%m/%y" if day_first else "%m/%d/%y")
+        lines.append(f"{date}, {when:%H:%M} - User {i % 4}: message number {i}\n")
+    return lines
+
+
+def test_scan_upload_finds_the_longest_stored_prefix():
+    data = synth_chat.generate_text(300, seed=1).encode("utf-8")
+    first, second = data[:1000], data[:5000]
+    candidates = [(incremental.scan_upload(part, [])[0], len(part)) for part in (first, second)]
+    candidates.append(("0" * 64, 2000))  # same size range, different content
+    for source in (data, io.BytesIO(data)):
+        full_hash, size, match = incremental.scan_upload(source, candidates)
+        assert size == len(data)
+        assert match == candidates[1]
+        assert full_hash == incremental.scan_upload(data, [])[0]
+
+
+def test_scan_upload_identical_upload_is_not_an_extension():
+    data = synth_chat.generate_text(100, seed=2).encode("utf-8")
+    full_hash, size, _ = incremental.scan_upload(data, [])
+    assert incremental.scan_upload(data, [(full_hash, size)])[2] is None
+
+
+def test_extension_only_parses_the_tail(tmp_path):
+    text = synth_chat.generate_text(2000, seed=3)
+    lines = text.splitlines(keepends=True)
+    header = chat_formats.sniff_format(lines).header
+    cut = next(i for i in range(1500, len(lines)) if header.match(lines[i]))  # the old export ends before a message
+    old, new = "".join(lines[:cut]).encode("utf-8"), text.encode("utf-8")
+
+    old_df, _, mode = incremental.load_or_parse(old, cache_dir=str(tmp_path))
+    assert mode == "parsed"
+    assert incremental.load_or_parse(old, cache_dir=str(tmp_path))[2] == "hit"
+
+    df, state, mode = incremental.load_or_parse(new, cache_dir=str(tmp_path))
+    expected = preprocessor.preprocess(new)
+    assert mode == "extended"
+    assert state.new_rows == len(expected) - len(old_df) > 0
+    assert len(df) == len(expected) == state.rows
+    assert df["message"].tolist() == expected["message"].tolist()
+    assert (df["date"].to_numpy() == expected["date"].to_numpy()).all()
+    assert state.aggregates.num_messages == len(expected)
+
+
+def test_tail_starting_mid_message_parses_everything(tmp_path):
+    lines = _lines(50)
+    lines.insert(30, "a second line of message 29\n")
+    old = "".join(lines[:30]).encode("utf-8")  # the old export ends before the continuation line
+    incremental.load_or_parse(old, cache_dir=str(tmp_path))
+    df, _, mode = incremental.load_or_parse("".join(lines).encode("utf-8"), cache_dir=str(tmp_path))
+    assert mode == "parsed"
+    assert df["message"].iloc[29] == "message number 29 a second line of message 29"
+
+
+def test_day_above_12_in_the_tail_reparses_the_chat(tmp_path):
+    # The old export only has days 1-12, so it was read month-first; the tail proves it is day-first
+    lines = _lines(13 * 24 * 60, day_first=True)[::60]  # hourly, up to 13 January
+    cut = 12 * 24
+    old = "".join(lines[:cut]).encode("utf-8")
+    df, state, _ = incremental.load_or_parse(old, cache_dir=str(tmp_path))
+    assert state.chat_format[2].startswith("%m/%d/")
+
+    df, state, mode = incremental.load_or_parse("".join(lines).encode("utf-8"), cache_dir=str(tmp_path))
+    assert mode == "parsed"
+    assert state.chat_format[2].startswith("%d/%m/")
+    assert (df["date"].dt.month == 1).all()
+    assert df["date"].dt.day.max() == 13
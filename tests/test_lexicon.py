@@ -0,0 +1,43 @@
+import numpy as np
+
+import lexicon
+
+
+def _matcher():
+    return lexicon.LexiconMatcher(["idiot", "stupid", "hate", "hate you", "dumb"])
+
+
+def test_scan_counts_hits_per_message():
+    messages = ["you idiot", "I hate you, stupid", "nothing here", "", "IDIOT! Idiot?", "hateful idiots"]
+    assert _matcher().scan(messages).tolist() == [1, 2, 0, 0, 2, 0]  # whole words only
+
+
+def test_scan_offsets_point_into_each_message():
+    messages = ["fine", "so Stupid and dumb", "I hate you"]
+    counts, offsets = _matcher().scan(messages, with_offsets=True)
+    assert counts.tolist() == [0, 2, 1]
+    assert offsets[0] == []
+    assert offsets[1] == [(3, 9, "stupid"), (14, 18, "dumb")]
+    assert offsets[2] == [(2, 10, "hate you")]  # the longest term wins
+    for message, hits in zip(messages, offsets):
+        assert all(message[start:end].casefold() == term for start, end, term in hits)
+
+
+def test_scan_matches_find_across_batches(monkeypatch):
+    monkeypatch.setattr(lexicon, "SCAN_BATCH", 3)
+    messages = [f"message {i} {'dumb' if i % 4 == 0 else 'fine'} İstanbul idiot" for i in range(10)]
+    counts, offsets = _matcher().scan(messages, with_offsets=True)
+    matcher = _matcher()
+    assert offsets == [matcher.find(message) for message in messages]
+    assert counts.tolist() == [len(hits) for hits in offsets]
+
+
+def test_scan_accepts_non_strings():
+    assert _matcher().scan([None, 3, "dumb"]).tolist() == [0, 0, 1]
+    assert isinstance(_matcher().scan([]), np.ndarray)
+
+
+def test_bundled_lexicon_loads():
+    matcher = lexicon.get_matcher()
+    assert matcher.terms
+    assert matcher.scan([f"you {matcher.terms[0]}"]).tolist() == [1]
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+import llm_client
+import llm_stub
+
+LABELS = ("hate", "offensive")
+
+
+def _numbered(prompt):
+    """(id, line) pairs of the "<id>\t<line>" rows in a classify_lines prompt."""
+    rows = [line.split("\t", 1) for line in prompt.split("\n") if "\t" in line]
+    return [(int(number), text) for number, text in rows if number.isdigit()]
+
+
+def _flag_bad(prompt, model):
+    ids = [number for number, text in _numbered(prompt) if "bad" in text]
+    return json.dumps({"flagged": [{"id": number, "label": "hate", "score": 0.9} for number in ids]})
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Starts the Gemini stub; tests set `state.reply`. Yields (state, base url)."""
+    server, state, base_url = llm_stub.start()
+    monkeypatch.setattr(llm_client, "rate_limiter", llm_client.TokenBucket(1e9, 1e9))
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE", 0.0)
+    yield state, base_url
+    server.shutdown()
+
+
+def _classify(base_url, lines, **options):
+    return llm_client.classify_lines(lines, lambda numbered: f"Flag hateful lines.\n{numbered}", LABELS,
+                                     api_base=base_url, use_cache=False, **options)
+
+
+def test_parse_flags_accepts_valid_and_fenced_json():
+    text = '{"flagged": [{"id": 2, "label": "hate", "score": 0.8}, {"id": "3", "label": "offensive"}]}'
+    expected = {2: ("hate", 0.8), 3: ("offensive", 1.0)}
+    assert llm_client.parse_flags(text, range(1, 4), LABELS) == expected
+    assert llm_client.parse_flags(f"```json\n{text}\n```", range(1, 4), LABELS) == expected
+    assert llm_client.parse_flags('{"flagged": []}', range(1, 4), LABELS) == {}
+
+
+@pytest.mark.parametrize("text", [
+    "Message 2 is hate speech",                                   # not JSON
+    '{"flagged": [{"id": 2, "label": "hate"}',                     # truncated JSON
+    '[{"id": 2, "label": "hate"}]',                                # not the expected object
+    '{"flagged": "2"}',
+    '{"flagged": [2]}',
+    '{"flagged": [{"id": 4, "label": "hate"}]}',                   # id out of range
+    '{"flagged": [{"id": 0, "label": "hate"}]}',
+    '{"flagged": [{"id": 2, "label": "spam"}]}',                   # unknown label
+    '{"flagged": [{"id": 2, "label": "hate", "score": 1.5}]}',     # score out of [0, 1]
+    '{"flagged": [{"id": 2, "label": "hate", "score": true}]}',
+])
+def test_parse_flags_rejects_invalid_responses(text):
+    with pytest.raises(llm_client.InvalidResponse):
+        llm_client.parse_flags(text, range(1, 4), LABELS)
+
+
+def test_multi_chunk_ids_map_back_to_line_indexes(stub):
+    state, base_url = stub
+    state.reply = _flag_bad
+    lines = [f"User {i}: {'bad' if i % 7 == 3 else 'fine'} message number {i} " + "padding " * 10 for i in range(60)]
+    flags = _classify(base_url, lines, max_tokens=200)
+    assert len(state.requests) > 3  # really split into several chunks
+    assert flags == {i: ("hate", 0.9) for i in range(60) if i % 7 == 3}
+
+
+def _replies(*texts):
+    """A stub reply answering each prompt with `texts` in turn, then with _flag_bad."""
+    seen = {}
+
+    def reply(prompt, model):
+        count = seen[prompt] = seen.get(prompt, 0) + 1
+        return texts[count - 1] if count <= len(texts) else _flag_bad(prompt, model)
+
+    return reply
+
+
+@pytest.mark.parametrize("invalid", [
+    "not json at all",
+    '{"flagged": [{"id": 99, "label": "hate", "score": 0.9}]}',      # out-of-range id
+    '{"flagged": [{"id": 1, "label": "spam", "score": 0.9}]}',       # unknown label
+])
+def test_invalid_response_is_asked_again(stub, invalid):
+    state, base_url = stub
+    state.reply = _replies(invalid)
+    before = llm_client.stats["reasks"]
+    flags = _classify(base_url, ["User: a bad line", "User: a fine line"])
+    assert flags == {0: ("hate", 0.9)}
+    assert len(state.requests) == 2
+    assert llm_client.stats["reasks"] == before + 1
+
+
+def test_gives_up_after_the_reask_budget(stub):
+    state, base_url = stub
+    state.reply = "Line 1 looks hateful."
+    with pytest.raises(llm_client.LLMError, match="after 3 attempts"):
+        _classify(base_url, ["User: a bad line"], reasks=2)
+    assert len(state.requests) == 3
+
+
+def test_only_transient_errors_are_retried():
+    class APIError(Exception):
+        def __init__(self, code):
+            self.code = code
+
+    assert llm_client.is_transient(APIError(429))
+    assert llm_client.is_transient(APIError(503))
+    assert llm_client.is_transient(TimeoutError())
+    assert not llm_client.is_transient(APIError(400))
+    assert not llm_client.is_transient(ValueError("bad prompt"))
+
+
+def test_free_text_hate_speech_keeps_every_flag(stub, monkeypatch):
+    import pandas as pd
+
+    import hate_speech
+    import llm_cache
+
+    state, base_url = stub
+    state.reply = lambda prompt, model: "\n".join(line for line in prompt.split("\n") if "bad" in line)
+    monkeypatch.setattr(llm_client, "STRUCTURED", False)
+    monkeypatch.setattr(llm_client, "API_BASE", base_url)
+    monkeypatch.setattr(llm_cache, "ENABLED", False)
+    monkeypatch.setattr(hate_speech, "LEXICON_MIN_HITS", 0)
+    df = pd.DataFrame({"user": [f"User {i}" for i in range(20)],
+                       "message": [f"{'bad' if i % 2 else 'good'} words {i}" for i in range(20)]})
+    status, flags = hate_speech.detect_hate_speech(df, engine="llm")
+    assert status == "🚨 Hate Speech Detected"
+    assert flags == [(f"User {i}", f"bad words {i}") for i in range(1, 20, 2)]  # all 10, not the first 5
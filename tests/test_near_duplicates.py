@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+import near_duplicates
+
+FORWARD = "Forwarded: the government will give every citizen free internet data for three months, share now"
+
+
+def test_edited_forwards_share_a_cluster():
+    messages = pd.Series([
+        FORWARD,
+        "ok",
+        FORWARD.upper() + "!!!",                          # normalization: case and punctuation
+        FORWARD.replace("three months", "three months!!") + " please",  # a light edit
+        "A completely different long message about the football match on Sunday evening",
+        "ok",
+        "Ok!",
+    ])
+    clusters = near_duplicates.find_clusters(messages)
+    codes = clusters.codes.tolist()
+    assert codes[0] == codes[2] == codes[3]
+    assert codes[1] == codes[5] == codes[6]           # short texts group only when identical after normalization
+    assert len({codes[0], codes[1], codes[4]}) == 3
+    assert codes[0] == 0 and codes[1] == 1 and codes[4] == 2  # numbered in order of appearance
+    assert clusters.representatives.tolist() == [0, 1, 4]
+    assert clusters.sizes.tolist() == [3, 3, 1]
+    assert clusters.long_clusters.tolist() == [True, False, True]
+
+
+def test_short_texts_are_not_merged_by_similarity():
+    clusters = near_duplicates.find_clusters(pd.Series(["good morning all", "good morning al"]))
+    assert len(clusters) == 2
+
+
+def test_lsh_groups_joins_only_similar_signatures():
+    rng = np.random.default_rng(0)
+    words = [f"word{i}" for i in range(200)]
+    base = " ".join(rng.choice(words, 60))
+    texts = [base, base + " extra", " ".join(rng.choice(words, 60)), " ".join(rng.choice(words, 60))]
+    labels = near_duplicates.lsh_groups(near_duplicates.signatures(texts))
+    assert labels[0] == labels[1]
+    assert len({labels[0], labels[2], labels[3]}) == 3
+
+
+def test_lsh_groups_is_transitive():
+    # a ~ b and b ~ c are linked even if a and c are further apart
+    words = " ".join(f"token{i}" for i in range(80))
+    a, b, c = words, words + " tail1 tail2", words + " tail1 tail2 tail3 tail4"
+    labels = near_duplicates.lsh_groups(near_duplicates.signatures([a, b, c, "unrelated text " * 5]))
+    assert labels[0] == labels[1] == labels[2] != labels[3]
+
+
+def test_agreement_estimates_jaccard():
+    texts = [FORWARD, FORWARD, "something else entirely, nothing like the forward at all"]
+    sigs = near_duplicates.signatures(texts)
+    assert near_duplicates.agreement(sigs[0], sigs[1]) == 1.0
+    assert near_duplicates.agreement(sigs[0], sigs[2]) < near_duplicates.SIMILARITY
+
+
+def _forwards_chat(prefix, start):
+    texts = [f"{prefix} forward number {i}: " + " ".join(f"{prefix}{i}x{j}" for j in range(12)) for i in range(5)]
+    messages = texts * 2 + ["ok"]
+    return pd.DataFrame({
+        "date": pd.date_range(start, periods=len(messages), freq="h"),
+        "user": [f"User {i % 3}" for i in range(len(messages))],
+        "message": messages,
+    })
+
+
+def test_forward_stats_only_reads_the_store(tmp_path):
+    path = str(tmp_path / "forwards.sqlite")
+    df = _forwards_chat("old", "2023-01-01")
+    table = near_duplicates.forward_stats(df, store_path=path)
+    assert not (tmp_path / "forwards.sqlite").exists()
+    assert len(table) == 5 and not table["seen_before"].any()
+
+    clusters = near_duplicates.find_clusters(df["message"])
+    near_duplicates.link_clusters(clusters, near_duplicates.cluster_table(df, clusters), path)
+    later = _forwards_chat("old", "2023-06-01")
+    with open(path, "rb") as f:
+        before = f.read()
+    table = near_duplicates.forward_stats(later, store_path=path)
+    with open(path, "rb") as f:
+        assert f.read() == before
+    assert table["seen_before"].all()
+    assert (table["first_seen"] < pd.Timestamp("2023-06-01")).all()
+    assert b"forward number" not in before  # signatures only, no message text
+
+
+def test_store_keeps_at_most_max_forwards(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "forwards.sqlite")
+    for prefix in ("first", "second", "third"):
+        df = _forwards_chat(prefix, "2023-01-01")
+        clusters = near_duplicates.find_clusters(df["message"])
+        near_duplicates.link_clusters(clusters, near_duplicates.cluster_table(df, clusters), path, max_forwards=8)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM clusters").fetchone()[0] == 8
+    assert conn.execute("SELECT COUNT(*) FROM bands WHERE cluster NOT IN (SELECT id FROM clusters)").fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,65 @@
+import io
+
+import chat_cache
+import result_cache
+
+
+def test_get_or_compute_runs_once_per_upload_analysis_and_params():
+    store, calls = {}, []
+
+    def compute(**params):
+        calls.append(params)
+        return len(calls)
+
+    assert result_cache.get_or_compute(store, "upload", "words", compute, user="Ana") == (1, False)
+    assert result_cache.get_or_compute(store, "upload", "words", compute, user="Ana") == (1, True)
+    assert result_cache.get_or_compute(store, "upload", "words", compute, user="Ben") == (2, False)
+    assert result_cache.get_or_compute(store, "upload", "emoji", compute, user="Ana") == (3, False)
+    assert result_cache.get_or_compute(store, "other", "words", compute, user="Ana") == (4, False)
+    assert calls == [{"user": "Ana"}, {"user": "Ben"}, {"user": "Ana"}, {"user": "Ana"}]
+    assert result_cache.cache_stats(store) == {"hits": 1, "misses": 4}
+
+
+def test_parameter_order_does_not_matter():
+    store = {}
+    result_cache.get_or_compute(store, "upload", "chatbot", lambda **_: "answer", query="q", user=None)
+    assert result_cache.get_or_compute(store, "upload", "chatbot", lambda **_: "again", user=None, query="q") == \
+        ("answer", True)
+
+
+def test_a_failing_compute_is_not_cached():
+    store = {}
+
+    def fail(**_):
+        raise RuntimeError("LLM down")
+
+    try:
+        result_cache.get_or_compute(store, "upload", "summary", fail)
+    except RuntimeError:
+        pass
+    assert result_cache.get_or_compute(store, "upload", "summary", lambda: "summary") == ("summary", False)
+
+
+def test_put_get_discard_and_forget_other_uploads():
+    store = {}
+    result_cache.put(store, "old", "stats", 1)
+    result_cache.put(store, "new", "stats", 2, user="Ana")
+    assert result_cache.get(store, "new", "stats", user="Ana") == 2
+    assert result_cache.get(store, "new", "stats") is None
+
+    result_cache.forget_other_uploads(store, "new")
+    assert result_cache.get(store, "old", "stats") is None
+    result_cache.discard(store, "new", "stats", user="Ana")
+    assert result_cache.get(store, "new", "stats", user="Ana") is None
+
+
+def test_upload_key_hashes_each_upload_once(monkeypatch):
+    calls = []
+    real_hash = chat_cache.hash_upload
+    monkeypatch.setattr(chat_cache, "hash_upload", lambda source: calls.append(source) or real_hash(source))
+    upload = io.BytesIO(b"12/31/20, 10:15 PM - Ana: hi\n")
+    upload.file_id = "file-1"
+    store = {}
+    key = result_cache.upload_key(store, upload)
+    assert result_cache.upload_key(store, upload) == key == real_hash(upload)
+    assert len(calls) == 1
@@ -0,0 +1,41 @@
+import pandas as pd
+
+import retrieval
+
+
+def _chat(count, start="2023-01-01"):
+    dates = pd.date_range(start, periods=count, freq="6h")
+    return pd.DataFrame({
+        "date": dates,
+        "user": [f"User {i % 3}" for i in range(count)],
+        "message": [f"message {i} about {'pizza' if i % 2 else 'football'}" for i in range(count)],
+    })
+
+
+def test_date_filter_end_is_exclusive():
+    index = retrieval.ChatIndex().add(_chat(8))  # 00:00, 06:00, 12:00, 18:00 on 1 and 2 January
+    lines = index.recent(100, start=pd.Timestamp("2023-01-01"), end=pd.Timestamp("2023-01-02"))
+    assert lines == [f"User {i % 3}: message {i} about {'pizza' if i % 2 else 'football'}" for i in range(4)]
+    assert sorted(doc for doc, _ in index.search("pizza", end=pd.Timestamp("2023-01-02"))) == [1, 3]
+
+
+def test_user_filter():
+    index = retrieval.ChatIndex().add(_chat(9))
+    assert sorted(doc for doc, _ in index.search("message", user="User 1")) == [1, 4, 7]
+    assert index.search("message", user="nobody") == []
+
+
+def test_extended_upload_takes_over_the_parent_index():
+    old, new = _chat(40), _chat(50)
+    parent = retrieval.get_index(old, key="parent-key")
+    index = retrieval.get_index(new, key="child-key", parent="parent-key")
+    assert index is parent  # only the 10 new rows were added
+    assert len(index) == 50
+    assert index.search("pizza")[:5] == retrieval.ChatIndex().add(new).search("pizza")[:5]
+    assert retrieval.get_index(new, key="child-key") is index
+
+
+def test_unrelated_parent_index_is_rebuilt():
+    retrieval.get_index(_chat(60), key="longer-key")
+    index = retrieval.get_index(_chat(20), key="shorter-key", parent="longer-key")
+    assert len(index) == 20
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import rollup
+
+
+@pytest.fixture(scope="module")
+def chat():
+    rng = np.random.default_rng(7)
+    size = 3_000
+    dates = pd.Timestamp("2022-11-01") + pd.to_timedelta(np.sort(rng.integers(0, 500 * 24 * 3600, size)), unit="s")
+    words = rng.integers(1, 12, size)
+    return pd.DataFrame({
+        "date": dates,
+        "user": rng.choice(["Ana", "Ben", "Chloé"], size),
+        "message": [" ".join(["w"] * n) for n in words],
+    })
+
+
+def _expected(df, by, user=None, year=None):
+    rows = df
+    if user is not None:
+        rows = rows[rows["user"] == user]
+    if year is not None:
+        rows = rows[rows["date"].dt.year == year]
+    return rows.groupby(by).size()
+
+
+@pytest.mark.parametrize("user", [None, "Ana", "Chloé"])
+@pytest.mark.parametrize("year", [None, 2022, 2023, 2024])
+def test_hourly_and_month_of_year(chat, user, year):
+    cube = rollup.build_rollup(chat)
+    hourly = _expected(chat, chat["date"].dt.hour, user, year).reindex(range(24), fill_value=0)
+    assert cube.hourly(user, year).tolist() == hourly.tolist()
+    months = _expected(chat, chat["date"].dt.month, user, year).reindex(range(1, 13), fill_value=0)
+    assert cube.month_of_year(user, year).tolist() == months.tolist()
+
+
+@pytest.mark.parametrize("user", [None, "Ben"])
+def test_heatmap(chat, user):
+    cube = rollup.build_rollup(chat)
+    expected = _expected(chat, [chat["date"].dt.weekday, chat["date"].dt.hour], user).unstack(fill_value=0)
+    expected = expected.reindex(index=range(7), columns=range(24), fill_value=0)
+    assert (cube.heatmap(user) == expected.to_numpy()).all()
+
+
+def test_timeline_and_words(chat):
+    cube = rollup.build_rollup(chat)
+    per_month = chat.groupby(chat["date"].dt.to_period("M")).size()
+    per_month = per_month.reindex(pd.period_range(per_month.index.min(), per_month.index.max(), freq="M"), fill_value=0)
+    assert cube.timeline() == [(period.strftime("%b %Y"), int(count)) for period, count in per_month.items()]
+    word_counts = chat["message"].str.split().str.len()
+    assert cube.heatmap(layer="words").sum() == word_counts.sum()
+
+
+def test_mean_sentiment(chat):
+    scores = np.linspace(-1, 1, len(chat))
+    cube = rollup.build_rollup(chat).add_sentiment(scores)
+    expected = pd.Series(scores).groupby(chat["date"].dt.to_period("M").to_numpy()).mean()
+    got = dict(cube.mean_sentiment())
+    for period, mean in expected.items():
+        assert got[period.strftime("%b %Y")] == pytest.approx(mean)
+
+
+def test_merge_equals_a_full_build(chat):
+    head, tail = chat.iloc[:2_000], chat.iloc[2_000:]
+    merged = rollup.build_rollup(head).merge(rollup.build_rollup(tail))
+    full = rollup.build_rollup(chat)
+    for user in (None, "Ana", "Ben", "Chloé"):
+        assert (merged.heatmap(user) == full.heatmap(user)).all()
+        assert merged.timeline(user) == full.timeline(user)
+
+
+def test_unknown_user_and_empty_chat(chat):
+    assert rollup.build_rollup(chat).hourly("nobody").tolist() == [0] * 24
+    cube = rollup.build_rollup(pd.DataFrame({"date": pd.to_datetime([]), "user": [], "message": []}))
+    assert cube.hourly().tolist() == [0] * 24
+    assert cube.month_of_year().tolist() == [0] * 12
+    assert cube.timeline() == []
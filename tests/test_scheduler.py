@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+import scheduler
+from scheduler import AnalysisScheduler, Stage, StageSkipped
+
+
+def _run(stages, inputs=None, **options):
+    return {result.name: result for result in AnalysisScheduler(stages, **options).run(inputs or {"df": 1})}
+
+
+def test_stages_run_after_their_inputs():
+    order = []
+
+    def step(name, value):
+        order.append(name)
+        return value
+
+    results = _run([
+        Stage("total", lambda a, b: step("total", a + b), inputs=("double", "triple")),
+        Stage("double", lambda df: step("double", df * 2)),
+        Stage("triple", lambda df: step("triple", df * 3)),
+    ], {"df": 5})
+    assert results["total"].value == 25
+    assert order.index("total") > max(order.index("double"), order.index("triple"))
+
+
+def test_stage_with_a_failed_input_is_skipped():
+    ran = []
+
+    def boom(df):
+        raise ValueError("boom")
+
+    results = _run([
+        Stage("broken", boom),
+        Stage("after", lambda value: ran.append(value), inputs=("broken",)),
+        Stage("after_after", lambda value: ran.append(value), inputs=("after",)),
+        Stage("independent", lambda df: "ok"),
+    ])
+    assert isinstance(results["broken"].error, ValueError)
+    assert isinstance(results["after"].error, StageSkipped)
+    assert isinstance(results["after_after"].error, StageSkipped)
+    assert results["independent"].value == "ok"
+    assert ran == []
+
+
+def test_missing_input_is_skipped():
+    results = _run([Stage("orphan", lambda x: x, inputs=("nothing",))])
+    assert isinstance(results["orphan"].error, StageSkipped)
+
+
+def test_lock_queued_stage_does_not_time_out_while_waiting():
+    # Both stages take 0.6 s and share a lock; each has a 1 s timeout, which
+    # the second would exceed if its clock started while it waited for the lock
+    def slow(df):
+        time.sleep(0.6)
+        return "done"
+
+    results = _run([Stage("first", slow, timeout=1, lock="plot"), Stage("second", slow, timeout=1, lock="plot")])
+    assert results["first"].ok and results["second"].ok
+    assert results["first"].elapsed < 1 and results["second"].elapsed < 1
+
+
+def test_running_stage_times_out():
+    release = threading.Event()
+    results = _run([Stage("stuck", lambda df: release.wait(5), timeout=0.3)])
+    release.set()
+    assert isinstance(results["stuck"].error, TimeoutError)
+
+
+def test_cancel_stops_a_running_stage():
+    started, stopped = threading.Event(), threading.Event()
+
+    def long_stage(df):
+        started.set()
+        deadline = time.monotonic() + 5
+        try:
+            while time.monotonic() < deadline:
+                scheduler.raise_if_cancelled()
+                time.sleep(0.01)
+        except StageSkipped:
+            stopped.set()
+            raise
+        return "finished"
+
+    run = AnalysisScheduler([Stage("long", long_stage)])
+    results = run.run({"df": 1})
+    threading.Thread(target=lambda: (started.wait(5), run.cancel())).start()
+    result = next(results)
+    assert isinstance(result.error, StageSkipped)
+    assert stopped.wait(2)  # the thread itself stopped at its next check, not just the report
+
+
+def test_raise_if_cancelled_outside_a_stage_does_nothing():
+    scheduler.raise_if_cancelled()
+
+
+def test_timed_out_stage_is_told_to_stop():
+    stopped = threading.Event()
+
+    def stage(df):
+        with pytest.raises(StageSkipped):
+            for _ in range(500):
+                scheduler.raise_if_cancelled()
+                time.sleep(0.01)
+        stopped.set()
+
+    results = _run([Stage("slow", stage, timeout=0.2)])
+    assert isinstance(results["slow"].error, TimeoutError)
+    assert stopped.wait(2)